@@ -17,13 +17,15 @@ django.setup()
 from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
+from sudoku_api.affinity import RoomRelayMiddleware
 from sudoku_api.routing import websocket_urlpatterns
 
-application = ProtocolTypeRouter({
+# the relay of broadcasts to room owners runs from the first connection on
+application = RoomRelayMiddleware(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
+}))
@@ -73,11 +73,95 @@ CORS_ALLOWED_ORIGINS = [
 ]
 # Channels configuration
 ASGI_APPLICATION = "backend.asgi.application"
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
+# Channel layer. The in-memory layer only reaches consumers in the same
+# process, so all players must share one worker. Set REDIS_URL (or
+# REDIS_HOSTS, a comma separated list of URLs to shard across several Redis
+# servers) to run several workers.
+REDIS_HOSTS = [
+    host.strip()
+    for host in os.environ.get('REDIS_HOSTS', os.environ.get('REDIS_URL', '')).split(',')
+    if host.strip()
+]
+
+if REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_HOSTS,
+                "prefix": os.environ.get('CHANNEL_LAYER_PREFIX', 'sudoku'),
+                # messages queued per channel before group_send drops them
+                "capacity": int(os.environ.get('CHANNEL_LAYER_CAPACITY', '1000')),
+                # seconds an undelivered message is kept
+                "expiry": int(os.environ.get('CHANNEL_LAYER_EXPIRY', '60')),
+                # seconds a channel stays in a group, must outlive a game session
+                "group_expiry": int(os.environ.get('CHANNEL_LAYER_GROUP_EXPIRY', '86400')),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# Room affinity: pin every game room to one WebSocket worker. WORKER_NODES
+# lists the workers as id=url pairs ("w1=wss://ws1.example.com,w2=..."), or
+# WORKER_NODES_FILE names a file with the same pairs that is re-read while
+# running. WORKER_ID is this worker's id. Needs the Redis channel layer.
+WORKER_ID = os.environ.get('WORKER_ID', '')
+WORKER_NODES = os.environ.get('WORKER_NODES', '')
+WORKER_NODES_FILE = os.environ.get('WORKER_NODES_FILE', '')
+WORKER_NODES_RELOAD_SECONDS = int(os.environ.get('WORKER_NODES_RELOAD_SECONDS', '10'))
+
+# Seconds the channel layer round-trip check (manage.py check --deploy) waits
+CHANNEL_LAYER_CHECK_TIMEOUT = 5
+
+# Outbound WebSocket batching: events sent to a client within this window (ms)
+# are combined into a single "batch" frame. 0 disables batching.
+WS_BATCH_WINDOW_MS = int(os.environ.get('WS_BATCH_WINDOW_MS', '0'))
+
+# Shared WebSocket heartbeat: ping every connection once per interval and
+# close connections that sent nothing for the timeout
+HEARTBEAT_INTERVAL_SECONDS = int(os.environ.get('HEARTBEAT_INTERVAL_SECONDS', '30'))
+HEARTBEAT_TIMEOUT_SECONDS = int(os.environ.get('HEARTBEAT_TIMEOUT_SECONDS', '90'))
+HEARTBEAT_WHEEL_SLOTS = 30
+
+# Inbound WebSocket limits per connection: message type -> (messages per
+# second, burst). Clients that overflow the inbound queue are disconnected.
+WS_RATE_LIMITS = {
+    'move': (10, 20),
+    'cell_focus': (20, 40),
+    'quick_chat': (1, 5),
+    'request_hint': (1, 3),
+    'request_player_list': (2, 5),
 }
+WS_RATE_LIMIT_DEFAULT = (5, 10)
+WS_INBOUND_QUEUE_SIZE = int(os.environ.get('WS_INBOUND_QUEUE_SIZE', '64'))
+
+# Read-only spectators (ws/game/<id>/spectate/) get at most one board
+# snapshot per interval instead of the room's event stream
+SPECTATOR_SNAPSHOT_INTERVAL_MS = int(os.environ.get('SPECTATOR_SNAPSHOT_INTERVAL_MS', '1000'))
+
+# Lobby sockets (ws/lobby/) get the changes of each tick as one frame
+LOBBY_TICK_MS = int(os.environ.get('LOBBY_TICK_MS', '1000'))
+
+# find_by_room_name answers cached per process for this many seconds (0 = off)
+ROOM_NAME_CACHE_SECONDS = int(os.environ.get('ROOM_NAME_CACHE_SECONDS', '0'))
+ROOM_NAME_CACHE_SIZE = 10000
+
+# an incomplete game is deleted this long after its last socket disconnected (0 = off)
+ROOM_EXPIRY_SECONDS = int(os.environ.get('ROOM_EXPIRY_SECONDS', '3600'))
+# reconciliation sweep for games the expiry timers missed, run by scheduler.py
+ROOM_SWEEP_INTERVAL_SECONDS = int(os.environ.get('ROOM_SWEEP_INTERVAL_SECONDS', '21600'))
+ROOM_SWEEP_INACTIVE_HOURS = int(os.environ.get('ROOM_SWEEP_INACTIVE_HOURS', '24'))
+# completed games move to the compressed archive this many days after completion
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '7'))
+
+# Recent broadcasts kept per room so reconnecting clients can resume
+ROOM_EVENT_LOG_SIZE = int(os.environ.get('ROOM_EVENT_LOG_SIZE', '256'))
+ROOM_EVENT_LOG_MAX_ROOMS = int(os.environ.get('ROOM_EVENT_LOG_MAX_ROOMS', '10000'))
 
 # Frontend URL for QR code generation
 FRONTEND_URL = os.environ.get('FRONTEND_URL')  # Change in production
@@ -113,6 +197,27 @@ DATABASES = {
 }
 DATABASES['default']['CONN_MAX_AGE'] = 600
 
+# Threads reserved for synchronous database work in WebSocket consumers
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', '8'))
+
+# Connection pooling (PostgreSQL only, needs psycopg 3 with psycopg_pool).
+# max_size should cover DB_EXECUTOR_WORKERS, the async ORM thread and the
+# HTTP request threads of one worker process.
+if os.environ.get('DB_POOL') and DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    # pooled connections are handed back after every use instead of persisting
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    # validate connections when they are checked out of the pool
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '12')),
+        # seconds to wait for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+        'name': 'sudoku',
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -158,8 +263,11 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 CRONJOBS = [
-    # Run the cleanup job every day at 3:00 AM
-    ('* */1 * * *', 'django.core.management.call_command', ['cleanup_inactive_games', '--hours=1']),
+    # Run the reconciliation sweep every day at 3:00 AM, abandoned rooms
+    # normally expire on their own (see sudoku_api/expiry.py)
+    ('0 3 * * *', 'django.core.management.call_command', ['cleanup_inactive_games', f'--hours={ROOM_SWEEP_INACTIVE_HOURS}', '--if-leader']),
+    # and archive the games completed more than ARCHIVE_AFTER_DAYS ago
+    ('30 3 * * *', 'django.core.management.call_command', ['archive_completed_games', '--if-leader']),
 ]
 
 # Default primary key field type
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import axios from "axios";
 import Board from "./Board";
@@ -34,6 +34,9 @@ const Game = ({
   const [completionAcknowledged, setCompletionAcknowledged] = useState(false);
   const [chatMessages, setChatMessages] = useState([]);
   const [cellFocus, setCellFocus] = useState({});
+  // roster version of our player list, deltas must follow it in order
+  const rosterVersion = useRef(null);
+  const sendMessageRef = useRef(null);
   const [playerContributions, setPlayerContributions] = useState({});
 
   // join form
@@ -130,6 +133,7 @@ const Game = ({
           socketState.sendMessage(
             JSON.stringify({
               type: "request_player_list",
+              roster_version: rosterVersion.current,
             })
           );
         }
@@ -401,17 +405,12 @@ const Game = ({
       setConnectionStatus("connected");
       setTimeout(() => {
         if (socket && socket.readyState === WebSocket.OPEN) {
+          // the server answers with the player list if ours is out of date
           socket.send(
             JSON.stringify({
               type: "join",
               player_id: playerId,
-            })
-          );
-
-          // request a fresh player list
-          socket.send(
-            JSON.stringify({
-              type: "request_player_list",
+              roster_version: rosterVersion.current,
             })
           );
         }
@@ -442,6 +441,18 @@ const Game = ({
       } else if (data.type === "player_list_update") {
         // handle complete player list update
         updatePlayerList(data.players);
+        if (typeof data.roster_version === "number") {
+          rosterVersion.current = data.roster_version;
+        }
+      } else if (data.type === "player_joined") {
+        applyRosterDelta(data, () => handlePlayerJoin(data.player));
+      } else if (data.type === "player_left") {
+        applyRosterDelta(data, () => handlePlayerLeave(data.player_id));
+      } else if (data.type === "player_updated") {
+        applyRosterDelta(data, () => handlePlayerUpdate(data.player));
+      } else if (data.type === "snapshot") {
+        // reconnected after missing too many events, replace the game state
+        setGame((prevGame) => ({ ...prevGame, ...data.game }));
       } else if (data.type === "game_complete") {
         // show congratulations popup when another player completes the game
         setShowCongratulations(true);
@@ -537,6 +548,7 @@ const Game = ({
     );
 
     // set all these values separately
+    sendMessageRef.current = sendMessage;
     setSocket(ws);
     setSocketCleanup(() => cleanup);
 
@@ -594,16 +606,70 @@ const Game = ({
     });
   };
 
+  const handlePlayerUpdate = (updatedPlayer) => {
+    setGame((prevGame) => {
+      if (!prevGame) return null;
+
+      return {
+        ...prevGame,
+        players: prevGame.players.map((p) =>
+          p.id === updatedPlayer.id ? { ...p, ...updatedPlayer } : p
+        ),
+      };
+    });
+  };
+
+  const handlePlayerLeave = (leftPlayerId) => {
+    setGame((prevGame) => {
+      if (!prevGame) return null;
+
+      return {
+        ...prevGame,
+        players: prevGame.players.filter((p) => p.id !== leftPlayerId),
+      };
+    });
+  };
+
+  /**
+   * apply a player_joined / player_left delta if it is the next roster
+   * version, otherwise ask the server for the full player list
+   */
+  const applyRosterDelta = (data, apply) => {
+    if (typeof data.roster_version === "number") {
+      if (
+        rosterVersion.current === null ||
+        data.roster_version !== rosterVersion.current + 1
+      ) {
+        if (sendMessageRef.current) {
+          sendMessageRef.current(
+            JSON.stringify({
+              type: "request_player_list",
+              roster_version: rosterVersion.current,
+            })
+          );
+        }
+        return;
+      }
+      rosterVersion.current = data.roster_version;
+    }
+    apply();
+  };
+
   const updatePlayerList = (players) => {
     // use a more reliable state update approach
     setGame((prevGame) => {
       if (!prevGame) return null;
 
-      // deep comparison to check if player list has changed
-      const currentPlayers = JSON.stringify(
-        prevGame.players.map((p) => p.id).sort()
-      );
-      const newPlayers = JSON.stringify(players.map((p) => p.id).sort());
+      // deep comparison to check if player list has changed, including
+      // renames and color changes
+      const describe = (list) =>
+        JSON.stringify(
+          list
+            .map((p) => [p.id, p.name, p.color, p.is_host])
+            .sort((a, b) => (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0))
+        );
+      const currentPlayers = describe(prevGame.players);
+      const newPlayers = describe(players);
 
       if (currentPlayers !== newPlayers) {
         return {
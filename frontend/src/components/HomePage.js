@@ -2,6 +2,7 @@ import React, { useState, useEffect } from "react";
 import { Link, useNavigate, useLocation, useParams } from "react-router-dom";
 import axios from "axios";
 import "./HomePage.css";
+import { setupWebSocketWithHeartbeat } from "../utils/websocketUtils";
 
 const HomePage = ({ initialMode, isDarkMode }) => {
   const [showCreateForm, setShowCreateForm] = useState(false);
@@ -112,6 +113,51 @@ const HomePage = ({ initialMode, isDarkMode }) => {
     }
   }, []);
 
+  // keep the game list current while it is shown, the server pushes changes
+  useEffect(() => {
+    if (!showFindGames) {
+      return;
+    }
+
+    const applyLobbyEvent = (games, event) => {
+      switch (event.type) {
+        case "lobby_snapshot":
+          return event.rooms;
+        case "room_added":
+        case "room_updated":
+          return [
+            event.room,
+            ...games.filter((game) => game.id !== event.room.id),
+          ].sort((a, b) => (a.created_at < b.created_at ? 1 : -1));
+        case "room_removed":
+          return games.filter((game) => game.id !== event.id);
+        default:
+          return games;
+      }
+    };
+
+    // batches arrive unpacked, one event per message
+    const onMessage = (e) => {
+      const data = JSON.parse(e.data);
+      setAvailableGames((games) => applyLobbyEvent(games, data));
+      if (data.type === "lobby_snapshot") {
+        setLoading(false);
+      }
+    };
+
+    // the server closes sockets that stop sending heartbeats, and a
+    // reconnected socket starts again from a fresh lobby_snapshot
+    const { cleanup } = setupWebSocketWithHeartbeat(
+      "ws://localhost:8000/ws/lobby/",
+      null,
+      onMessage,
+      null,
+      null
+    );
+
+    return cleanup;
+  }, [showFindGames]);
+
   const fetchAvailableGames = async () => {
     setLoading(true);
     try {
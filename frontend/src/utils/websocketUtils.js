@@ -1,3 +1,9 @@
+// close code the server sends after a "redirect" message
+const ROOM_REDIRECT_CLOSE_CODE = 4307;
+
+// close code the server sends to sockets that stopped sending anything
+const HEARTBEAT_TIMEOUT_CLOSE_CODE = 4001;
+
 /**
  * Sets up a WebSocket connection with heartbeat, reconnection, and queue management
  * @param {string} url - WebSocket endpoint URL
@@ -24,6 +30,13 @@ export const setupWebSocketWithHeartbeat = (
   let messageQueue = [];
   let lastMessageTime = 0;
 
+  // the server may send us to the worker that owns the room
+  let baseUrl = url;
+
+  // room event log position, used to resume after a reconnect
+  let eventEpoch = null;
+  let lastSeq = 0;
+
   // connection state tracking
   let connectionState = {
     isConnected: false,
@@ -134,6 +147,43 @@ export const setupWebSocketWithHeartbeat = (
     }, 15000);
   };
 
+  /**
+   * build the connection URL, asking the server to replay missed events
+   * when we have already been connected to this room
+   * @returns {string} - URL to connect to
+   */
+  const buildUrl = () => {
+    if (!eventEpoch) return baseUrl;
+
+    const separator = baseUrl.includes("?") ? "&" : "?";
+    return `${baseUrl}${separator}epoch=${encodeURIComponent(
+      eventEpoch
+    )}&last_seq=${lastSeq}`;
+  };
+
+  /**
+   * track the room event log position and drop replayed duplicates
+   * @param {Object} data - parsed message
+   * @returns {boolean} - whether the message should be delivered
+   */
+  const trackSequence = (data) => {
+    if (data.type === "sync") {
+      eventEpoch = data.epoch;
+      lastSeq = data.seq;
+      return false;
+    }
+    if (data.type === "snapshot") {
+      // snapshot replaces everything we had, a sync message follows it
+      lastSeq = 0;
+      return true;
+    }
+    if (typeof data.seq === "number") {
+      if (data.seq <= lastSeq) return false;
+      lastSeq = data.seq;
+    }
+    return true;
+  };
+
   /**
    * attempt to connect to WebSocket server
    */
@@ -159,7 +209,8 @@ export const setupWebSocketWithHeartbeat = (
 
     isConnecting = true;
     connectionState.lastAttempt = Date.now();
-    console.log(`Attempting to connect to ${url}`);
+    const connectUrl = buildUrl();
+    console.log(`Attempting to connect to ${connectUrl}`);
 
     // clear any previous connection timeout
     if (connectionTimeout) {
@@ -173,7 +224,7 @@ export const setupWebSocketWithHeartbeat = (
     }
 
     try {
-      socket = new WebSocket(url);
+      socket = new WebSocket(connectUrl);
 
       // set connection timeout
       connectionTimeout = setTimeout(() => {
@@ -233,6 +284,25 @@ export const setupWebSocketWithHeartbeat = (
             return;
           }
 
+          // the room lives on another worker, reconnect there on close
+          if (data.type === "redirect") {
+            console.log(`Room is served by ${data.url}, redirecting`);
+            baseUrl = data.url;
+            return;
+          }
+
+          // unpack batched events and deliver them one by one, in order
+          if (data.type === "batch") {
+            data.events.forEach((batchedEvent) => {
+              if (trackSequence(batchedEvent) && onMessage) {
+                onMessage({ data: JSON.stringify(batchedEvent) });
+              }
+            });
+            return;
+          }
+
+          if (!trackSequence(data)) return;
+
           if (onMessage) onMessage(event);
         } catch (err) {
           console.error("Error processing message:", err);
@@ -274,11 +344,20 @@ export const setupWebSocketWithHeartbeat = (
         if (heartbeatTimer) clearInterval(heartbeatTimer);
         if (connectionMonitorTimer) clearInterval(connectionMonitorTimer);
 
+        // redirected to the room's worker, reconnect right away
+        if (event.code === ROOM_REDIRECT_CLOSE_CODE) {
+          connectionState.lastAttempt = null;
+          connect();
+          return;
+        }
+
         if (onClose) onClose(event);
 
-        // handle reconnection
+        // handle reconnection, also after the server timed us out (e.g.
+        // while the tab was asleep), the close is clean but unasked for
         if (
-          !event.wasClean &&
+          (!event.wasClean ||
+            event.code === HEARTBEAT_TIMEOUT_CLOSE_CODE) &&
           connectionState.reconnectAttempts <
             connectionState.maxReconnectAttempts
         ) {
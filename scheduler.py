@@ -2,17 +2,21 @@ import os
 import django
 import time
 from apscheduler.schedulers.background import BackgroundScheduler
+from django.conf import settings
 from django.core.management import call_command
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
+# abandoned rooms expire in the ASGI worker, this only reconciles what it missed
 def run_cleanup():
     print("Running cleanup_inactive_games...")
-    call_command('cleanup_inactive_games', '--hours=1')
+    call_command('cleanup_inactive_games', f'--hours={settings.ROOM_SWEEP_INACTIVE_HOURS}', '--if-leader')
+    print("Running archive_completed_games...")
+    call_command('archive_completed_games', '--if-leader')
 
 scheduler = BackgroundScheduler()
-scheduler.add_job(run_cleanup, 'interval', minutes=5)
+scheduler.add_job(run_cleanup, 'interval', seconds=settings.ROOM_SWEEP_INTERVAL_SECONDS or 21600)
 scheduler.start()
 
 print("Scheduler started. Press Ctrl+C to stop.")
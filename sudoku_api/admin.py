@@ -2,7 +2,8 @@ from django.contrib import admin
 
 # Register your models here.
 
-from .models import Game, Player, Move
+from .lobby import notify_lobby
+from .models import ArchivedGame, Game, Player, Move
 
 class PlayerInline(admin.TabularInline):
     model = Player
@@ -17,10 +18,10 @@ class MoveInline(admin.TabularInline):
 
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
-    list_display = ('id', 'difficulty', 'is_active', 'is_complete', 'created_at', 'last_activity')
+    list_display = ('id', 'difficulty', 'host_name', 'player_count', 'is_active', 'is_complete', 'created_at', 'last_activity')
     list_filter = ('difficulty', 'is_active', 'is_complete')
     search_fields = ('id',)
-    readonly_fields = ('id', 'created_at', 'last_activity')
+    readonly_fields = ('id', 'created_at', 'last_activity', 'player_count', 'host_name')
     fieldsets = (
         (None, {
             'fields': ('id', 'difficulty', 'is_active', 'is_complete')
@@ -37,7 +38,11 @@ class GameAdmin(admin.ModelAdmin):
     actions = ['mark_as_inactive']
 
     def mark_as_inactive(self, request, queryset):
+        game_ids = list(queryset.values_list('id', flat=True))
         queryset.update(is_active=False)
+        # queryset updates send no signals
+        for game_id in game_ids:
+            notify_lobby(game_id)
     mark_as_inactive.short_description = "Mark selected games as inactive"
 
 @admin.register(Player)
@@ -54,3 +59,12 @@ class MoveAdmin(admin.ModelAdmin):
     list_filter = ('is_correct',)
     search_fields = ('player__name', 'game__id')
     readonly_fields = ('timestamp',)
+
+@admin.register(ArchivedGame)
+class ArchivedGameAdmin(admin.ModelAdmin):
+    list_display = ('id', 'room_name', 'difficulty', 'player_count', 'move_count', 'completed_at', 'archived_at')
+    list_filter = ('difficulty',)
+    search_fields = ('id', 'room_name')
+    # the blob is only readable through the API
+    exclude = ('data',)
+    readonly_fields = ('id', 'room_name', 'difficulty', 'created_at', 'completed_at', 'archived_at', 'player_count', 'move_count')
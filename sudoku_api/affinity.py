@@ -0,0 +1,242 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import metrics
+
+"""
+affinity.py - Consistent-hash room affinity across worker processes
+
+When WORKER_NODES lists the WebSocket workers (id=url pairs), every game
+room is owned by exactly one of them, chosen on a consistent-hash ring:
+- A socket that connects to a worker which does not own its room is sent
+  a 'redirect' message with the owner's URL and closed with code 4307
+- All sockets of a room therefore share one process, so the room keeps its
+  event log, sequence numbers and direct fan-out (see rooms.py)
+- Broadcasts that start on another process (e.g. a REST request handled by
+  any worker) are relayed once to the owner over the channel layer, which
+  sequences and fans them out
+
+Each worker reads its own id from WORKER_ID. With WORKER_NODES_FILE the
+node list is re-read every WORKER_NODES_RELOAD_SECONDS. When workers are
+added or removed, only the rooms whose owner changed are redirected, with
+their players and their spectators. Each worker listens for relayed
+broadcasts from its first connection of any kind (RoomRelayMiddleware).
+
+Hop counters in /api/metrics/:
+- room_hops.local: broadcasts delivered inside this process
+- room_hops.relayed: broadcasts forwarded to the owning worker
+- room_hops.group_send: broadcasts sent to a layer group (no affinity)
+"""
+
+logger = logging.getLogger(__name__)
+
+# close code sent together with a redirect to the room's owner
+ROOM_REDIRECT_CLOSE_CODE = 4307
+
+# virtual nodes per worker, smooths the share of rooms each worker gets
+RING_REPLICAS = 100
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring mapping room ids to worker ids"""
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        self.nodes = list(nodes)
+        points = sorted(
+            (_hash(f'{node}#{i}'), node)
+            for node in self.nodes
+            for i in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, _hash(str(key))) % len(self.hashes)
+        return self.owners[index]
+
+
+def parse_nodes(value):
+    """Parse 'w1=ws://host:8001,w2=ws://host:8002' (or one pair per line)"""
+    nodes = {}
+    for item in value.replace('\n', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        node, _, url = item.partition('=')
+        nodes[node.strip()] = url.strip().rstrip('/')
+    return nodes
+
+
+def relay_channel(worker_id):
+    """Channel layer channel a worker receives relayed broadcasts on"""
+    return f'sudoku.relay.{worker_id}'
+
+
+class RoomRouter:
+    def __init__(self, worker_id, nodes, nodes_file=None, reload_seconds=10):
+        self.worker_id = worker_id
+        self.nodes_file = nodes_file
+        self.reload_seconds = reload_seconds
+        self.nodes_mtime = None
+        self.set_nodes(nodes)
+        self.tasks = []
+        self.loop = None
+
+    @property
+    def enabled(self):
+        return bool(self.worker_id and self.nodes)
+
+    def set_nodes(self, nodes):
+        self.nodes = nodes
+        self.ring = HashRing(sorted(nodes))
+
+    def owner(self, game_id):
+        """Worker id that owns a room"""
+        return self.ring.node_for(game_id)
+
+    def is_local(self, game_id):
+        return not self.enabled or self.owner(game_id) == self.worker_id
+
+    def redirect_url(self, game_id, path):
+        """URL of the room's owner for a socket that connected to path, or None"""
+        if self.is_local(game_id):
+            return None
+        return f'{self.nodes[self.owner(game_id)]}{path}'
+
+    def start(self):
+        """Start relaying and node list reloading on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if not self.enabled or (self.loop is loop and all(not t.done() for t in self.tasks)):
+            return
+        self.loop = loop
+        self.tasks = [loop.create_task(self.receive_relayed())]
+        if self.nodes_file:
+            self.tasks.append(loop.create_task(self.watch_nodes()))
+
+    async def relay(self, game_id, handler, message):
+        """Forward a broadcast to the worker that owns the room"""
+        await get_channel_layer().send(relay_channel(self.owner(game_id)), {
+            'type': 'room.relay',
+            'game_id': str(game_id),
+            'handler': handler,
+            'message': message,
+        })
+
+    async def receive_relayed(self):
+        from .rooms import broadcast
+
+        layer = get_channel_layer()
+        channel = relay_channel(self.worker_id)
+        while True:
+            try:
+                event = await layer.receive(channel)
+                await broadcast(event['game_id'], event['handler'], event['message'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error handling relayed broadcast: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    def read_nodes_file(self):
+        """Return the node list if the file changed since the last read"""
+        mtime = os.path.getmtime(self.nodes_file)
+        if mtime == self.nodes_mtime:
+            return None
+        self.nodes_mtime = mtime
+        with open(self.nodes_file) as f:
+            return parse_nodes(f.read())
+
+    async def watch_nodes(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                nodes = self.read_nodes_file()
+                if nodes is not None and nodes != self.nodes:
+                    await self.rebalance(nodes)
+            except Exception as e:
+                logger.error(f"Error reloading worker nodes: {e}", exc_info=True)
+
+    async def rebalance(self, nodes):
+        """Switch to a new node list and redirect the rooms this worker lost"""
+        from .rooms import local_rooms
+        from .spectators import get_spectator_hub
+
+        self.set_nodes(nodes)
+        # players and spectators of a room follow it to its new owner
+        rooms = {}
+        for game_id, consumers in local_rooms():
+            rooms.setdefault(game_id, []).extend(consumers)
+        for game_id, room in list(get_spectator_hub().rooms.items()):
+            rooms.setdefault(game_id, []).extend(room.spectators)
+
+        moved = 0
+        for game_id, consumers in rooms.items():
+            if self.is_local(game_id):
+                continue
+            moved += 1
+            for consumer in consumers:
+                await consumer.redirect(self.redirect_url(game_id, consumer.scope['path']))
+
+        metrics.incr('affinity.rebalances')
+        metrics.incr('affinity.rooms_moved', moved)
+        logger.info(f"Worker nodes changed to {sorted(nodes)}, {moved} rooms moved away")
+
+
+_router = None
+
+
+def get_router():
+    """Return the room router of this worker process"""
+    global _router
+    if _router is None:
+        nodes_file = settings.WORKER_NODES_FILE
+        nodes = parse_nodes(settings.WORKER_NODES)
+        _router = RoomRouter(
+            settings.WORKER_ID,
+            nodes,
+            nodes_file=nodes_file or None,
+            reload_seconds=settings.WORKER_NODES_RELOAD_SECONDS
+        )
+        if nodes_file:
+            _router.set_nodes(_router.read_nodes_file())
+    return _router
+
+
+class RoomRelayMiddleware:
+    """
+    ASGI middleware that starts the room router with the worker
+
+    Relayed broadcasts must be received even by a worker that so far only
+    has spectator, lobby or HTTP connections. The router is started on the
+    ASGI lifespan startup event where the server sends one, and otherwise
+    on the first connection of any kind.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    get_router().start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        get_router().start()
+        return await self.app(scope, receive, send)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SudokuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sudoku_api'
+
+    def ready(self):
+        # checks, lobby and roster register their checks and signal handlers on import
+        from . import checks, db, lobby, metrics, roster  # noqa: F401
+        metrics.register_gauge('db_pool', db.pool_stats)
@@ -0,0 +1,132 @@
+import zlib
+from collections import defaultdict
+
+import msgpack
+from django.db import router, transaction
+from rest_framework import serializers
+
+from .expiry import delete_games
+from .models import ArchivedGame, Game, Move, Player
+
+"""
+archive.py - Archive tier for completed games
+
+Completed games are never cleaned up, so without archiving the Game,
+Player and Move tables would only grow. archive_completed_games moves the
+games completed more than ARCHIVE_AFTER_DAYS ago into ArchivedGame:
+- One row per game, with the columns needed to list it and a single blob
+  holding the boards, roster and move log (msgpack, zlib-compressed)
+- Moves refer to their player by position in the roster, and timestamps
+  are stored as the API shows them, so unpacking needs no queries
+- Games are archived in chunks, one short transaction per chunk. Rows
+  that are locked by someone else are skipped until the next run
+- The archived game keeps its id. GET /api/games/<id>/ and its snapshot
+  fall back to the archive, with 'archived': true in the response
+"""
+
+# bump when the layout of the blob changes, and keep unpack_game reading the old one
+ARCHIVE_FORMAT = 1
+
+_datetime = serializers.DateTimeField()
+
+
+def _time(value):
+    # the same representation as the API
+    return _datetime.to_representation(value) if value else None
+
+
+def pack_game(game, players, moves):
+    """Compressed blob of a game's boards, roster and move log"""
+    index = {player.id: position for position, player in enumerate(players)}
+    data = {
+        'format': ARCHIVE_FORMAT,
+        'initial_board': game.initial_board,
+        'current_board': game.current_board,
+        'solution': game.solution,
+        'last_activity': _time(game.last_activity),
+        'version': game.version,
+        'completed_by': index.get(game.completed_by_id),
+        'players': [
+            [str(player.id), player.name, player.color, player.is_host, _time(player.last_active)]
+            for player in players
+        ],
+        'moves': [
+            [move.id, index[move.player_id], move.row, move.column, move.value,
+             move.is_correct, _time(move.timestamp)]
+            for move in moves
+        ],
+    }
+    return zlib.compress(msgpack.packb(data), 9)
+
+
+def unpack_game(archived):
+    """An archived game in the shape of GameSerializer, with its moves"""
+    data = msgpack.unpackb(zlib.decompress(archived.data))
+    players = [
+        {'id': player_id, 'name': name, 'color': color, 'is_host': is_host, 'last_active': last_active}
+        for player_id, name, color, is_host, last_active in data['players']
+    ]
+    completed_by = data['completed_by']
+    return {
+        'id': str(archived.id),
+        'version': data['version'],
+        'initial_board': data['initial_board'],
+        'current_board': data['current_board'],
+        'difficulty': archived.difficulty,
+        'created_at': _time(archived.created_at),
+        'last_activity': data['last_activity'],
+        'players': players,
+        'moves': [
+            {
+                'id': move_id, 'player': players[player], 'row': row, 'column': column,
+                'value': value, 'is_correct': is_correct, 'timestamp': timestamp
+            }
+            for move_id, player, row, column, value, is_correct, timestamp in data['moves']
+        ],
+        'is_complete': True,
+        'completed_at': _time(archived.completed_at),
+        'completed_by': players[completed_by] if completed_by is not None else None,
+        'room_name': archived.room_name,
+        'archived': True,
+        'archived_at': _time(archived.archived_at),
+    }
+
+
+def completed_games(cutoff_time):
+    """Games completed before the cutoff time, oldest first"""
+    return Game.objects.filter(
+        is_complete=True,
+        completed_at__lt=cutoff_time
+    ).order_by('completed_at')
+
+
+def archive_chunk(cutoff_time, chunk_size):
+    """Archive up to chunk_size completed games; returns {model name: rows}"""
+    using = router.db_for_write(Game)
+    with transaction.atomic(using=using):
+        games = list(completed_games(cutoff_time).select_for_update(skip_locked=True)[:chunk_size])
+        if not games:
+            return {}
+
+        game_ids = [game.id for game in games]
+        players = defaultdict(list)
+        for player in Player.objects.filter(game_id__in=game_ids).order_by('id'):
+            players[player.game_id].append(player)
+        moves = defaultdict(list)
+        for move in Move.objects.filter(game_id__in=game_ids).order_by('timestamp', 'id'):
+            moves[move.game_id].append(move)
+
+        ArchivedGame.objects.using(using).bulk_create([
+            ArchivedGame(
+                id=game.id,
+                room_name=game.room_name,
+                difficulty=game.difficulty,
+                created_at=game.created_at,
+                completed_at=game.completed_at,
+                player_count=len(players[game.id]),
+                move_count=len(moves[game.id]),
+                data=pack_game(game, players[game.id], moves[game.id])
+            )
+            for game in games
+        ])
+        return delete_games(game_ids, using)
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from .affinity import parse_nodes
+
+"""
+checks.py - System checks for the channel layer
+
+- sudoku.E001: a Redis host is not a redis://, rediss:// or unix:// URL
+- sudoku.W001 (deploy): the in-memory layer is used, so rooms cannot span
+  several worker processes
+- sudoku.E002 (deploy): a message sent through the layer to a group did not
+  come back within CHANNEL_LAYER_CHECK_TIMEOUT seconds
+- sudoku.E003: room affinity is configured without a shared channel layer
+- sudoku.E004: WORKER_ID is missing from the affinity node list
+- sudoku.E005: WORKER_NODES_FILE cannot be read
+
+Run `python manage.py check --deploy` before starting the workers to make
+sure they can reach each other.
+"""
+
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+
+
+@register('channels')
+def check_channel_layer_config(app_configs, **kwargs):
+    errors = []
+    for host in getattr(settings, 'REDIS_HOSTS', []):
+        if not host.startswith(REDIS_SCHEMES):
+            errors.append(Error(
+                f"Invalid Redis host '{host}' for the channel layer",
+                hint='Use redis://host:port/db, rediss://... or unix://path',
+                id='sudoku.E001',
+            ))
+    return errors
+
+
+@register('channels')
+def check_room_affinity(app_configs, **kwargs):
+    if settings.WORKER_NODES_FILE:
+        try:
+            with open(settings.WORKER_NODES_FILE) as f:
+                nodes = parse_nodes(f.read())
+        except OSError as e:
+            return [Error(f'Cannot read WORKER_NODES_FILE: {e}', id='sudoku.E005')]
+    else:
+        nodes = parse_nodes(settings.WORKER_NODES)
+
+    if not nodes:
+        return []
+
+    errors = []
+    if not settings.REDIS_HOSTS:
+        errors.append(Error(
+            'Room affinity needs a channel layer shared by all workers',
+            hint='Set REDIS_URL or REDIS_HOSTS, or remove WORKER_NODES.',
+            id='sudoku.E003',
+        ))
+    if settings.WORKER_ID not in nodes:
+        errors.append(Error(
+            f"WORKER_ID '{settings.WORKER_ID}' is not one of the worker nodes {sorted(nodes)}",
+            id='sudoku.E004',
+        ))
+    return errors
+
+
+async def layer_round_trip(layer, timeout):
+    """Send a message to a group through the layer and wait for it to arrive"""
+    channel = await layer.new_channel()
+    group = f'sudoku_check_{channel.rsplit("!", 1)[-1]}'
+    await layer.group_add(group, channel)
+    try:
+        await layer.group_send(group, {'type': 'check.ping', 'sent': time.time()})
+        message = await asyncio.wait_for(layer.receive(channel), timeout)
+        return time.time() - message['sent']
+    finally:
+        await layer.group_discard(group, channel)
+        if hasattr(layer, 'close_pools'):
+            await layer.close_pools()
+
+
+@register('channels', deploy=True)
+def check_channel_layer_round_trip(app_configs, **kwargs):
+    # a separate instance, so its connections are not tied to this check's loop
+    layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+    if isinstance(layer, InMemoryChannelLayer):
+        return [Warning(
+            'The in-memory channel layer only reaches consumers in the same process',
+            hint='Run a single ASGI worker, or set REDIS_URL to share rooms between workers.',
+            id='sudoku.W001',
+        )]
+
+    timeout = settings.CHANNEL_LAYER_CHECK_TIMEOUT
+    try:
+        async_to_sync(layer_round_trip)(layer, timeout)
+    except asyncio.TimeoutError:
+        return [Error(
+            f'Channel layer message did not arrive within {timeout}s',
+            hint='Check that every worker uses the same REDIS_URL / REDIS_HOSTS and prefix.',
+            id='sudoku.E002',
+        )]
+    except Exception as e:
+        return [Error(
+            f'Channel layer is not reachable: {e}',
+            hint='Check REDIS_URL / REDIS_HOSTS.',
+            id='sudoku.E002',
+        )]
+    return []
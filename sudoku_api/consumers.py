@@ -1,11 +1,33 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.db import aclose_old_connections
 from .models import Game, Player, Move
+from . import metrics
+from .affinity import ROOM_REDIRECT_CLOSE_CODE, get_router
+from .db import db_sync_to_async
+from .expiry import get_room_expiry
+from .heartbeat import get_heartbeat_wheel
+from .lobby import anotify_lobby, get_lobby_hub
+from .serializers import GameSerializer
+from .spectators import get_spectator_hub
+from .protocol import (
+    MSGPACK_SUBPROTOCOL, decode_compact, encode_compact, encode_compact_batch,
+    encode_message, is_cell, is_digit
+)
+from .ratelimit import RateLimiter
+from .roster import discard_roster, get_roster, player_data
+from .rooms import (
+    broadcast, discard_event_log, get_event_log, join_room, leave_room, room_group_name,
+    room_is_local
+)
 from channels.exceptions import StopConsumer
-from django.db import connections
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
 import asyncio
 import logging
+from urllib.parse import parse_qs
 from django.utils import timezone
 
 """
@@ -13,11 +35,32 @@ consumers.py - WebSocket handler for real-time Sudoku gameplay
 
 This file implements the SudokuConsumer for bidirectional communication:
 - Connects players to game-specific channels using Django Channels
-- Broadcasts moves in real-time to all connected players
-- Maintains player lists and synchronizes new connections
-- Implements heartbeat mechanism to keep connections alive
-- Handles database operations asynchronously to prevent blocking
+- Broadcasts moves in real-time to all connected players, encoding each
+  broadcast once in the sender rather than once per recipient
+- Maintains player lists and synchronizes new connections, with a cached
+  roster and player_joined / player_left deltas (see roster.py)
+- Numbers every room broadcast so a reconnecting client can resume from
+  the last event it saw, with a full snapshot only when the gap is too old
+- Registers every socket with the shared heartbeat scheduler, which keeps
+  connections alive and closes peers that stopped responding
+- Optionally batches outbound events into a single frame per time window
+- Speaks JSON text frames by default, or compact msgpack binary frames to
+  clients that negotiate the 'sudoku.msgpack.v1' subprotocol
+- Uses Django's async ORM for simple lookups and runs transactional
+  sections on a dedicated, sized database executor
 - Automatically checks for game completion after each move
+- Room broadcasts are delivered straight to the connected consumers when
+  the channel layer is in-process (see rooms.py)
+- Redirects sockets to the worker that owns their room when room affinity
+  is configured (see affinity.py)
+- Dispatches inbound messages through a handler table, with per message
+  type token-bucket rate limits and a bounded per-connection queue
+- Serves read-only spectators (SpectatorConsumer) throttled board
+  snapshots shared by the whole room (see spectators.py)
+- Starts an expiry timer when the last socket of a room disconnects
+  and cancels it when one joins again (see expiry.py)
+- Pushes the list of joinable games and its changes to lobby sockets
+  (LobbyConsumer, see lobby.py)
 
 The consumer coordinates between the REST API and WebSocket connections,
 ensuring game state consistency across all connected clients and the database.
@@ -27,30 +70,75 @@ Game completion is automatically detected and broadcast to all players.
 
 logger = logging.getLogger(__name__)
 
+# close code used when a client overflows its inbound message queue
+INBOUND_OVERFLOW_CLOSE_CODE = 4029
+
+# close code used when a spectator asks for a game that does not exist
+GAME_NOT_FOUND_CLOSE_CODE = 4004
+
 class SudokuConsumer(AsyncWebsocketConsumer):
+    # message types that are sent immediately even when batching is enabled
+    BATCH_BYPASS_TYPES = {'game_complete', 'game_completed', 'error', 'hint_response', 'redirect'}
+
+    # inbound message type -> handler method
+    MESSAGE_HANDLERS = {
+        'move': 'handle_move',
+        'join': 'handle_join',
+        'game_complete': 'handle_game_complete',
+        'game_completed': 'handle_game_completed',
+        'leave_game': 'handle_leave_game',
+        'cell_focus': 'handle_cell_focus',
+        'quick_chat': 'handle_quick_chat',
+        'request_hint': 'handle_request_hint',
+        'request_player_list': 'handle_request_player_list',
+    }
+
     async def connect(self):
         self.game_id = self.scope['url_route']['kwargs']['game_id']
-        self.room_group_name = f'game_{self.game_id}'
-        self.heartbeat_task = None
+        self.room_group_name = room_group_name(self.game_id)
+        self.last_seen = asyncio.get_running_loop().time()
+        self.batch_window = settings.WS_BATCH_WINDOW_MS / 1000
+        self.pending_events = []
+        self.batch_flush_handle = None
+        self.use_msgpack = MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.rate_limiter = RateLimiter(settings.WS_RATE_LIMITS, settings.WS_RATE_LIMIT_DEFAULT)
+        self.inbound = asyncio.Queue(maxsize=settings.WS_INBOUND_QUEUE_SIZE)
+        self.inbound_task = None
         
         try:
+            # rooms are pinned to one worker when affinity is configured
+            router = get_router()
+            redirect_url = router.redirect_url(self.game_id, self.scope['path'])
+            if redirect_url:
+                await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.use_msgpack else None)
+                metrics.incr('affinity.redirects')
+                await self.redirect(redirect_url)
+                return
+            router.start()
+
             # join room group
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
 
-            await self.accept()
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.use_msgpack else None)
+
+            # receive room broadcasts directly when the layer is in-process
+            join_room(self.game_id, self)
+            get_room_expiry().room_joined(self.game_id)
             
-            # start heartbeat task
-            self.heartbeat_task = asyncio.create_task(self.send_heartbeat())
+            # start sending heartbeats
+            get_heartbeat_wheel().register(self)
             
-            # immediately send the current player list to the newly connected client
-            all_players = await self.get_all_players()
-            await self.send(text_data=json.dumps({
-                'type': 'player_list_update',
-                'players': all_players
-            }))
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            if 'last_seq' in query:
+                await self.resume(query.get('epoch', [''])[0], query['last_seq'][0])
+            else:
+                # immediately send the current player list to the newly connected client
+                await self.send_roster()
+
+            await self.send_sync()
             
         except asyncio.CancelledError:
             logger.info(f"Connection cancelled for game {self.game_id}")
@@ -59,445 +147,545 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error in WebSocket connect: {e}", exc_info=True)
             await self.close(code=4000)   
 
+    async def redirect(self, url):
+        """Send the client to the worker that owns this room and close"""
+        await self.send_message({
+            'type': 'redirect',
+            'url': url
+        })
+        await self.close(code=ROOM_REDIRECT_CLOSE_CODE)
+
+    async def resume(self, epoch, last_seq):
+        """
+        Bring a reconnecting client up to date.
+
+        Replays the room events it missed when they are still in the event
+        log, otherwise sends a full snapshot of the game.
+        """
+        log = get_event_log(self.game_id)
+        try:
+            # other workers' events are not in this process' log
+            missed = log.since(epoch, int(last_seq)) if room_is_local(self.game_id) else None
+        except ValueError:
+            missed = None
+
+        if missed is None:
+            snapshot = await self.get_game_snapshot()
+            if snapshot is not None:
+                await self.send_message({
+                    'type': 'snapshot',
+                    'game': snapshot
+                })
+            return
+
+        for event in missed:
+            await self.send_event(event)
+
+    async def send_sync(self):
+        """Tell the client which event log and sequence number it is at"""
+        log = get_event_log(self.game_id)
+        await self.send_message({
+            'type': 'sync',
+            'epoch': log.epoch,
+            'seq': log.seq
+        })
+
     async def disconnect(self, close_code):
         # First, make sure to discard from the group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        leave_room(self.game_id, self)
+        # the room expires if nobody comes back
+        get_room_expiry().room_left(self.game_id)
         
-        # Then cancel the heartbeat task if it exists
-        if hasattr(self, 'heartbeat_task') and self.heartbeat_task:
-            self.heartbeat_task.cancel()
-            try:
-                # Wait for the task to be properly cancelled
-                await self.heartbeat_task
-            except asyncio.CancelledError:
-                # This is expected when cancelling a task
-                pass
-            except Exception as e:
-                logger.error(f"Error cancelling heartbeat task: {e}", exc_info=True)
+        # drop any batched events, the socket is already gone
+        self.discard_batch()
+
+        # Then stop sending heartbeats
+        get_heartbeat_wheel().unregister(self)
+
+        # stop handling messages the client queued before it left
+        if getattr(self, 'inbound_task', None) and not self.inbound_task.done():
+            self.inbound_task.cancel()
         
+        # hand the async ORM thread's connection back (to the pool, or closed
+        # once past CONN_MAX_AGE) without touching other consumers' connections
+        await aclose_old_connections()
+
         # Finally raise StopConsumer
-        await database_sync_to_async(connections.close_all)()
         raise StopConsumer()
     
-    async def send_heartbeat(self):
-        """Send periodic heartbeat to keep connection alive"""
-        try:
-            while True:
-                await asyncio.sleep(30)  # every 30 seconds
-                await self.send(text_data=json.dumps({
-                    'type': 'heartbeat',
-                    'timestamp': self.get_timestamp()
-                }))
-        except asyncio.CancelledError:
-            # task was cancelled, clean up
-            pass
-        except Exception as e:
-            logger.error(f"Heartbeat error: {e}", exc_info=True)
-    
     def get_timestamp(self):
-        """Return current ISO timestamp for the heartbeat"""
+        """Return current ISO timestamp"""
         return timezone.now().isoformat()
-    
-    async def receive(self, text_data):
+
+    async def send_message(self, message):
+        """Encode a message for this client only and send it"""
+        if self.use_msgpack:
+            await self.send_encoded(encode_compact(message), message.get('type'))
+        else:
+            await self.send_encoded(encode_message(message), message.get('type'))
+
+    async def send_event(self, event):
+        """Send a pre-encoded room event in this client's wire format"""
+        if self.use_msgpack:
+            await self.send_encoded(event['bytes'], event['message_type'])
+        else:
+            await self.send_encoded(event['text'], event['message_type'])
+
+    async def send_encoded(self, data, message_type):
+        """
+        Send an already encoded message to this client.
+
+        When a batch window is configured, messages are queued and sent
+        together as one 'batch' frame once the window elapses. Latency
+        critical messages flush the queue and are sent straight away, so
+        the order seen by the client is always the order of the calls.
+        """
+        if self.batch_window <= 0 or message_type in self.BATCH_BYPASS_TYPES:
+            await self.flush_batch()
+            await self.send_frame(data)
+            return
+
+        self.pending_events.append(data)
+        if self.batch_flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.batch_flush_handle = loop.call_later(
+                self.batch_window,
+                lambda: asyncio.ensure_future(self.flush_batch())
+            )
+
+    async def flush_batch(self):
+        """Send all queued events as a single frame"""
+        if self.batch_flush_handle is not None:
+            self.batch_flush_handle.cancel()
+            self.batch_flush_handle = None
+
+        if not self.pending_events:
+            return
+
+        events, self.pending_events = self.pending_events, []
         try:
-            data = json.loads(text_data)
-            message_type = data.get('type')
-            
-            if message_type == 'move':
-                # handle a new move
-                player_id = data.get('player_id')
-                row = data.get('row')
-                column = data.get('column')
-                value = data.get('value')
-                
-                # validate move data
-                if None in (player_id, row, column, value):
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Invalid move data'
-                    }))
-                    return
-                
-                try:
-                    # save the move to database
-                    move_data = await self.save_move(player_id, row, column, value)
-                    
-                    # broadcast move to group
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'broadcast_move',
-                            'move': move_data
-                        }
-                    )
-
-                    # check if the game is complete after this move
-                    if move_data.get('game_complete', False):
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'broadcast_game_complete',
-                                'player_id': player_id
-                            }
-                        )
+            if len(events) == 1:
+                await self.send_frame(events[0])
+            elif self.use_msgpack:
+                await self.send_frame(encode_compact_batch(events))
+            else:
+                # events are already encoded, splice them into the batch frame
+                await self.send_frame('{"type":"batch","events":[' + ','.join(events) + ']}')
+        except Exception as e:
+            logger.error(f"Error flushing event batch: {e}", exc_info=True)
 
-                except ValueError as ve:
-                    # send specific validation error back to client
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': str(ve)
-                    }))
-                    return
-            
-            elif message_type == 'join':
-                # handle a new player joining
-                player_id = data.get('player_id')
-                
-                if not player_id:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player ID is required'
-                    }))
-                    return
-                
-                # broadcast the player list update (more efficient)
-                all_players = await self.get_all_players()
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'broadcast_player_list',
-                        'players': all_players
-                    }
-                )
-
-            elif message_type == 'game_complete':
-                # handle explicit game completion request
-                player_id = data.get('player_id')
-                
-                if not player_id:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player ID is required'
-                    }))
-                    return
-                    
-                # validate the game is actually complete before marking it
-                is_game_complete = await self.check_game_completion(self.game_id)
-                
-                if not is_game_complete:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Game is not yet complete'
-                    }))
-                    return
-                
-                # mark game as complete in database
-                try:
-                    await self.mark_game_complete(player_id)
-                    
-                    # broadcast completion to all players
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'broadcast_game_complete',
-                            'player_id': player_id
-                        }
-                    )
-                except ValueError as ve:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': str(ve)
-                    }))
-                    
-            elif message_type == 'game_completed':
-                # penanganan eksplisit ketika game sudah selesai
-                player_id = data.get('player_id')
-                game_id = data.get('game_id')
-                
-                if not player_id or not game_id:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player ID and Game ID are required'
-                    }))
-                    return
-                
-                # mark game as completed in database
-                await self.mark_game_as_completed(game_id, player_id)
-                
-                # broadcast to all players
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'broadcast_game_completed',
-                        'player_id': player_id,
-                        'game_id': game_id
-                    }
-                )
-                
-            elif message_type == 'leave_game':
-                # penanganan ketika pemain meninggalkan game
-                player_id = data.get('player_id')
-                game_id = data.get('game_id')
-                
-                if not player_id or not game_id:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player ID and Game ID are required'
-                    }))
-                    return
-                
-                # hapus pemain dari game
-                remaining_players = await self.remove_player_from_game(game_id, player_id)
-                
-                # jika tidak ada pemain tersisa, hapus game
-                if remaining_players == 0:
-                    await self.delete_game(game_id)
-                else:
-                    # broadcast ke pemain lain bahwa seseorang telah keluar
-                    all_players = await self.get_all_players()
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'broadcast_player_left',
-                            'player_id': player_id,
-                            'players': all_players
-                        }
-                    )
-
-            elif message_type == 'cell_focus':
-                player_id = data.get('player_id')
-                row = data.get('row')
-                column = data.get('column')
-                focus_type = data.get('focus_type')  # 'focus' or 'blur'
-                
-                if None in (player_id, row, column, focus_type):
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Invalid cell focus data'
-                    }))
-                    return
-                
-                # get player data to include color information
-                player = await self.get_player_data(player_id)
-                
-                if not player:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player not found'
-                    }))
-                    return
-                
-                # broadcast the cell focus update to all players
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'broadcast_cell_focus',
-                        'player_id': player_id,
-                        'player': player,
-                        'row': row,
-                        'column': column,
-                        'focus_type': focus_type
-                    }
-                )
-
-            elif message_type == 'quick_chat':
-                # handle quick chat messages
-                player_id = data.get('player_id')
-                message = data.get('message')
-                timestamp = data.get('timestamp', self.get_timestamp())
-                
-                if not player_id or not message:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Invalid quick chat data'
-                    }))
-                    return
-                
-                # get player data to include in the broadcast
-                player = await self.get_player_data(player_id)
-                
-                if not player:
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Player not found'
-                    }))
-                    return
-                
-                # broadcast the quick chat message to all players
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'broadcast_quick_chat',
-                        'player_id': player_id,
-                        'player': player,
-                        'message': message,
-                        'timestamp': timestamp
-                    }
-                )
-
-
-            elif message_type == 'request_hint':
-                # handle a hint request
-                player_id = data.get('player_id')
-                row = data.get('row')
-                column = data.get('column')
-                
-                # validate hint data
-                if None in (player_id, row, column):
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'message': 'Invalid hint request data'
-                    }))
-                    return
-                
+    async def send_frame(self, data):
+        """Write encoded data as a binary or text frame"""
+        if self.use_msgpack:
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    def discard_batch(self):
+        """Cancel the pending flush and drop queued events"""
+        if getattr(self, 'batch_flush_handle', None) is not None:
+            self.batch_flush_handle.cancel()
+            self.batch_flush_handle = None
+        self.pending_events = []
+    
+    async def receive(self, text_data=None, bytes_data=None):
+        # any message, including the client's own heartbeat, proves it is alive
+        self.last_seen = asyncio.get_running_loop().time()
+
+        try:
+            if bytes_data is not None:
                 try:
-                    # process the hint request
-                    hint_data = await self.process_hint_request(player_id, row, column)
-                    
-                    # send the hint only to the requesting client
-                    await self.send(text_data=json.dumps({
-                        'type': 'hint_response',
-                        'value': hint_data['value'],
-                        'row': row,
-                        'column': column
-                    }))
-                    
-                    # broadcast the move to all clients
-                    if hint_data.get('move'):
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'broadcast_move',
-                                'move': hint_data['move']
-                            }
-                        )
-                        
-                    # check if the game is complete after this hint
-                    if hint_data.get('game_complete', False):
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'broadcast_game_complete',
-                                'player_id': player_id
-                            }
-                        )
-                        
+                    data = decode_compact(bytes_data)
                 except ValueError as ve:
-                    await self.send(text_data=json.dumps({
+                    await self.send_message({
                         'type': 'error',
                         'message': str(ve)
-                    }))
+                    })
                     return
-            
-            elif message_type == 'request_player_list':
-                # allow clients to request fresh player list
-                all_players = await self.get_all_players()
-                await self.send(text_data=json.dumps({
-                    'type': 'player_list_update',
-                    'players': all_players
-                }))
-                
+            else:
+                data = json.loads(text_data)
         except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'error',
                 'message': 'Invalid JSON data'
-            }))
-        except Exception as e:
-            logger.error(f"Error processing message: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
+            })
+            return
+
+        # valid JSON that is not a message object, or whose type is not a string
+        message_type = data.get('type') if isinstance(data, dict) else None
+        if not isinstance(data, dict) or not isinstance(message_type, (str, type(None))):
+            await self.send_message({
                 'type': 'error',
-                'message': 'Internal server error'
-            }))
+                'message': 'Invalid message format'
+            })
+            return
 
+        # heartbeats, pongs and unknown types need no further handling
+        handler = self.MESSAGE_HANDLERS.get(message_type)
+        if handler is None:
+            return
 
-    async def broadcast_move(self, event):
-        move = event['move']
+        bucket = self.rate_limiter.bucket(message_type)
+        was_throttled = bucket.throttled
+        if not bucket.consume():
+            metrics.incr(f'ws_throttled.{message_type}')
+            if not was_throttled:
+                await self.send_message({
+                    'type': 'error',
+                    'message': f'Too many {message_type} messages, slow down'
+                })
+            return
+
+        try:
+            self.inbound.put_nowait((handler, data))
+        except asyncio.QueueFull:
+            # the client sends faster than we can process, even within its limits
+            metrics.incr(f'ws_dropped.{message_type}')
+            logger.warning(f"Inbound queue full for game {self.game_id}, closing connection")
+            await self.close(code=INBOUND_OVERFLOW_CLOSE_CODE)
+            return
+
+        if self.inbound_task is None or self.inbound_task.done():
+            self.inbound_task = asyncio.create_task(self.process_inbound())
+
+    async def process_inbound(self):
+        """Handle queued messages one at a time, in the order they arrived"""
+        while not self.inbound.empty():
+            handler, data = self.inbound.get_nowait()
+            try:
+                await getattr(self, handler)(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing message: {e}", exc_info=True)
+                await self.send_message({
+                    'type': 'error',
+                    'message': 'Internal server error'
+                })
+
+
+    async def handle_move(self, data):
+        # handle a new move
+        player_id = data.get('player_id')
+        row = data.get('row')
+        column = data.get('column')
+        value = data.get('value')
         
-        await self.send(text_data=json.dumps({
-            'type': 'move',
-            'move': move
-        }))
-    
-    async def broadcast_join(self, event):
-        player = event['player']
+        # validate move data
+        if player_id is None or not is_cell(row, column) or not is_digit(value, 9):
+            await self.send_message({
+                'type': 'error',
+                'message': 'Invalid move data'
+            })
+            return
         
-        await self.send(text_data=json.dumps({
-            'type': 'join',
-            'player': player
-        }))
-    
-    async def broadcast_player_list(self, event):
-        players = event['players']
+        try:
+            # save the move to database
+            move_data = await self.save_move(player_id, row, column, value)
+            
+            # broadcast move to group
+            await broadcast(self.game_id, 'broadcast_move', {
+                'type': 'move',
+                'move': move_data
+            })
+
+            # check if the game is complete after this move
+            if move_data.get('game_complete', False):
+                await broadcast(self.game_id, 'broadcast_game_complete', {
+                    'type': 'game_complete',
+                    'player_id': player_id
+                })
+
+        except ValueError as ve:
+            # send specific validation error back to client
+            await self.send_message({
+                'type': 'error',
+                'message': str(ve)
+            })
+            return
+
+    async def handle_join(self, data):
+        # handle a new player joining
+        player_id = data.get('player_id')
+        
+        if not player_id:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player ID is required'
+            })
+            return
+        
+        # the join itself was announced by the REST API, just make sure this
+        # client has the current list
+        await self.send_roster(data.get('roster_version'))
+
+    async def handle_game_complete(self, data):
+        # handle explicit game completion request
+        player_id = data.get('player_id')
+        
+        if not player_id:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player ID is required'
+            })
+            return
+            
+        # validate the game is actually complete before marking it
+        is_game_complete = await self.check_game_completion(self.game_id)
+        
+        if not is_game_complete:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Game is not yet complete'
+            })
+            return
+        
+        # mark game as complete in database
+        try:
+            await self.mark_game_complete(player_id)
+            
+            # broadcast completion to all players
+            await broadcast(self.game_id, 'broadcast_game_complete', {
+                'type': 'game_complete',
+                'player_id': player_id
+            })
+        except ValueError as ve:
+            await self.send_message({
+                'type': 'error',
+                'message': str(ve)
+            })
+
+    async def handle_game_completed(self, data):
+        # penanganan eksplisit ketika game sudah selesai
+        player_id = data.get('player_id')
+        game_id = data.get('game_id')
+        
+        if not player_id or not game_id:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player ID and Game ID are required'
+            })
+            return
+        
+        # mark game as completed in database
+        await self.mark_game_as_completed(game_id, player_id)
+        
+        # broadcast to all players
+        await broadcast(self.game_id, 'broadcast_game_completed', {
+            'type': 'game_completed',
+            'player_id': player_id,
+            'game_id': game_id,
+            'timestamp': self.get_timestamp()
+        })
+
+    async def handle_leave_game(self, data):
+        # penanganan ketika pemain meninggalkan game
+        player_id = data.get('player_id')
+        game_id = data.get('game_id')
+        
+        if not player_id or not game_id:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player ID and Game ID are required'
+            })
+            return
+        
+        # hapus pemain dari game
+        remaining_players = await self.remove_player_from_game(game_id, player_id)
+        
+        # jika tidak ada pemain tersisa, hapus game
+        if remaining_players == 0:
+            await self.delete_game(game_id)
+            discard_event_log(game_id)
+            discard_roster(game_id)
+        else:
+            # broadcast ke pemain lain bahwa seseorang telah keluar
+            await broadcast(self.game_id, 'broadcast_player_left', {
+                'type': 'player_left',
+                'player_id': player_id,
+                'timestamp': self.get_timestamp()
+            })
+
+    async def handle_cell_focus(self, data):
+        player_id = data.get('player_id')
+        row = data.get('row')
+        column = data.get('column')
+        focus_type = data.get('focus_type')  # 'focus' or 'blur'
+        
+        if player_id is None or not is_cell(row, column) or focus_type not in ('focus', 'blur'):
+            await self.send_message({
+                'type': 'error',
+                'message': 'Invalid cell focus data'
+            })
+            return
+        
+        # get player data to include color information
+        player = await self.get_player_data(player_id)
+        
+        if not player:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player not found'
+            })
+            return
+        
+        # broadcast the cell focus update to all players
+        await broadcast(self.game_id, 'broadcast_cell_focus', {
+            'type': 'cell_focus',
+            'player_id': player_id,
+            'player': player,
+            'row': row,
+            'column': column,
+            'focus_type': focus_type
+        })
+
+    async def handle_quick_chat(self, data):
+        # handle quick chat messages
+        player_id = data.get('player_id')
+        message = data.get('message')
+        timestamp = data.get('timestamp', self.get_timestamp())
+        
+        if not player_id or not message:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Invalid quick chat data'
+            })
+            return
+        
+        # get player data to include in the broadcast
+        player = await self.get_player_data(player_id)
+        
+        if not player:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Player not found'
+            })
+            return
+        
+        # broadcast the quick chat message to all players
+        await broadcast(self.game_id, 'broadcast_quick_chat', {
+            'type': 'quick_chat',
+            'player_id': player_id,
+            'player': player,
+            'message': message,
+            'timestamp': timestamp
+        })
+
+    async def handle_request_hint(self, data):
+        # handle a hint request
+        player_id = data.get('player_id')
+        row = data.get('row')
+        column = data.get('column')
         
-        await self.send(text_data=json.dumps({
+        # validate hint data
+        if player_id is None or not is_cell(row, column):
+            await self.send_message({
+                'type': 'error',
+                'message': 'Invalid hint request data'
+            })
+            return
+        
+        try:
+            # process the hint request
+            hint_data = await self.process_hint_request(player_id, row, column)
+            
+            # send the hint only to the requesting client
+            await self.send_message({
+                'type': 'hint_response',
+                'value': hint_data['value'],
+                'row': row,
+                'column': column
+            })
+            
+            # broadcast the move to all clients
+            if hint_data.get('move'):
+                await broadcast(self.game_id, 'broadcast_move', {
+                    'type': 'move',
+                    'move': hint_data['move']
+                })
+                
+            # check if the game is complete after this hint
+            if hint_data.get('game_complete', False):
+                await broadcast(self.game_id, 'broadcast_game_complete', {
+                    'type': 'game_complete',
+                    'player_id': player_id
+                })
+                
+        except ValueError as ve:
+            await self.send_message({
+                'type': 'error',
+                'message': str(ve)
+            })
+            return
+
+    async def handle_request_player_list(self, data):
+        # allow clients to request fresh player list, sent only when the
+        # version they have is out of date
+        await self.send_roster(data.get('roster_version'))
+
+    async def send_roster(self, client_version=None):
+        """Send the full player list, unless the client is already up to date"""
+        players, version = await self.get_all_players()
+        if version is not None and client_version == version:
+            return
+
+        message = {
             'type': 'player_list_update',
             'players': players
-        }))
+        }
+        if version is not None:
+            message['roster_version'] = version
+        await self.send_message(message)
+
+    async def broadcast_move(self, event):
+        await self.send_event(event)
+    
+    async def broadcast_join(self, event):
+        await self.send_event(event)
+    
+    async def broadcast_player_list(self, event):
+        await self.send_event(event)
+
+    async def broadcast_player_joined(self, event):
+        """Broadcast when a player joins through the REST API"""
+        await self.send_event(event)
 
     async def broadcast_game_complete(self, event):
         """Broadcast game completion to all connected clients"""
-        player_id = event['player_id']
-        
-        await self.send(text_data=json.dumps({
-            'type': 'game_complete',
-            'player_id': player_id
-        }))
+        await self.send_event(event)
 
     async def broadcast_quick_chat(self, event):
         """Broadcast quick chat messages to all connected clients"""
-        await self.send(text_data=json.dumps({
-            'type': 'quick_chat',
-            'player_id': event['player_id'],
-            'player': event['player'],
-            'message': event['message'],
-            'timestamp': event['timestamp']
-        }))
+        await self.send_event(event)
 
     async def broadcast_cell_focus(self, event):
         """Broadcast cell focus information to all connected clients"""
-        await self.send(text_data=json.dumps({
-            'type': 'cell_focus',
-            'player_id': event['player_id'],
-            'player': event['player'],
-            'row': event['row'],
-            'column': event['column'],
-            'focus_type': event['focus_type']
-        }))
+        await self.send_event(event)
 
     async def broadcast_game_completed(self, event):
         """Broadcast when a game is explicitly marked as completed"""
-        player_id = event.get('player_id')
-        game_id = event.get('game_id')
-        
-        await self.send(text_data=json.dumps({
-            'type': 'game_completed',
-            'player_id': player_id,
-            'game_id': game_id,
-            'timestamp': self.get_timestamp()
-        }))
+        await self.send_event(event)
         
     async def broadcast_player_left(self, event):
         """Broadcast when a player leaves the game"""
-        player_id = event.get('player_id')
-        players = event.get('players', [])
-        
-        await self.send(text_data=json.dumps({
-            'type': 'player_left',
-            'player_id': player_id,
-            'players': players,
-            'timestamp': self.get_timestamp()
-        }))
+        await self.send_event(event)
 
-    @database_sync_to_async
-    def check_game_completion(self, game_id):
+    async def broadcast_player_updated(self, event):
+        """Broadcast when a player is renamed or otherwise changed"""
+        await self.send_event(event)
+
+    async def check_game_completion(self, game_id):
         """
         Check if the game is complete (all cells filled correctly)
         """
         try:
-            game = Game.objects.get(id=game_id)
+            game = await Game.objects.only(
+                'is_complete', 'current_board', 'solution'
+            ).aget(id=game_id)
             
             # if game is already marked complete, return early
             if game.is_complete:
@@ -517,19 +705,24 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error checking game completion: {e}", exc_info=True)
             return False
 
-    @database_sync_to_async
-    def mark_game_complete(self, player_id):
+    async def mark_game_complete(self, player_id):
         """Mark the game as complete in the database"""
         try:
-            player = Player.objects.get(id=player_id)
-            game = Game.objects.get(id=self.game_id)
+            player = await Player.objects.aget(id=player_id)
             
             # only mark as complete if not already completed
-            if not game.is_complete:
-                game.is_complete = True
-                game.completed_at = timezone.now()
-                game.completed_by = player
-                game.save()
+            updated = await Game.objects.filter(id=self.game_id, is_complete=False).aupdate(
+                is_complete=True,
+                completed_at=timezone.now(),
+                completed_by=player,
+                last_activity=timezone.now(),
+                version=F('version') + 1
+            )
+            if not updated and not await Game.objects.filter(id=self.game_id).aexists():
+                raise Game.DoesNotExist
+            if updated:
+                # completed games leave the lobby
+                await anotify_lobby(self.game_id)
                 
             return True
         except Player.DoesNotExist:
@@ -540,52 +733,49 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error marking game as complete: {e}", exc_info=True)
             raise ValueError(f"Error marking game as complete: {str(e)}")
 
-    @database_sync_to_async
-    def mark_game_as_completed(self, game_id, player_id):
+    async def mark_game_as_completed(self, game_id, player_id):
         """Mark game as completed and store completion time and player"""
         try:
-            game = Game.objects.get(id=game_id)
-            player = Player.objects.get(id=player_id)
-            
-            game.is_complete = True
-            game.completed_at = timezone.now()
-            game.completed_by = player
-            game.save()
+            player = await Player.objects.aget(id=player_id)
+            updated = await Game.objects.filter(id=game_id).aupdate(
+                is_complete=True,
+                completed_at=timezone.now(),
+                completed_by=player,
+                last_activity=timezone.now(),
+                version=F('version') + 1
+            )
+            if updated:
+                await anotify_lobby(game_id)
             
-            return True
-        except (Game.DoesNotExist, Player.DoesNotExist):
+            return updated > 0
+        except (ValidationError, Player.DoesNotExist):
             return False
             
-    @database_sync_to_async
-    def remove_player_from_game(self, game_id, player_id):
+    async def remove_player_from_game(self, game_id, player_id):
         """Remove player from game and return count of remaining players"""
         try:
-            game = Game.objects.get(id=game_id)
-            player = Player.objects.filter(id=player_id, game=game).first()
-            
-            if player:
-                player.delete()
+            await Player.objects.filter(id=player_id, game_id=game_id).adelete()
                 
             # return count of remaining players
-            return Player.objects.filter(game=game).count()
-        except Game.DoesNotExist:
+            return await Player.objects.filter(game_id=game_id).acount()
+        except ValidationError:
             return 0
             
-    @database_sync_to_async
-    def delete_game(self, game_id):
+    async def delete_game(self, game_id):
         """Delete a game completely"""
         try:
-            game = Game.objects.get(id=game_id)
-            game.delete()
-            return True
-        except Game.DoesNotExist:
+            deleted, _ = await Game.objects.filter(id=game_id).adelete()
+            return deleted > 0
+        except ValidationError:
             return False
 
-    @database_sync_to_async
+    @db_sync_to_async
+    @transaction.atomic
     def save_move(self, player_id, row, column, value):
         try:
             player = Player.objects.get(id=player_id)
-            game = player.game
+            # lock the game row, concurrent moves must not overwrite each other's board
+            game = Game.objects.select_for_update().get(id=player.game_id)
             
             # check if cell is part of the initial board
             if game.initial_board[row][column] != 0:
@@ -609,7 +799,7 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             current_board = game.current_board
             current_board[row][column] = value
             game.current_board = current_board
-            game.save()
+            game.save(bump_version=True)
             
             # create move
             move = Move.objects.create(
@@ -637,7 +827,7 @@ class SudokuConsumer(AsyncWebsocketConsumer):
                 game.is_complete = True
                 game.completed_at = timezone.now()
                 game.completed_by = player
-                game.save()
+                game.save(bump_version=True)
             
             # return serialized data
             return {
@@ -665,11 +855,12 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error saving move: {e}", exc_info=True)
             raise
 
-    @database_sync_to_async
+    @db_sync_to_async
+    @transaction.atomic
     def process_hint_request(self, player_id, row, column):
         try:
             player = Player.objects.get(id=player_id)
-            game = player.game
+            game = Game.objects.select_for_update().get(id=player.game_id)
             
             # check if cell is part of the initial board
             if game.initial_board[row][column] != 0:
@@ -696,7 +887,7 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             current_board = game.current_board
             current_board[row][column] = correct_value
             game.current_board = current_board
-            game.save()
+            game.save(bump_version=True)
             
             # check if the game is complete after this move
             is_game_complete = True
@@ -714,7 +905,7 @@ class SudokuConsumer(AsyncWebsocketConsumer):
                 game.is_complete = True
                 game.completed_at = timezone.now()
                 game.completed_by = player
-                game.save()
+                game.save(bump_version=True)
                 
             # return the hint data and move info
             return {
@@ -745,41 +936,173 @@ class SudokuConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error processing hint: {e}", exc_info=True)
             raise ValueError(f"Error processing hint: {str(e)}")
     
-    @database_sync_to_async
-    def get_player_data(self, player_id):
+    async def get_player_data(self, player_id):
         try:
-            player = Player.objects.get(id=player_id)
+            player = await Player.objects.aget(id=player_id)
             return {
                 'id': str(player.id),
                 'name': player.name,
                 'color': player.color,
                 'is_host': player.is_host
             }
-        except Player.DoesNotExist:
+        except (Player.DoesNotExist, ValidationError):
             logger.error(f"Player {player_id} not found")
             return None
     
-    @database_sync_to_async
-    def get_all_players(self):
+    @db_sync_to_async
+    def get_game_snapshot(self):
+        """Full game state for clients that cannot resume from the event log"""
         try:
-            # use select_related to optimize the query and get the most recent data
-            game = Game.objects.get(id=self.game_id)
-            players = Player.objects.filter(game=game).order_by('id')
-            
-            # no longer manually closing connection as it's managed by Django
-            
-            return [
-                {
-                    'id': str(player.id),
-                    'name': player.name,
-                    'color': player.color,
-                    'is_host': player.is_host
-                }
-                for player in players
-            ]
+            game = Game.objects.prefetch_related('players', 'moves__player').get(id=self.game_id)
+            return GameSerializer(game).data
         except Game.DoesNotExist:
             logger.error(f"Game {self.game_id} not found")
-            return []
+            return None
+
+    async def get_all_players(self):
+        """
+        Return the player list and its roster version
+
+        The list comes from the room's cached roster when possible. The
+        version is None when the roster is not cached in this process.
+        """
+        roster = get_roster(self.game_id) if room_is_local(self.game_id) else None
+        if roster is not None and roster.players is not None:
+            return roster.as_list(), roster.version
+
+        try:
+            version = roster.version if roster is not None else None
+            players = [
+                player_data(player)
+                async for player in Player.objects.filter(game_id=self.game_id).order_by('id')
+            ]
         except Exception as e:
             logger.error(f"Error getting players: {e}", exc_info=True)
-            return []
+            return [], None
+
+        if roster is not None:
+            # a join or leave while reading makes the list stale, don't cache it
+            roster.load(players, version)
+        return players, version
+
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """
+    Read-only view of a game room
+
+    Spectators never join the room's group or touch the Player table. They
+    get the room's current board on connect, then at most one shared
+    'spectator_snapshot' per SPECTATOR_SNAPSHOT_INTERVAL_MS while the board
+    changes (see spectators.py). Anything they send other than a heartbeat
+    is ignored.
+    """
+
+    async def connect(self):
+        self.game_id = self.scope['url_route']['kwargs']['game_id']
+        self.last_seen = asyncio.get_running_loop().time()
+        self.use_msgpack = MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.joined = False
+
+        try:
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.use_msgpack else None)
+
+            # spectators follow the room to its owner, where the board is pushed
+            redirect_url = get_router().redirect_url(self.game_id, self.scope['path'])
+            if redirect_url:
+                metrics.incr('affinity.redirects')
+                await self.redirect(redirect_url)
+                return
+
+            snapshot = await get_spectator_hub().join(self.game_id, self)
+            if snapshot is None:
+                logger.error(f"Game {self.game_id} not found")
+                await self.close(code=GAME_NOT_FOUND_CLOSE_CODE)
+                return
+            self.joined = True
+
+            get_heartbeat_wheel().register(self)
+            await self.send_event(snapshot)
+
+        except asyncio.CancelledError:
+            logger.info(f"Spectator connection cancelled for game {self.game_id}")
+            await self.close(code=1000)
+        except Exception as e:
+            logger.error(f"Error in spectator connect: {e}", exc_info=True)
+            await self.close(code=4000)
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'joined', False):
+            get_spectator_hub().leave(self.game_id, self)
+        get_heartbeat_wheel().unregister(self)
+        await aclose_old_connections()
+        raise StopConsumer()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # spectators only send heartbeats, which prove they are alive
+        self.last_seen = asyncio.get_running_loop().time()
+
+    async def redirect(self, url):
+        """Send the spectator to the worker that owns this room and close"""
+        await self.send_message({'type': 'redirect', 'url': url})
+        await self.close(code=ROOM_REDIRECT_CLOSE_CODE)
+
+    async def send_message(self, message):
+        """Encode a message for this client only and send it"""
+        if self.use_msgpack:
+            await self.send(bytes_data=encode_compact(message))
+        else:
+            await self.send(text_data=encode_message(message))
+
+    async def send_event(self, event):
+        """Send a pre-encoded event in this client's wire format"""
+        if self.use_msgpack:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
+
+
+class LobbyConsumer(AsyncWebsocketConsumer):
+    """
+    Live list of joinable games
+
+    Sends a 'lobby_snapshot' on connect, then the 'room_added',
+    'room_updated' and 'room_removed' events of each lobby tick (see
+    lobby.py). Anything the client sends other than a heartbeat is ignored.
+    """
+
+    async def connect(self):
+        self.last_seen = asyncio.get_running_loop().time()
+        self.joined = False
+
+        try:
+            await self.accept()
+            snapshot = await get_lobby_hub().join(self)
+            self.joined = True
+
+            get_heartbeat_wheel().register(self)
+            await self.send_text(snapshot)
+
+        except asyncio.CancelledError:
+            logger.info("Lobby connection cancelled")
+            await self.close(code=1000)
+        except Exception as e:
+            logger.error(f"Error in lobby connect: {e}", exc_info=True)
+            await self.close(code=4000)
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'joined', False):
+            get_lobby_hub().leave(self)
+        get_heartbeat_wheel().unregister(self)
+        await aclose_old_connections()
+        raise StopConsumer()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # lobby clients only send heartbeats, which prove they are alive
+        self.last_seen = asyncio.get_running_loop().time()
+
+    async def send_text(self, text):
+        await self.send(text_data=text)
+
+    async def send_event(self, event):
+        """Send a pre-encoded event, e.g. a heartbeat"""
+        await self.send(text_data=event['text'])
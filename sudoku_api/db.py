@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from . import metrics
+
+"""
+db.py - Dedicated executor for synchronous database work in consumers
+
+Simple lookups in the consumer use Django's async ORM directly. Sections
+that must stay synchronous (multi-statement transactions, serializers) run
+through db_sync_to_async, which uses a thread pool of DB_EXECUTOR_WORKERS
+threads reserved for the WebSocket worker instead of the shared default
+executor. The pool reports how many calls are queued and running, so
+saturation shows up under 'db_executor' in /api/metrics/.
+
+When DB_POOL is enabled, the psycopg connection pool statistics (including
+how long requests waited to check out a connection) are reported under
+'db_pool'.
+
+advisory_lock() elects a single runner for jobs several processes may
+start, such as the reconciliation sweep of expired rooms. It is PostgreSQL
+only; elsewhere nobody is elected and those jobs are skipped.
+"""
+
+# advisory lock ids, one per job
+CLEANUP_LOCK_ID = 5_318_008_049
+ARCHIVE_LOCK_ID = 5_318_008_050
+
+
+class MeasuredThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that keeps track of its queue depth"""
+
+    def __init__(self, max_workers, thread_name_prefix=''):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.peak_pending = 0
+        self.completed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        return super().submit(self.measure, fn, *args, **kwargs)
+
+    def measure(self, fn, *args, **kwargs):
+        with self.lock:
+            self.pending -= 1
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_workers': self._max_workers,
+                'queued': self.pending,
+                'running': self.running,
+                'peak_queued': self.peak_pending,
+                'completed': self.completed
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    """Return the executor reserved for consumer database work"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = MeasuredThreadPoolExecutor(
+                settings.DB_EXECUTOR_WORKERS,
+                thread_name_prefix='sudoku-db'
+            )
+            metrics.register_gauge('db_executor', _executor.stats)
+    return _executor
+
+
+def pool_stats():
+    """Usage statistics of the database connection pool, if pooling is enabled"""
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return {'enabled': False}
+
+    stats = pool.get_stats()
+    return {
+        'enabled': True,
+        'min_size': pool.min_size,
+        'max_size': pool.max_size,
+        'size': stats.get('pool_size', 0),
+        'available': stats.get('pool_available', 0),
+        'waiting': stats.get('requests_waiting', 0),
+        'checkouts': stats.get('requests_num', 0),
+        'checkouts_queued': stats.get('requests_queued', 0),
+        'checkout_wait_ms_total': stats.get('requests_wait_ms', 0),
+        'checkout_errors': stats.get('requests_errors', 0),
+        'failed_health_checks': stats.get('connections_lost', 0),
+    }
+
+
+def db_sync_to_async(func):
+    """
+    database_sync_to_async, but running on the dedicated database executor
+
+    Like channels' helper, stale connections are closed before and after
+    each call according to CONN_MAX_AGE.
+    """
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=get_db_executor())
+
+
+@contextmanager
+def advisory_lock(lock_id, using=DEFAULT_DB_ALIAS):
+    """
+    Try to take a PostgreSQL session advisory lock; yields whether it was taken
+
+    Never waits: a caller that does not get the lock should skip its work.
+    Other databases have no advisory locks, so no caller can tell it is the
+    only one and the lock is never taken there.
+    """
+    conn = connections[using]
+    if conn.vendor != 'postgresql':
+        yield False
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [lock_id])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id])
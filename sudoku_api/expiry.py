@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import metrics
+from .db import db_sync_to_async
+from .lobby import notify_lobby
+from .models import Game, Move, Player
+from .roster import discard_roster
+from .rooms import discard_event_log, room_has_sockets, room_is_local
+
+"""
+expiry.py - Event-driven expiry of abandoned game rooms
+
+Instead of sweeping the whole games table every few minutes, each worker
+expires the rooms it hosts when they are abandoned:
+- When the last socket of a room disconnects, a timer of
+  ROOM_EXPIRY_SECONDS is started for it
+- A socket joining the room again cancels the timer
+- When the timer fires, the game is deleted (set-based, see delete_games)
+  if it is still incomplete and nothing touched it since, and the room's
+  event log and roster are dropped
+
+Timers only run for rooms whose sockets all live in this process (see
+rooms.room_is_local); other rooms cannot tell from here that they are empty.
+
+Games no timer catches (worker restarts, games created over REST that never
+had a socket, rooms spread over several workers) are left to the
+reconciliation sweep, cleanup_inactive_games --if-leader, which
+scheduler.py runs every ROOM_SWEEP_INTERVAL_SECONDS (and cron once a day)
+together with archive_completed_games. Workers never sweep, so cleanup
+costs follow the rate at which rooms are abandoned rather than the size of
+the table.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def delete_games(game_ids, using):
+    """
+    Delete games with their players and moves; returns {model name: rows}
+
+    Set-based: nothing is loaded and no per-object signals are sent, so the
+    lobby is told directly. Must run inside a transaction.
+    """
+    Game.objects.filter(id__in=game_ids, completed_by__isnull=False).update(completed_by=None)
+    deleted = {
+        'moves': Move.objects.filter(game_id__in=game_ids)._raw_delete(using),
+        'players': Player.objects.filter(game_id__in=game_ids)._raw_delete(using),
+        'games': Game.objects.filter(id__in=game_ids)._raw_delete(using),
+    }
+    for game_id in game_ids:
+        notify_lobby(game_id)
+    return deleted
+
+
+def expire_game(game_id, cutoff_time):
+    """Delete a game unless it is complete or was saved since the cutoff time"""
+    using = router.db_for_write(Game)
+    with transaction.atomic(using=using):
+        # a game a move is being saved on is busy, not abandoned
+        game_ids = list(
+            Game.objects.filter(id=game_id, is_complete=False, last_activity__lt=cutoff_time)
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)
+        )
+        if not game_ids:
+            return False
+        delete_games(game_ids, using)
+    return True
+
+
+class RoomExpiry:
+    def __init__(self, delay):
+        self.delay = delay
+        # game id -> timer handle
+        self.timers = {}
+        self.tasks = set()
+        self.expired = 0
+
+    def stats(self):
+        return {
+            'timers': len(self.timers),
+            'expired': self.expired
+        }
+
+    def room_joined(self, game_id):
+        """A socket joined the room, it is not abandoned"""
+        timer = self.timers.pop(str(game_id), None)
+        if timer is not None:
+            timer.cancel()
+
+    def room_left(self, game_id):
+        """A socket left the room, start the timer if it was the last one"""
+        game_id = str(game_id)
+        if not self.delay or game_id in self.timers:
+            return
+        if room_has_sockets(game_id) or not room_is_local(game_id):
+            return
+        self.timers[game_id] = asyncio.get_running_loop().call_later(
+            self.delay, self.fire, game_id
+        )
+
+    def fire(self, game_id):
+        self.timers.pop(game_id, None)
+        task = asyncio.get_running_loop().create_task(self.expire(game_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def expire(self, game_id):
+        # someone came back while the timer was firing
+        if room_has_sockets(game_id) or not room_is_local(game_id):
+            return
+        cutoff_time = timezone.now() - timedelta(seconds=self.delay)
+        try:
+            deleted = await db_sync_to_async(expire_game)(game_id, cutoff_time)
+        except Exception as e:
+            logger.error(f"Error expiring game {game_id}: {e}", exc_info=True)
+            return
+        if deleted:
+            discard_event_log(game_id)
+            discard_roster(game_id)
+            self.expired += 1
+            metrics.incr('room_expiry.expired')
+            logger.info(f"Expired abandoned game {game_id}")
+
+
+_expiry = None
+
+
+def get_room_expiry():
+    """Return the room expiry timers of this process"""
+    global _expiry
+    if _expiry is None:
+        _expiry = RoomExpiry(settings.ROOM_EXPIRY_SECONDS)
+        metrics.register_gauge('room_expiry', _expiry.stats)
+    return _expiry
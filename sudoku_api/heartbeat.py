@@ -0,0 +1,111 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from .protocol import room_event
+
+"""
+heartbeat.py - Process-wide heartbeat scheduler for WebSocket connections
+
+Instead of one sleeping asyncio task per socket, every connection is
+registered in a single timing wheel:
+- The wheel has a fixed number of slots covering one heartbeat interval
+- One task advances the wheel a slot at a time and pings every connection
+  in that slot, so pings are spread evenly across the interval
+- The ping is encoded once per tick and shared by all connections
+- Connections that have not sent anything within the timeout are closed
+
+The wheel task only runs while at least one connection is registered.
+"""
+
+logger = logging.getLogger(__name__)
+
+# close code used when a peer stops responding
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 4001
+
+
+class HeartbeatWheel:
+    def __init__(self, interval, slots, timeout):
+        self.interval = interval
+        self.slots = [set() for _ in range(slots)]
+        self.slot_of = {}
+        self.timeout = timeout
+        self.cursor = 0
+        self.task = None
+        self.loop = None
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def register(self, connection):
+        """
+        Start sending heartbeats to a connection
+
+        The connection must provide last_seen (loop time of the last
+        message it received), send_event(event) and close(code).
+        """
+        # the slot just visited is the one furthest away from the next ping
+        slot = (self.cursor - 1) % len(self.slots)
+        self.slots[slot].add(connection)
+        self.slot_of[connection] = slot
+
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.loop is not loop:
+            self.loop = loop
+            self.task = loop.create_task(self.run())
+
+    def unregister(self, connection):
+        """Stop sending heartbeats to a connection"""
+        slot = self.slot_of.pop(connection, None)
+        if slot is not None:
+            self.slots[slot].discard(connection)
+
+    async def run(self):
+        tick = self.interval / len(self.slots)
+        try:
+            while self.slot_of:
+                await asyncio.sleep(tick)
+                self.cursor = (self.cursor + 1) % len(self.slots)
+                bucket = self.slots[self.cursor]
+                if bucket:
+                    await self.beat(list(bucket))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Heartbeat scheduler error: {e}", exc_info=True)
+
+    async def beat(self, connections):
+        """Ping a bucket of connections and close the ones that went silent"""
+        now = asyncio.get_running_loop().time()
+        event = room_event('heartbeat', {
+            'type': 'heartbeat',
+            'timestamp': timezone.now().isoformat()
+        })
+
+        for connection in connections:
+            try:
+                if now - connection.last_seen > self.timeout:
+                    logger.info("Closing WebSocket connection after heartbeat timeout")
+                    self.unregister(connection)
+                    await connection.close(code=HEARTBEAT_TIMEOUT_CLOSE_CODE)
+                else:
+                    await connection.send_event(event)
+            except Exception as e:
+                logger.error(f"Heartbeat error: {e}", exc_info=True)
+
+
+_wheel = None
+
+
+def get_heartbeat_wheel():
+    """Return the heartbeat scheduler shared by all connections in this process"""
+    global _wheel
+    if _wheel is None:
+        _wheel = HeartbeatWheel(
+            settings.HEARTBEAT_INTERVAL_SECONDS,
+            settings.HEARTBEAT_WHEEL_SLOTS,
+            settings.HEARTBEAT_TIMEOUT_SECONDS
+        )
+    return _wheel
@@ -0,0 +1,301 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import MAX_PLAYERS, Game, Player
+from .protocol import encode_message
+from .room_names import forget_game, forget_name
+
+"""
+lobby.py - Push-based list of joinable games for ws/lobby/
+
+Instead of every visitor polling /api/games/available/, lobby sockets get
+the list once and then only the changes:
+- Creating or deleting a game, changing one of its lobby columns, or
+  saving or deleting one of its players sends the game's id to the 'lobby'
+  channel layer group once the transaction commits (notify_lobby). Saves
+  that only touch the boards are not announced. Queryset updates, which
+  send no signals, call notify_lobby themselves
+- Each process has one LobbyHub listening on that group. It collects the
+  changed ids and, every LOBBY_TICK_MS, reads just those games in one
+  query, compares them with its copy of the lobby and sends 'room_added',
+  'room_updated' and 'room_removed' events
+- The events of a tick are encoded once, as a single frame (a 'batch' when
+  there are several), and the same text is written to every lobby socket
+
+A tick without changes costs nothing, and a tick with changes costs one
+query and one encode, so the lobby scales with the rate of changes rather
+than with the number of visitors. A new socket gets the hub's cached
+'lobby_snapshot'.
+"""
+
+logger = logging.getLogger(__name__)
+
+LOBBY_GROUP = 'lobby'
+
+# columns of a lobby entry, the same as GameViewSet.available()
+LOBBY_FIELDS = ['id', 'host_name', 'difficulty', 'player_count', 'created_at', 'is_complete', 'room_name']
+
+
+def lobby_entry(row):
+    """Lobby entry of a game from a values() row"""
+    return {
+        'id': str(row['id']),
+        'host_name': row['host_name'] or "Unknown",
+        'difficulty': row['difficulty'],
+        'player_count': row['player_count'],
+        'created_at': row['created_at'].isoformat(),
+        'is_complete': row['is_complete'],
+        'room_name': row['room_name']
+    }
+
+
+def is_joinable(row):
+    # same conditions as GameQuerySet.joinable
+    return row['is_active'] and not row['is_complete'] and row['player_count'] <= MAX_PLAYERS
+
+
+class LobbyHub:
+    def __init__(self, interval):
+        self.interval = interval
+        self.consumers = set()
+        # game id -> lobby entry, None until loaded from the database
+        self.entries = None
+        # ids of games that changed since the last tick
+        self.changed = set()
+        self.snapshot_text = None
+        self.tasks = []
+        self.loop = None
+        # joins the 'lobby' group and starts the tasks, see start()
+        self.subscribed = None
+
+    def stats(self):
+        return {
+            'sockets': len(self.consumers),
+            'rooms': len(self.entries) if self.entries is not None else None
+        }
+
+    async def join(self, consumer):
+        """
+        Add a lobby socket and return the encoded lobby snapshot
+
+        The consumer must provide send_text(text).
+        """
+        self.consumers.add(consumer)
+        await self.start()
+        if self.entries is None:
+            rows = [row async for row in Game.objects.joinable().values(*LOBBY_FIELDS)]
+            if self.entries is None:
+                self.entries = {str(row['id']): lobby_entry(row) for row in rows}
+        return self.snapshot()
+
+    def leave(self, consumer):
+        self.consumers.discard(consumer)
+
+    def snapshot(self):
+        """Encoded list of every joinable game, encoded again only after a change"""
+        if self.snapshot_text is None:
+            rooms = sorted(self.entries.values(), key=lambda entry: entry['created_at'], reverse=True)
+            self.snapshot_text = encode_message({
+                'type': 'lobby_snapshot',
+                'rooms': rooms
+            })
+        return self.snapshot_text
+
+    async def start(self):
+        """Start listening for changes and sending ticks on the running loop"""
+        loop = asyncio.get_running_loop()
+        failed = self.subscribed is not None and self.subscribed.done() and not self.tasks
+        if self.loop is not loop or failed or any(task.done() for task in self.tasks):
+            self.loop = loop
+            # a new loop (or a crash) may have missed changes, reload
+            self.entries = None
+            self.snapshot_text = None
+            self.tasks = []
+            self.subscribed = loop.create_task(self.subscribe())
+        # in the group before the caller reads the lobby, or a change
+        # committed in between would never be announced
+        await asyncio.shield(self.subscribed)
+
+    async def subscribe(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(LOBBY_GROUP, channel)
+        loop = asyncio.get_running_loop()
+        self.tasks = [
+            loop.create_task(self.listen(channel)),
+            loop.create_task(self.run()),
+        ]
+        # the group membership expires on shared layers
+        group_expiry = getattr(layer, 'group_expiry', None)
+        if group_expiry:
+            self.tasks.append(loop.create_task(self.renew(channel, group_expiry / 2)))
+        return channel
+
+    async def listen(self, channel):
+        layer = get_channel_layer()
+        while True:
+            try:
+                event = await layer.receive(channel)
+                self.changed.add(event['game_id'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error receiving lobby change: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def renew(self, channel, interval):
+        # renew the group membership well before it expires, on a timer, as
+        # a quiet lobby may receive no change for longer than that
+        layer = get_channel_layer()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await layer.group_add(LOBBY_GROUP, channel)
+            except Exception as e:
+                logger.error(f"Error renewing the lobby group: {e}", exc_info=True)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Error sending lobby update: {e}", exc_info=True)
+
+    async def tick(self):
+        """Turn the games changed since the last tick into one lobby frame"""
+        if not self.changed or self.entries is None:
+            return
+        game_ids, self.changed = self.changed, set()
+        rows = {
+            str(row['id']): row
+            async for row in Game.objects.filter(id__in=game_ids).values(*LOBBY_FIELDS, 'is_active')
+        }
+
+        events = []
+        for game_id in sorted(game_ids):
+            row = rows.get(game_id)
+            if row is not None and is_joinable(row):
+                entry = lobby_entry(row)
+                known = self.entries.get(game_id)
+                if known is None:
+                    events.append({'type': 'room_added', 'room': entry})
+                elif known != entry:
+                    events.append({'type': 'room_updated', 'room': entry})
+                else:
+                    continue
+                self.entries[game_id] = entry
+            elif self.entries.pop(game_id, None) is not None:
+                events.append({'type': 'room_removed', 'id': game_id})
+
+        if not events:
+            return
+        self.snapshot_text = None
+        metrics.incr('lobby.events', len(events))
+        if not self.consumers:
+            return
+
+        if len(events) == 1:
+            text = encode_message(events[0])
+        else:
+            text = encode_message({'type': 'batch', 'events': events})
+        consumers = list(self.consumers)
+        metrics.incr('lobby.frames', len(consumers))
+        for consumer in consumers:
+            try:
+                await consumer.send_text(text)
+            except Exception as e:
+                logger.error(f"Error sending lobby update: {e}", exc_info=True)
+
+
+_hub = None
+
+
+def get_lobby_hub():
+    """Return the lobby hub shared by all lobby sockets in this process"""
+    global _hub
+    if _hub is None:
+        _hub = LobbyHub(settings.LOBBY_TICK_MS / 1000)
+        metrics.register_gauge('lobby', _hub.stats)
+    return _hub
+
+
+def send_lobby_change(game_id):
+    try:
+        async_to_sync(get_channel_layer().group_send)(LOBBY_GROUP, {
+            'type': 'lobby.changed',
+            'game_id': str(game_id),
+        })
+    except Exception as e:
+        logger.error(f"Error notifying the lobby: {e}", exc_info=True)
+
+
+def lobby_changed(game_id):
+    # the cached room name lookup shows the same columns
+    forget_game(game_id)
+    send_lobby_change(game_id)
+
+
+def notify_lobby(game_id):
+    """Tell every lobby hub that a game may have changed, once committed"""
+    # dropped from the room name cache only then too, or a lookup racing
+    # the transaction could cache the old row again
+    transaction.on_commit(lambda: lobby_changed(game_id))
+
+
+async def anotify_lobby(game_id):
+    """notify_lobby() for async code outside a transaction"""
+    forget_game(game_id)
+    try:
+        await get_channel_layer().group_send(LOBBY_GROUP, {
+            'type': 'lobby.changed',
+            'game_id': str(game_id),
+        })
+    except Exception as e:
+        logger.error(f"Error notifying the lobby: {e}", exc_info=True)
+
+
+def lobby_state(game):
+    # Game columns shown in the lobby, the roster columns change with players
+    return (game.is_active, game.is_complete, game.room_name, game.difficulty)
+
+
+@receiver(post_init, sender=Game)
+def remember_lobby_state(sender, instance, **kwargs):
+    if not instance.get_deferred_fields():
+        instance._lobby_state = lobby_state(instance)
+
+
+@receiver(post_save, sender=Game)
+def notify_lobby_on_game_save(sender, instance, created, **kwargs):
+    # most saves are moves, which the lobby does not show
+    previous = getattr(instance, '_lobby_state', None)
+    if created or previous is None or previous != lobby_state(instance):
+        instance._lobby_state = lobby_state(instance)
+        notify_lobby(instance.id)
+        # a new game (or a renamed one) takes over its name from older games
+        names = {instance.room_name, previous[2] if previous else None} - {None, ''}
+        for room_name in names:
+            transaction.on_commit(lambda room_name=room_name: forget_name(room_name))
+
+
+@receiver(post_delete, sender=Game)
+def notify_lobby_on_game_delete(sender, instance, **kwargs):
+    notify_lobby(instance.id)
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def notify_lobby_on_player_change(sender, instance, origin=None, **kwargs):
+    # a deleted game is announced once, not once per player
+    if isinstance(origin, Game) or getattr(origin, 'model', None) is Game:
+        return
+    notify_lobby(instance.game_id)
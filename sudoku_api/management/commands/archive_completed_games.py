@@ -0,0 +1,113 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.utils import timezone
+from sudoku_api.archive import archive_chunk, completed_games
+from sudoku_api.db import ARCHIVE_LOCK_ID, advisory_lock
+from sudoku_api.models import Game
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Moves completed games into the compressed archive after a specified number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Days since completion before a game is archived (ARCHIVE_AFTER_DAYS by default)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be archived without actually archiving'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Games archived per transaction'
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            default=60,
+            help='Stop starting new chunks after this many seconds (0 = no limit)'
+        )
+        parser.add_argument(
+            '--if-leader',
+            action='store_true',
+            help='Skip the run unless no other process is running it (PostgreSQL advisory lock, always skipped on other databases)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['if_leader']:
+            self.archive(options)
+            return
+
+        with advisory_lock(ARCHIVE_LOCK_ID, using=router.db_for_write(Game)) as leader:
+            if not leader:
+                self.stdout.write("Not the leader (another process holds the lock, or the database has no advisory locks), skipping this run")
+                return
+            self.archive(options)
+
+    def archive(self, options):
+        dry_run = options['dry_run']
+        chunk_size = options['chunk_size']
+        time_budget = options['time_budget']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        days = options['days'] if options['days'] is not None else settings.ARCHIVE_AFTER_DAYS
+        cutoff_time = timezone.now() - timedelta(days=days)
+
+        if dry_run:
+            games = completed_games(cutoff_time)
+            self.stdout.write(f"Would archive {games.count()} completed games")
+            for game in games.only('id', 'completed_at')[:chunk_size]:
+                self.stdout.write(f"  - Game ID: {game.id}, Completed: {game.completed_at}")
+            return
+
+        start = time.monotonic()
+        totals = {'games': 0, 'players': 0, 'moves': 0}
+        chunks = 0
+        out_of_time = False
+        while True:
+            if time_budget and time.monotonic() - start >= time_budget:
+                out_of_time = True
+                break
+
+            archived = archive_chunk(cutoff_time, chunk_size)
+            if not archived:
+                break
+            chunks += 1
+            for name, rows in archived.items():
+                totals[name] += rows
+            if archived['games'] < chunk_size:
+                break
+
+        elapsed = time.monotonic() - start
+        rows = sum(totals.values())
+        rate = rows / elapsed if elapsed else 0
+        logger.info(
+            f"Archived {totals['games']} completed games ({totals['players']} players, "
+            f"{totals['moves']} moves) in {chunks} chunks, {elapsed:.2f}s. "
+            f"Completed before {cutoff_time}"
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully archived {totals['games']} completed games "
+                f"({totals['players']} players, {totals['moves']} moves) in {chunks} chunks, "
+                f"{elapsed:.2f}s, {rate:.0f} rows/s"
+            )
+        )
+        if out_of_time:
+            self.stdout.write(self.style.WARNING(
+                f"Time budget of {time_budget:g}s used up, the remaining games are left for the next run"
+            ))
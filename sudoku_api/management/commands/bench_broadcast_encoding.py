@@ -0,0 +1,90 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sudoku_api.protocol import encode_message, orjson
+
+
+class Command(BaseCommand):
+    help = 'Measures the cost of encoding room broadcasts once per room versus once per recipient'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--room-sizes',
+            type=str,
+            default='2,5,10',
+            help='Comma separated list of players per room to measure'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10000,
+            help='Number of broadcasts to encode for each room size'
+        )
+
+    def sample_messages(self):
+        """Build one message of each frequently broadcast type"""
+        player = {
+            'id': str(uuid.uuid4()),
+            'name': 'Player',
+            'color': '#3498db',
+            'is_host': False
+        }
+        return [
+            {
+                'type': 'move',
+                'move': {
+                    'id': '1234',
+                    'player': player,
+                    'row': 4,
+                    'column': 7,
+                    'value': 3,
+                    'is_correct': True,
+                    'timestamp': timezone.now().isoformat(),
+                    'game_complete': False
+                }
+            },
+            {
+                'type': 'cell_focus',
+                'player_id': player['id'],
+                'player': player,
+                'row': 4,
+                'column': 7,
+                'focus_type': 'focus'
+            },
+            {
+                'type': 'player_list_update',
+                'players': [dict(player, id=str(uuid.uuid4())) for _ in range(10)]
+            },
+        ]
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        room_sizes = [int(size) for size in options['room_sizes'].split(',')]
+        messages = self.sample_messages()
+
+        encoder = 'orjson' if orjson is not None else 'json'
+        self.stdout.write(f"Encoder: {encoder}, {iterations} broadcasts per room size")
+
+        for size in room_sizes:
+            # previous behaviour: every receiving consumer called json.dumps
+            start = time.perf_counter()
+            for i in range(iterations):
+                message = messages[i % len(messages)]
+                for _ in range(size):
+                    json.dumps(message)
+            per_recipient = time.perf_counter() - start
+
+            # current behaviour: the sender encodes once for the whole room
+            start = time.perf_counter()
+            for i in range(iterations):
+                encode_message(messages[i % len(messages)])
+            per_room = time.perf_counter() - start
+
+            self.stdout.write(
+                f"  {size:>3} players: per-recipient {per_recipient / iterations * 1e6:8.2f} us/broadcast, "
+                f"per-room {per_room / iterations * 1e6:8.2f} us/broadcast "
+                f"({per_recipient / per_room:.1f}x)"
+            )
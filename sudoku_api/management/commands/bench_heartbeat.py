@@ -0,0 +1,106 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sudoku_api.heartbeat import HeartbeatWheel
+
+
+class IdleConnection:
+    """Stand-in for an idle consumer, only tracks what the heartbeat needs"""
+
+    def __init__(self, loop):
+        self.last_seen = loop.time()
+        self.pings = 0
+
+    async def send_event(self, event):
+        self.pings += 1
+
+    async def close(self, code=None):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Measures heartbeat memory per idle connection: one task per socket versus the shared timing wheel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=10000,
+            help='Number of idle connections to simulate'
+        )
+
+    async def measure_tasks(self, connections):
+        """Previous behaviour: every connection owns a sleeping heartbeat task"""
+        async def send_heartbeat():
+            while True:
+                await asyncio.sleep(settings.HEARTBEAT_INTERVAL_SECONDS)
+
+        loop = asyncio.get_running_loop()
+        peers = [IdleConnection(loop) for _ in range(connections)]
+
+        gc.collect()
+        tracemalloc.start()
+        tasks = [asyncio.create_task(send_heartbeat()) for _ in peers]
+        # let every task reach its first sleep so its timer exists
+        await asyncio.sleep(0)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return used
+
+    async def measure_wheel(self, connections):
+        """Current behaviour: connections are registered in one timing wheel"""
+        loop = asyncio.get_running_loop()
+        peers = [IdleConnection(loop) for _ in range(connections)]
+        wheel = HeartbeatWheel(
+            settings.HEARTBEAT_INTERVAL_SECONDS,
+            settings.HEARTBEAT_WHEEL_SLOTS,
+            settings.HEARTBEAT_TIMEOUT_SECONDS
+        )
+
+        gc.collect()
+        tracemalloc.start()
+        for peer in peers:
+            wheel.register(peer)
+        await asyncio.sleep(0)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # time one full rotation of pings, without the sleeps between ticks
+        start = time.perf_counter()
+        for bucket in wheel.slots:
+            await wheel.beat(list(bucket))
+        rotation = time.perf_counter() - start
+
+        wheel.task.cancel()
+        return used, rotation
+
+    async def run(self, connections):
+        task_bytes = await self.measure_tasks(connections)
+        wheel_bytes, rotation = await self.measure_wheel(connections)
+        return task_bytes, wheel_bytes, rotation
+
+    def handle(self, *args, **options):
+        connections = options['connections']
+        task_bytes, wheel_bytes, rotation = asyncio.run(self.run(connections))
+
+        self.stdout.write(f"Heartbeat overhead for {connections} idle connections")
+        self.stdout.write(
+            f"  task per connection: {task_bytes / 1024:10.1f} KiB "
+            f"({task_bytes / connections:7.1f} bytes/connection)"
+        )
+        self.stdout.write(
+            f"  shared timing wheel: {wheel_bytes / 1024:10.1f} KiB "
+            f"({wheel_bytes / connections:7.1f} bytes/connection)"
+        )
+        self.stdout.write(
+            f"  one full wheel rotation: {rotation * 1000:.1f} ms "
+            f"({rotation / connections * 1e6:.2f} us/ping)"
+        )
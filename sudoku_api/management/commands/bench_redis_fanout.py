@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from django.core.management.base import BaseCommand, CommandError
+
+
+def group_name(room):
+    return f'bench_fanout_{room}'
+
+
+async def receive_room_events(rooms, clients, ready, timeout):
+    """Join every room with a number of channels and time what arrives"""
+    # every process needs its own layer instance and connections
+    layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+    channels = []
+    for room in range(rooms):
+        for _ in range(clients):
+            channel = await layer.new_channel()
+            await layer.group_add(group_name(room), channel)
+            channels.append(channel)
+    ready.set()
+
+    latencies = []
+
+    async def listen(channel):
+        while True:
+            message = await layer.receive(channel)
+            if message['type'] == 'bench.done':
+                return
+            latencies.append(time.time() - message['sent'])
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(listen(channel) for channel in channels)),
+            timeout
+        )
+    except asyncio.TimeoutError:
+        pass
+
+    for index, channel in enumerate(channels):
+        await layer.group_discard(group_name(index // clients), channel)
+    return latencies
+
+
+def worker_main(rooms, clients, ready, results, timeout):
+    latencies = asyncio.run(receive_room_events(rooms, clients, ready, timeout))
+    results.put(latencies)
+
+
+class Command(BaseCommand):
+    help = 'Measures channel layer fan-out latency across several worker processes (needs REDIS_URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Receiving worker processes')
+        parser.add_argument('--rooms', type=int, default=10, help='Rooms every worker joins')
+        parser.add_argument('--clients', type=int, default=4, help='Connections per room in every worker')
+        parser.add_argument('--messages', type=int, default=200, help='Events sent per room')
+        parser.add_argument('--rate', type=int, default=500, help='Events sent per second')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for delivery')
+
+    async def publish(self, rooms, messages, rate):
+        """Send timestamped events round-robin to the rooms, like the game consumer does"""
+        layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+        interval = 1 / rate if rate else 0
+        start = time.perf_counter()
+        for i in range(messages):
+            for room in range(rooms):
+                await layer.group_send(group_name(room), {
+                    'type': 'bench.event',
+                    'sent': time.time(),
+                    'payload': 'x' * 64
+                })
+            if interval:
+                await asyncio.sleep(max(0, start + (i + 1) * rooms * interval - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+
+        # give the last events a moment before telling the workers to stop
+        await asyncio.sleep(0.5)
+        for room in range(rooms):
+            await layer.group_send(group_name(room), {'type': 'bench.done'})
+        return elapsed
+
+    def handle(self, *args, **options):
+        if isinstance(channel_layers.make_backend(DEFAULT_CHANNEL_LAYER), InMemoryChannelLayer):
+            raise CommandError(
+                'The in-memory channel layer cannot reach other processes; set REDIS_URL or REDIS_HOSTS'
+            )
+
+        workers = options['workers']
+        rooms = options['rooms']
+        clients = options['clients']
+        messages = options['messages']
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = []
+        ready_events = []
+        for _ in range(workers):
+            ready = context.Event()
+            process = context.Process(
+                target=worker_main,
+                args=(rooms, clients, ready, results, options['timeout'])
+            )
+            process.start()
+            processes.append(process)
+            ready_events.append(ready)
+
+        for ready in ready_events:
+            if not ready.wait(options['timeout']):
+                for process in processes:
+                    process.terminate()
+                raise CommandError('Workers did not join their rooms in time')
+
+        elapsed = asyncio.run(self.publish(rooms, messages, options['rate']))
+
+        latencies = []
+        for _ in processes:
+            latencies.extend(results.get(timeout=options['timeout'] + 5))
+        for process in processes:
+            process.join()
+
+        expected = workers * rooms * clients * messages
+        self.stdout.write(
+            f"Fan-out across {workers} workers, {rooms} rooms, "
+            f"{clients} connections per room per worker"
+        )
+        self.stdout.write(
+            f"  sent {rooms * messages} events in {elapsed:.2f}s, "
+            f"delivered {len(latencies)}/{expected}"
+        )
+        if not latencies:
+            return
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f"  latency ms: mean {statistics.mean(latencies) * 1000:.2f}  "
+            f"p50 {percentile(0.50):.2f}  p95 {percentile(0.95):.2f}  "
+            f"p99 {percentile(0.99):.2f}  max {latencies[-1] * 1000:.2f}"
+        )
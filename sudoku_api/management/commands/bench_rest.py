@@ -0,0 +1,251 @@
+import itertools
+import json
+import secrets
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from sudoku_api.models import Game, Move, Player
+from sudoku_api.utils import generate_sudoku
+
+ENDPOINTS = ['create', 'join', 'get_hint', 'available', 'move']
+
+
+class Command(BaseCommand):
+    help = 'Measures requests/sec, latency and DB queries per request of the main REST endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoints',
+            nargs='+',
+            choices=ENDPOINTS,
+            default=ENDPOINTS,
+            help='Endpoints to measure, in order'
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--games', type=int, default=100, help='Games in the dataset')
+        parser.add_argument('--players', type=int, default=4, help='Players per game in the dataset')
+        parser.add_argument('--moves', type=int, default=10, help='Moves per game in the dataset')
+        parser.add_argument('--output', default=None, help='Also write the results to this JSON file')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated games afterwards')
+
+    def create_dataset(self, room_name, games, players, moves):
+        """Games with players and some wrong moves; returns [(game, players, open cells)]"""
+        dataset = []
+        for _ in range(games):
+            puzzle = generate_sudoku('medium')
+            game = Game.objects.create(
+                initial_board=puzzle['puzzle'],
+                current_board=puzzle['puzzle'],
+                solution=puzzle['solution'],
+                room_name=room_name
+            )
+            members = [
+                Player.objects.create(
+                    game=game,
+                    name=f'p{index}',
+                    is_host=index == 0,
+                    token=secrets.token_hex(32)
+                )
+                for index in range(players)
+            ]
+            empty = [(r, c) for r in range(9) for c in range(9) if puzzle['puzzle'][r][c] == 0]
+            Move.objects.bulk_create([
+                Move(
+                    game=game,
+                    player=members[i % players],
+                    row=empty[i % len(empty)][0],
+                    column=empty[i % len(empty)][1],
+                    value=puzzle['solution'][empty[i % len(empty)][0]][empty[i % len(empty)][1]] % 9 + 1,
+                    is_correct=False
+                )
+                for i in range(moves)
+            ])
+            dataset.append((game, members, empty))
+        return dataset
+
+    def build_requests(self, endpoint, count, room_name, dataset):
+        """(method, path, data) for every request of an endpoint"""
+        names = (f'j{n:x}' for n in itertools.count())
+
+        if endpoint == 'create':
+            return [
+                ('post', '/api/games/', {'difficulty': 'medium', 'player_name': 'Host', 'room_name': room_name})
+                for _ in range(count)
+            ]
+
+        if endpoint == 'join':
+            return [
+                ('post', f'/api/games/{dataset[i % len(dataset)][0].id}/join/', {'player_name': next(names)})
+                for i in range(count)
+            ]
+
+        if endpoint == 'available':
+            return [('get', '/api/games/available/', None) for _ in range(count)]
+
+        if endpoint == 'get_hint':
+            # every cell but the last open one of each game, so no game completes
+            cells = [
+                (game, members[0], cell)
+                for game, members, empty in dataset
+                for cell in empty[:-1]
+            ]
+            if len(cells) < count:
+                raise CommandError(f'Only {len(cells)} cells available for hints, add more --games')
+            return [
+                ('post', f'/api/games/{game.id}/get_hint/', {
+                    'player_id': str(player.id),
+                    'row': row,
+                    'column': column
+                })
+                for game, player, (row, column) in cells[:count]
+            ]
+
+        # wrong values on the last open cell of each game, which stays open
+        requests = []
+        for i in range(count):
+            game, members, empty = dataset[i % len(dataset)]
+            row, column = empty[-1]
+            requests.append(('post', '/api/moves/', {
+                'game_id': str(game.id),
+                'player_id': str(members[i % len(members)].id),
+                'row': row,
+                'column': column,
+                'value': game.solution[row][column] % 9 + 1
+            }))
+        return requests
+
+    def run_requests(self, requests, concurrency):
+        """Send the requests from several threads; returns (seconds, [(status, latency, queries)])"""
+        pending = iter(requests)
+        lock = threading.Lock()
+        results = []
+
+        def worker():
+            # a view that raises is a 500 in the results, not a dead thread
+            client = Client(raise_request_exception=False)
+            queries = [0]
+
+            def count_query(execute, sql, params, many, context):
+                queries[0] += 1
+                return execute(sql, params, many, context)
+
+            try:
+                while True:
+                    with lock:
+                        request = next(pending, None)
+                    if request is None:
+                        return
+                    method, path, data = request
+
+                    queries[0] = 0
+                    start = time.perf_counter()
+                    try:
+                        with connection.execute_wrapper(count_query):
+                            if method == 'get':
+                                response = client.get(path)
+                            else:
+                                response = client.post(path, json.dumps(data), content_type='application/json')
+                        status = response.status_code
+                    except Exception as e:
+                        # counted as a failure under the exception's name
+                        status = type(e).__name__
+                    latency = time.perf_counter() - start
+
+                    with lock:
+                        results.append((status, latency, queries[0]))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, results
+
+    def summarize(self, elapsed, results):
+        if not results:
+            return {
+                'requests': 0,
+                'status': {},
+                'requests_per_second': 0,
+                'latency_ms': {'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None},
+                'queries_per_request': {'mean': None, 'max': None},
+            }
+
+        latencies = sorted(latency for _, latency, _ in results)
+        queries = [count for _, _, count in results]
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            'requests': len(results),
+            'status': dict(Counter(status for status, _, _ in results)),
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies) * 1000, 2),
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': round(latencies[-1] * 1000, 2),
+            },
+            'queries_per_request': {
+                'mean': round(statistics.mean(queries), 1),
+                'max': max(queries),
+            },
+        }
+
+    def handle(self, *args, **options):
+        room_name = f'bench-{secrets.token_hex(3)}'
+        dataset = self.create_dataset(room_name, options['games'], options['players'], options['moves'])
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'config': {
+                key: options[key]
+                for key in ('requests', 'concurrency', 'games', 'players', 'moves')
+            },
+            'endpoints': {},
+        }
+
+        self.stdout.write(
+            f"{options['requests']} requests per endpoint, concurrency {options['concurrency']}, "
+            f"{options['games']} games x {options['players']} players x {options['moves']} moves"
+        )
+        self.stdout.write(
+            f"  {'endpoint':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'max q':>6}  status"
+        )
+        try:
+            # the test client talks to the app as host 'testserver'
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for endpoint in options['endpoints']:
+                    requests = self.build_requests(endpoint, options['requests'], room_name, dataset)
+                    elapsed, results = self.run_requests(requests, options['concurrency'])
+                    summary = report['endpoints'][endpoint] = self.summarize(elapsed, results)
+
+                    latency = summary['latency_ms']
+                    queries = summary['queries_per_request']
+                    self.stdout.write(
+                        f"  {endpoint:<10} {summary['requests_per_second']:>8} {latency['p50']:>8} "
+                        f"{latency['p95']:>8} {latency['p99']:>8} {queries['mean']:>8} "
+                        f"{queries['max']:>6}  {summary['status']}"
+                    )
+        finally:
+            if not options['keep']:
+                Game.objects.filter(room_name=room_name).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from sudoku_api.protocol import room_event
+from sudoku_api.rooms import RoomRegistry, fan_out, room_group_name
+
+
+class RoomMember:
+    """Stand-in for a connected consumer, counts the events it is handed"""
+
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    async def broadcast_move(self, event):
+        self.delivered[0] += 1
+
+
+class Command(BaseCommand):
+    help = 'Compares room fan-out through InMemoryChannelLayer with direct delivery via the room registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rooms',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Room counts to measure'
+        )
+        parser.add_argument('--players', type=int, default=4, help='Connections per room')
+        parser.add_argument('--events', type=int, default=20, help='Events broadcast to every room')
+
+    def make_events(self, rooms, events):
+        """Encoded move events for every room, built before anything is timed"""
+        player = {'id': str(uuid.uuid4()), 'name': 'Player', 'color': '#3B82F6', 'is_host': False}
+        return [
+            [
+                room_event('broadcast_move', {
+                    'type': 'move',
+                    'move': {
+                        'id': i,
+                        'player': player,
+                        'row': i % 9,
+                        'column': room % 9,
+                        'value': 5,
+                        'is_correct': True,
+                        'timestamp': '2025-01-01T12:00:00+00:00'
+                    },
+                    'seq': i + 1
+                }).encoded()
+                for room in range(rooms)
+            ]
+            for i in range(events)
+        ]
+
+    async def measure_layer(self, rooms, players, events):
+        """Every member owns a channel, and a consumer loop that dispatches from it"""
+        layer = InMemoryChannelLayer(capacity=events + 1)
+        delivered = [0]
+        expected = rooms * players * events
+        done = asyncio.Event()
+
+        async def consume(channel, member):
+            while True:
+                event = await layer.receive(channel)
+                await getattr(member, event['type'])(event)
+                if delivered[0] == expected:
+                    done.set()
+
+        tasks = []
+        for room in range(rooms):
+            for _ in range(players):
+                channel = await layer.new_channel()
+                await layer.group_add(room_group_name(room), channel)
+                tasks.append(asyncio.create_task(consume(channel, RoomMember(delivered))))
+        await asyncio.sleep(0)
+        batches = self.make_events(rooms, events)
+
+        start = time.perf_counter()
+        for batch in batches:
+            for room, event in enumerate(batch):
+                await layer.group_send(room_group_name(room), event)
+        await done.wait()
+        elapsed = time.perf_counter() - start
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return elapsed, delivered[0]
+
+    async def measure_registry(self, rooms, players, events):
+        """Members are registered per room and called directly"""
+        registry = RoomRegistry()
+        delivered = [0]
+        for room in range(rooms):
+            for _ in range(players):
+                registry.join(room, RoomMember(delivered))
+        batches = self.make_events(rooms, events)
+
+        start = time.perf_counter()
+        for batch in batches:
+            for room, event in enumerate(batch):
+                await fan_out(registry.local_members(room), event)
+        elapsed = time.perf_counter() - start
+        return elapsed, delivered[0]
+
+    def handle(self, *args, **options):
+        players = options['players']
+        events = options['events']
+
+        self.stdout.write(f"Room fan-out, {players} connections per room, {events} events per room")
+        for rooms in options['rooms']:
+            broadcasts = rooms * events
+            for name, measure in (
+                ('InMemoryChannelLayer', self.measure_layer),
+                ('room registry', self.measure_registry),
+            ):
+                elapsed, delivered = asyncio.run(measure(rooms, players, events))
+                self.stdout.write(
+                    f"  {rooms:5d} rooms  {name:<21} {elapsed * 1000:9.1f} ms  "
+                    f"{elapsed / broadcasts * 1e6:7.1f} us/broadcast  "
+                    f"delivered {delivered}"
+                )
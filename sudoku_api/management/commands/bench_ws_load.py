@@ -0,0 +1,307 @@
+import asyncio
+import json
+import random
+import resource
+import statistics
+import subprocess
+import time
+from collections import Counter, deque
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sudoku_api import metrics
+from sudoku_api.models import Game, Player
+from sudoku_api.utils import generate_sudoku
+
+
+class SimulatedPlayer:
+    """One WebSocket client in a room, sending a mix of game traffic"""
+
+    def __init__(self, game, player, cells, stats):
+        self.game = game
+        self.player_id = str(player.id)
+        # empty cells this player fills in, the last one is kept open so the
+        # game never completes and moves keep coming
+        self.cells = cells
+        self.stats = stats
+        self.communicator = None
+        # send times of moves not yet broadcast back, in order
+        self.pending_moves = deque()
+        self.focused = None
+
+    async def connect(self, application):
+        self.communicator = WebsocketCommunicator(application, f'/ws/game/{self.game.id}/')
+        connected, _ = await self.communicator.connect()
+        return connected
+
+    async def send(self, message):
+        self.stats['sent'][message['type']] += 1
+        await self.communicator.send_to(text_data=json.dumps(message))
+
+    async def send_move(self):
+        if not self.cells:
+            return
+        row, column = self.cells[0]
+        solution = self.game.solution[row][column]
+        if len(self.cells) > 1:
+            value = solution
+            self.cells.pop(0)
+        else:
+            value = random.choice([v for v in range(1, 10) if v != solution])
+
+        self.pending_moves.append(time.perf_counter())
+        await self.send({
+            'type': 'move',
+            'player_id': self.player_id,
+            'row': row,
+            'column': column,
+            'value': value
+        })
+
+    async def send_cell_focus(self):
+        if self.focused is not None:
+            row, column = self.focused
+            focus_type = 'blur'
+            self.focused = None
+        else:
+            row, column = random.randrange(9), random.randrange(9)
+            focus_type = 'focus'
+            self.focused = (row, column)
+
+        await self.send({
+            'type': 'cell_focus',
+            'player_id': self.player_id,
+            'row': row,
+            'column': column,
+            'focus_type': focus_type
+        })
+
+    async def send_quick_chat(self):
+        await self.send({
+            'type': 'quick_chat',
+            'player_id': self.player_id,
+            'message': random.choice(['Nice!', 'Good luck!', 'Almost there', 'Need help?'])
+        })
+
+    async def play(self, rates, until):
+        actions = [
+            (self.send_move, rates['move']),
+            (self.send_cell_focus, rates['cell_focus']),
+            (self.send_quick_chat, rates['quick_chat']),
+        ]
+        actions = [(action, rate) for action, rate in actions if rate > 0]
+        total = sum(rate for _, rate in actions)
+        if not total:
+            return
+
+        while True:
+            delay = random.expovariate(total)
+            if time.perf_counter() + delay >= until:
+                return
+            await asyncio.sleep(delay)
+            action = random.choices(
+                [action for action, _ in actions],
+                weights=[rate for _, rate in actions]
+            )[0]
+            await action()
+
+    def handle(self, message):
+        message_type = message.get('type')
+        self.stats['received'][message_type] += 1
+
+        if message_type == 'move' and message['move']['player']['id'] == self.player_id:
+            if self.pending_moves:
+                self.stats['move_latency'].append(time.perf_counter() - self.pending_moves.popleft())
+        elif message_type == 'error':
+            self.stats['errors'][message.get('message', '')] += 1
+            if message.get('message', '').startswith('Too many'):
+                return
+            # a move that was rejected is never broadcast
+            if self.pending_moves:
+                self.pending_moves.popleft()
+
+    async def listen(self):
+        while True:
+            output = await self.communicator.receive_output(timeout=3600)
+            if output['type'] != 'websocket.send':
+                return
+            data = json.loads(output['text'])
+            if data.get('type') == 'batch':
+                self.stats['received']['frames'] += 1
+                for event in data['events']:
+                    self.handle(event)
+            else:
+                self.handle(data)
+
+
+class Command(BaseCommand):
+    help = 'Simulates R rooms x P players against the ASGI application and writes a JSON latency report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Number of game rooms')
+        parser.add_argument('--players', type=int, default=4, help='Players per room')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds of traffic')
+        parser.add_argument('--move-rate', type=float, default=0.5, help='Moves per second per player')
+        parser.add_argument('--focus-rate', type=float, default=2.0, help='cell_focus messages per second per player')
+        parser.add_argument('--chat-rate', type=float, default=0.1, help='quick_chat messages per second per player')
+        parser.add_argument('--difficulty', default='medium', choices=['easy', 'medium', 'hard'])
+        parser.add_argument('--output', default='bench_ws_load.json', help='Report file')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a repeatable traffic mix')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated games afterwards')
+
+    def create_rooms(self, rooms, players, difficulty):
+        games = []
+        for room in range(rooms):
+            puzzle = generate_sudoku(difficulty)
+            game = Game.objects.create(
+                initial_board=puzzle['puzzle'],
+                current_board=puzzle['puzzle'],
+                solution=puzzle['solution'],
+                difficulty=difficulty,
+                room_name=f'load-{room}'
+            )
+            members = [
+                Player.objects.create(game=game, name=f'load-{room}-{index}', is_host=index == 0)
+                for index in range(players)
+            ]
+            games.append((game, members))
+        return games
+
+    async def run(self, games, options, stats):
+        from backend.asgi import application
+
+        simulated = []
+        for game, members in games:
+            empty = [(r, c) for r in range(9) for c in range(9) if game.initial_board[r][c] == 0]
+            random.shuffle(empty)
+            for index, player in enumerate(members):
+                cells = empty[index::len(members)]
+                simulated.append(SimulatedPlayer(game, player, cells, stats))
+
+        start = time.perf_counter()
+        connected = await asyncio.gather(*(player.connect(application) for player in simulated))
+        stats['connect_seconds'] = time.perf_counter() - start
+        stats['connected'] = sum(connected)
+
+        listeners = [asyncio.create_task(player.listen()) for player in simulated]
+        rates = {
+            'move': options['move_rate'],
+            'cell_focus': options['focus_rate'],
+            'quick_chat': options['chat_rate'],
+        }
+
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        until = start + options['duration']
+        await asyncio.gather(*(player.play(rates, until) for player in simulated))
+        # let the last broadcasts arrive
+        await asyncio.sleep(1)
+        elapsed = time.perf_counter() - start
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await asyncio.gather(
+            *(player.communicator.disconnect() for player in simulated),
+            return_exceptions=True
+        )
+
+        stats['elapsed'] = elapsed
+        stats['cpu_seconds'] = (
+            cpu_end.ru_utime - cpu_start.ru_utime + cpu_end.ru_stime - cpu_start.ru_stime
+        )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, cwd=settings.BASE_DIR
+            ).stdout.strip() or None
+        except OSError:
+            return None
+
+    def summarize(self, stats, options):
+        latencies = sorted(stats['move_latency'])
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+        elapsed = stats['elapsed']
+        sent = sum(stats['sent'].values())
+        received = sum(count for name, count in stats['received'].items() if name != 'frames')
+        return {
+            'commit': self.git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'config': {
+                'rooms': options['rooms'],
+                'players': options['players'],
+                'duration': options['duration'],
+                'move_rate': options['move_rate'],
+                'focus_rate': options['focus_rate'],
+                'chat_rate': options['chat_rate'],
+                'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+                'batch_window_ms': settings.WS_BATCH_WINDOW_MS,
+            },
+            'connections': stats['connected'],
+            'connect_seconds': round(stats['connect_seconds'], 3),
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_sent': dict(stats['sent']),
+            'messages_received': dict(stats['received']),
+            'sent_per_second': round(sent / elapsed, 1),
+            'received_per_second': round(received / elapsed, 1),
+            'move_latency_ms': {
+                'count': len(latencies),
+                'mean': round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+                'p50': percentile(0.50),
+                'p90': percentile(0.90),
+                'p99': percentile(0.99),
+                'max': round(latencies[-1] * 1000, 3) if latencies else None,
+            },
+            'errors': dict(stats['errors']),
+            # the load generator runs in the same process as the application
+            'cpu_seconds': round(stats['cpu_seconds'], 3),
+            'cpu_percent': round(stats['cpu_seconds'] / elapsed * 100, 1),
+            'server_counters': metrics.collect()['counters'],
+        }
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        games = self.create_rooms(options['rooms'], options['players'], options['difficulty'])
+        stats = {
+            'sent': Counter(),
+            'received': Counter(),
+            'errors': Counter(),
+            'move_latency': [],
+        }
+        try:
+            asyncio.run(self.run(games, options, stats))
+        finally:
+            if not options['keep']:
+                Game.objects.filter(id__in=[game.id for game, _ in games]).delete()
+
+        report = self.summarize(stats, options)
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        latency = report['move_latency_ms']
+        self.stdout.write(
+            f"{report['connections']} connections in {options['rooms']} rooms, "
+            f"{report['elapsed_seconds']}s"
+        )
+        self.stdout.write(
+            f"  sent {report['sent_per_second']} msg/s, "
+            f"received {report['received_per_second']} msg/s"
+        )
+        self.stdout.write(
+            f"  move -> broadcast ms: p50 {latency['p50']}  p90 {latency['p90']}  "
+            f"p99 {latency['p99']}  max {latency['max']}  ({latency['count']} moves)"
+        )
+        self.stdout.write(f"  cpu {report['cpu_percent']}%  errors {sum(report['errors'].values())}")
+        self.stdout.write(f"Report written to {options['output']}")
@@ -1,9 +1,13 @@
 import logging
+import time
 from datetime import timedelta
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
 from django.utils import timezone
-from sudoku_api.models import Game, Move
+from sudoku_api.db import CLEANUP_LOCK_ID, advisory_lock
+from sudoku_api.expiry import delete_games
+from sudoku_api.models import Game
 
 logger = logging.getLogger(__name__)
 
@@ -14,56 +18,132 @@ class Command(BaseCommand):
         parser.add_argument(
             '--minutes',
             type=int,
-            default=5,
-            help='Number of minutes of inactivity before a game is considered abandoned'
+            default=0,
+            help='Minutes of inactivity before a game is considered abandoned, added to --hours'
         )
         parser.add_argument(
             '--hours',
             type=int,
-            default=24,
-            help='Number of hours of inactivity before a game is considered abandoned'
+            default=None,
+            help='Hours of inactivity before a game is considered abandoned (24 if neither option is given)'
         )
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Show what would be deleted without actually deleting'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Games deleted per transaction'
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            default=60,
+            help='Stop starting new chunks after this many seconds (0 = no limit)'
+        )
+        parser.add_argument(
+            '--if-leader',
+            action='store_true',
+            help='Skip the run unless no other process is running it (PostgreSQL advisory lock, always skipped on other databases)'
+        )
+
+    def inactive_games(self, cutoff_time):
+        """
+        Games with no activity since the cutoff time, oldest first
+
+        A game is considered inactive if it's not complete and it was not
+        saved since the cutoff time. Every move saves the game, so
+        last_activity is the time of its last move (or of its creation).
+        """
+        return Game.objects.filter(
+            is_complete=False,
+            last_activity__lt=cutoff_time
+        ).order_by('last_activity')
+
+    def delete_chunk(self, cutoff_time, chunk_size):
+        """Delete up to chunk_size inactive games; returns {model name: rows}"""
+        using = router.db_for_write(Game)
+        with transaction.atomic(using=using):
+            # rows a move is being saved on are skipped until the next run
+            game_ids = list(
+                self.inactive_games(cutoff_time)
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not game_ids:
+                return {}
+            return delete_games(game_ids, using)
 
     def handle(self, *args, **options):
-        inactivity_hours = options['hours']
+        if not options['if_leader']:
+            self.cleanup(options)
+            return
+
+        with advisory_lock(CLEANUP_LOCK_ID, using=router.db_for_write(Game)) as leader:
+            if not leader:
+                self.stdout.write("Not the leader (another process holds the lock, or the database has no advisory locks), skipping this run")
+                return
+            self.cleanup(options)
 
+    def cleanup(self, options):
         dry_run = options['dry_run']
-        inactivity_minutes = options['minutes']
-        
+        chunk_size = options['chunk_size']
+        time_budget = options['time_budget']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        inactivity = timedelta(hours=options['hours'] or 0, minutes=options['minutes'])
+        if options['hours'] is None and not options['minutes']:
+            inactivity = timedelta(hours=24)
+
         # calculate the cutoff time
-        cutoff_time = timezone.now() - timedelta(hours=inactivity_hours)
-        cutoff_time = timezone.now() - timedelta(minutes=inactivity_minutes)
-        
-        # Find games with no activity since the cutoff time
-        # A game is considered inactive if:
-        # 1. It's not complete, AND
-        # 2. No moves have been made since the cutoff time
-        inactive_games = []
-        for game in Game.objects.filter(is_complete=False):
-            last_move = Move.objects.filter(game=game).order_by('-timestamp').first()
-            
-            if not last_move or last_move.timestamp < cutoff_time:
-                inactive_games.append(game)
-        
+        cutoff_time = timezone.now() - inactivity
+
         if dry_run:
-            self.stdout.write(f"Would delete {len(inactive_games)} inactive games")
-            for game in inactive_games:
+            inactive_games = self.inactive_games(cutoff_time)
+            self.stdout.write(f"Would delete {inactive_games.count()} inactive games")
+            for game in inactive_games.only('id', 'created_at')[:chunk_size]:
                 self.stdout.write(f"  - Game ID: {game.id}, Created: {game.created_at}")
-        else:
-            for game in inactive_games:
-                game_id = game.id
-                player_count = game.players.count()
-                
-                # delete the game (this will cascade delete related players and moves)
-                game.delete()
-                
-                logger.info(f"Deleted inactive game {game_id} with {player_count} players. Last activity before {cutoff_time}")
-            
-            self.stdout.write(
-                self.style.SUCCESS(f"Successfully deleted {len(inactive_games)} inactive games")
+            return
+
+        start = time.monotonic()
+        totals = {'games': 0, 'players': 0, 'moves': 0}
+        chunks = 0
+        out_of_time = False
+        while True:
+            if time_budget and time.monotonic() - start >= time_budget:
+                out_of_time = True
+                break
+
+            deleted = self.delete_chunk(cutoff_time, chunk_size)
+            if not deleted:
+                break
+            chunks += 1
+            for name, rows in deleted.items():
+                totals[name] += rows
+            if deleted['games'] < chunk_size:
+                break
+
+        elapsed = time.monotonic() - start
+        rows = sum(totals.values())
+        rate = rows / elapsed if elapsed else 0
+        logger.info(
+            f"Deleted {totals['games']} inactive games ({totals['players']} players, "
+            f"{totals['moves']} moves) in {chunks} chunks, {elapsed:.2f}s. "
+            f"Last activity before {cutoff_time}"
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully deleted {totals['games']} inactive games "
+                f"({totals['players']} players, {totals['moves']} moves) in {chunks} chunks, "
+                f"{elapsed:.2f}s, {rate:.0f} rows/s"
             )
+        )
+        if out_of_time:
+            self.stdout.write(self.style.WARNING(
+                f"Time budget of {time_budget:g}s used up, the remaining games are left for the next run"
+            ))
@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+"""
+metrics.py - In-process runtime metrics
+
+A minimal registry for numbers the WebSocket worker wants to expose:
+- incr() bumps a named counter
+- register_gauge() adds a callable that is evaluated on every collect()
+
+collect() returns everything as a dict, served by the /api/metrics/ view.
+Values are per process; each worker reports its own.
+"""
+
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def incr(name, amount=1):
+    """Increase a named counter"""
+    _counters[name] += amount
+
+
+def register_gauge(name, func):
+    """Register a callable whose return value is reported under name"""
+    _gauges[name] = func
+
+
+def collect():
+    """Return the current value of every counter and gauge"""
+    data = {'counters': dict(_counters)}
+    for name, func in _gauges.items():
+        try:
+            data[name] = func()
+        except Exception as e:
+            data[name] = {'error': str(e)}
+    return data
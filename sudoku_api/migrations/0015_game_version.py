@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0014_alter_player_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0015_game_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='move',
+            index=models.Index(fields=['game', 'timestamp', 'id'], name='move_game_timestamp_idx'),
+        ),
+    ]
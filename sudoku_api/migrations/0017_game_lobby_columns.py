@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 00:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_lobby_columns(apps, schema_editor):
+    Game = apps.get_model('sudoku_api', 'Game')
+    Player = apps.get_model('sudoku_api', 'Player')
+    players = Player.objects.filter(game=OuterRef('pk'))
+    Game.objects.update(
+        player_count=Coalesce(Subquery(
+            players.order_by().values('game').annotate(count=Count('pk')).values('count')[:1]
+        ), 0),
+        host_name=Coalesce(Subquery(
+            players.filter(is_host=True).order_by('id').values('name')[:1]
+        ), Value(''))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0016_move_game_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='host_name',
+            field=models.CharField(blank=True, default='', max_length=14),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='player_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_lobby_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_complete', False), ('player_count__lte', 10)), fields=['-created_at'], name='game_joinable_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0017_game_lobby_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['name'], name='player_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(condition=models.Q(('token__isnull', False)), fields=['token'], name='player_token_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 00:46
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0018_player_name_token_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(django.db.models.functions.text.Lower('room_name'), models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True), ('is_complete', False)), name='game_room_name_lower_idx'),
+        ),
+    ]
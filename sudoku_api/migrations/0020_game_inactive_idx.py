@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0019_game_room_name_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('is_complete', False)), fields=['last_activity'], name='game_inactive_idx'),
+        ),
+    ]
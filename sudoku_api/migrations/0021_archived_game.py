@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sudoku_api', '0020_game_inactive_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('room_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('difficulty', models.CharField(default='medium', max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('player_count', models.PositiveIntegerField(default=0)),
+                ('move_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('is_complete', True)), fields=['completed_at'], name='game_completed_idx'),
+        ),
+    ]
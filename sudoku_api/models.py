@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -13,12 +17,41 @@ This file defines the database schema for the collaborative Sudoku game:
 - Player: Represents users with unique colors for move identification
   and host designation for game management
 - Move: Records every cell update with player attribution and timestamps
+- ArchivedGame: A completed game moved out of the tables above, with its
+  boards, roster and move log in one compressed blob (see archive.py)
+
+Game.version counts changes to the state shown by the snapshot endpoint
+(boards, completion and roster). It is bumped by saves that change the
+boards or completion (Game.save(bump_version=True)) and whenever one of
+its players is added, changed or removed, and is used as the snapshot's
+ETag. It is only ever incremented in the database (F('version') + 1),
+never written from a copy held in memory.
+
+Game.player_count and Game.host_name are copies of the roster for the
+lobby, so listing joinable games never touches the Player table. They are
+only written by the Player signals at the bottom of this file, with one
+UPDATE in the same transaction as the player change, and never by
+Game.save(). Game.objects.joinable() is served by a partial index.
 
 The UUIDs for games enable secure, shareable game links, while the
 JSON fields store the Sudoku grid state efficiently.
 """
 
 
+# rooms with more players than this are no longer listed in the lobby
+MAX_PLAYERS = 10
+
+
+class GameQuerySet(models.QuerySet):
+    def joinable(self):
+        """Games listed in the lobby, newest first"""
+        return self.filter(
+            is_active=True,
+            is_complete=False,
+            player_count__lte=MAX_PLAYERS
+        ).order_by('-created_at')
+
+
 class Game(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     initial_board = models.JSONField()
@@ -36,12 +69,78 @@ class Game(models.Model):
     is_complete = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
     completed_by = models.ForeignKey('Player', on_delete=models.SET_NULL, null=True, blank=True, related_name='completed_games')
+    version = models.PositiveIntegerField(default=0)
+    # lobby copies of the roster, kept current by the Player signals
+    player_count = models.PositiveIntegerField(default=0)
+    host_name = models.CharField(max_length=14, blank=True, default='')
+
+    objects = GameQuerySet.as_manager()
+
+    # columns that Game.save() leaves alone
+    ROSTER_FIELDS = {'player_count', 'host_name'}
+
+    class Meta:
+        indexes = [
+            # the lobby, see GameQuerySet.joinable
+            models.Index(
+                fields=['-created_at'],
+                name='game_joinable_idx',
+                condition=Q(is_active=True, is_complete=False, player_count__lte=MAX_PLAYERS)
+            ),
+            # archive_completed_games, oldest completed games first
+            models.Index(
+                fields=['completed_at'],
+                name='game_completed_idx',
+                condition=Q(is_complete=True)
+            ),
+            # cleanup_inactive_games, oldest idle games first
+            models.Index(
+                fields=['last_activity'],
+                name='game_inactive_idx',
+                condition=Q(is_complete=False)
+            ),
+            # find_by_room_name, case-insensitive and newest first
+            models.Index(
+                Lower('room_name'), F('created_at').desc(),
+                name='game_room_name_lower_idx',
+                condition=Q(is_active=True, is_complete=False)
+            ),
+        ]
     
     def __str__(self):
         if self.room_name:
             return f"Game {self.room_name} ({self.id}) - {self.difficulty}"
         return f"Game {self.id} - {self.difficulty}"
 
+    def save(self, *args, bump_version=False, **kwargs):
+        """
+        Save the game; bump_version=True when the boards or completion changed
+
+        The version is incremented in the database, so a stale copy of the
+        game never writes an old counter back over a roster bump, and the
+        new value is read back before returning.
+        """
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                # a stale copy of the roster columns must not overwrite them
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in self.ROSTER_FIELDS
+                    # only ever incremented, below
+                    and field.name != 'version'
+                    and field.attname not in deferred
+                ]
+            if bump_version:
+                self.version = F('version') + 1
+                update_fields = {*update_fields, 'version'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        if bump_version and not self._state.adding:
+            self.refresh_from_db(fields=['version'])
+
     def is_inactive(self, hours=1):
         """
         Check if the game has been inactive for the specified number of hours.
@@ -76,6 +175,11 @@ class Player(models.Model):
     class Meta:
         # memastikan kombinasi game+name bersifat unik
         unique_together = ('game', 'name')
+        indexes = [
+            # find_player looks players up by name across games, and by token
+            models.Index(fields=['name'], name='player_name_idx'),
+            models.Index(fields=['token'], name='player_token_idx', condition=models.Q(token__isnull=False)),
+        ]
 
 class Move(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='moves')
@@ -87,6 +191,10 @@ class Move(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
         
     class Meta:
+        indexes = [
+            # move history of a game in order, see MoveCursorPagination
+            models.Index(fields=['game', 'timestamp', 'id'], name='move_game_timestamp_idx'),
+        ]
         # additional constraint to ensure we get proper row/column validation
         constraints = [
             models.CheckConstraint(
@@ -105,3 +213,59 @@ class Move(models.Model):
     
     def __str__(self):
         return f"Move by {self.player.name}: ({self.row}, {self.column}) = {self.value}"
+
+
+class ArchivedGame(models.Model):
+    # same id as the game it was archived from, so links keep working
+    id = models.UUIDField(primary_key=True, editable=False)
+    room_name = models.CharField(max_length=100, blank=True, null=True)
+    difficulty = models.CharField(max_length=10, default='medium')
+    created_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    player_count = models.PositiveIntegerField(default=0)
+    move_count = models.PositiveIntegerField(default=0)
+    # zlib-compressed JSON of the boards, roster and move log
+    data = models.BinaryField()
+
+    def __str__(self):
+        if self.room_name:
+            return f"Archived game {self.room_name} ({self.id}) - {self.difficulty}"
+        return f"Archived game {self.id} - {self.difficulty}"
+
+
+@receiver(post_save, sender=Player)
+def update_game_on_player_save(sender, instance, created, **kwargs):
+    # the roster is part of the game snapshot and of the lobby columns
+    changes = {'version': F('version') + 1}
+    if created:
+        changes['player_count'] = F('player_count') + 1
+    if instance.is_host:
+        changes['host_name'] = Value(instance.name)
+    else:
+        # a demoted host no longer names the room
+        changes['host_name'] = Case(
+            When(host_name=instance.name, then=Value('')),
+            default=F('host_name')
+        )
+    Game.objects.filter(id=instance.game_id).update(**changes)
+
+
+@receiver(post_delete, sender=Player)
+def update_game_on_player_delete(sender, instance, origin=None, **kwargs):
+    # nothing to update when the whole game is being deleted
+    if isinstance(origin, Game) or getattr(origin, 'model', None) is Game:
+        return
+    changes = {
+        'version': F('version') + 1,
+        'player_count': Case(
+            When(player_count__gt=0, then=F('player_count') - 1),
+            default=Value(0)
+        ),
+    }
+    if instance.is_host:
+        changes['host_name'] = Case(
+            When(host_name=instance.name, then=Value('')),
+            default=F('host_name')
+        )
+    Game.objects.filter(id=instance.game_id).update(**changes)
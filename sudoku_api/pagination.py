@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+"""
+pagination.py - Pagination styles of the REST API
+
+- MoveCursorPagination: Move history in the order the moves were made.
+  The cursor is opaque and stable while new moves keep arriving, so replay
+  tools can page through a live game without skipping or repeating rows
+- GameCursorPagination: The game list, newest first
+"""
+
+
+class MoveCursorPagination(CursorPagination):
+    ordering = ('timestamp', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class GameCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
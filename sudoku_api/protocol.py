@@ -0,0 +1,236 @@
+import json
+import struct
+import uuid
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+"""
+protocol.py - Wire encoding for messages sent to WebSocket clients
+
+Room broadcasts are encoded exactly once by the sender and passed through
+the channel layer as ready-to-send text:
+- encode_message turns a message dict into the JSON text sent to clients,
+  using orjson when it is installed
+- room_event builds the channel layer event for a broadcast_* handler.
+  Each wire encoding is made the first time a recipient asks for it and
+  then shared, so a room without msgpack clients never packs msgpack.
+  Events that leave the process carry both (RoomEvent.encoded)
+
+Clients that negotiate the 'sudoku.msgpack.v1' subprotocol get binary
+frames instead. Hot messages (moves, focus, heartbeat, player list) are
+packed as short positional arrays with the cell as a 0-80 index and player
+ids as 16 raw bytes; anything else is sent as [OP_MESSAGE, message].
+"""
+
+MSGPACK_SUBPROTOCOL = 'sudoku.msgpack.v1'
+
+# opcodes of the compact binary protocol
+OP_MESSAGE = 0
+OP_MOVE = 1
+OP_CELL_FOCUS = 2
+OP_HEARTBEAT = 3
+OP_PLAYER_LIST = 4
+OP_BATCH = 5
+OP_PONG = 6
+
+# move flags
+FLAG_CORRECT = 1
+FLAG_GAME_COMPLETE = 2
+FLAG_HINT = 4
+
+
+def encode_message(message):
+    """
+    Encode a message dict as compact JSON text
+
+    Args:
+        message (dict): The message to encode
+
+    Returns:
+        str: JSON text ready to be sent as a WebSocket text frame
+    """
+    if orjson is not None:
+        return orjson.dumps(message).decode('utf-8')
+    return json.dumps(message, separators=(',', ':'))
+
+
+def is_digit(value, highest):
+    """True for an int (not a bool) between 0 and highest"""
+    return type(value) is int and 0 <= value <= highest
+
+
+def is_cell(row, column):
+    """True when row and column address a cell of the 9x9 board"""
+    return is_digit(row, 8) and is_digit(column, 8)
+
+
+def _uuid_bytes(value):
+    return uuid.UUID(str(value)).bytes
+
+
+def _uuid_str(value):
+    return str(uuid.UUID(bytes=value))
+
+
+def _pack_player(player):
+    return [_uuid_bytes(player['id']), player['name'], player['color'], player.get('is_host', False)]
+
+
+def encode_compact(message):
+    """
+    Encode a message for clients using the binary msgpack subprotocol
+
+    Args:
+        message (dict): The message to encode
+
+    Returns:
+        bytes: msgpack payload ready to be sent as a WebSocket binary frame
+    """
+    message_type = message['type']
+
+    # the compact forms hold a 0-80 cell index, anything else goes in full
+    if message_type == 'move':
+        move = message['move']
+        if not (is_cell(move.get('row'), move.get('column')) and is_digit(move.get('value'), 9)):
+            message_type = None
+    elif message_type == 'cell_focus':
+        if not is_cell(message.get('row'), message.get('column')):
+            message_type = None
+
+    if message_type == 'move':
+        move = message['move']
+        flags = 0
+        if move.get('is_correct'):
+            flags |= FLAG_CORRECT
+        if move.get('game_complete'):
+            flags |= FLAG_GAME_COMPLETE
+        if move.get('is_hint'):
+            flags |= FLAG_HINT
+        payload = [
+            OP_MOVE,
+            move['row'] * 9 + move['column'],
+            move['value'],
+            flags,
+            _pack_player(move['player']),
+            move['id'],
+            move['timestamp']
+        ]
+    elif message_type == 'cell_focus':
+        payload = [
+            OP_CELL_FOCUS,
+            message['row'] * 9 + message['column'],
+            message['focus_type'] == 'focus',
+            _pack_player(message['player'])
+        ]
+    elif message_type == 'heartbeat':
+        payload = [OP_HEARTBEAT, message['timestamp']]
+    elif message_type == 'player_list_update':
+        payload = [OP_PLAYER_LIST, [_pack_player(player) for player in message['players']]]
+        if 'roster_version' in message:
+            payload.append(message['roster_version'])
+    else:
+        payload = [OP_MESSAGE, message]
+
+    return msgpack.packb(payload)
+
+
+def encode_compact_batch(packed_events):
+    """
+    Combine already packed events into one [OP_BATCH, [...]] payload
+
+    The events are spliced in as-is, so nothing is packed a second time.
+    """
+    count = len(packed_events)
+    if count < 16:
+        header = bytes([0x90 | count])
+    elif count < 0x10000:
+        header = b'\xdc' + struct.pack('>H', count)
+    else:
+        header = b'\xdd' + struct.pack('>I', count)
+    return b'\x92' + msgpack.packb(OP_BATCH) + header + b''.join(packed_events)
+
+
+def decode_compact(data):
+    """
+    Decode a binary frame sent by a msgpack client into a message dict
+
+    Clients send [OP_MOVE, cell, value, player_id],
+    [OP_CELL_FOCUS, cell, is_focus, player_id], [OP_PONG, timestamp]
+    or [OP_MESSAGE, message] for everything else.
+
+    Raises:
+        ValueError: If the payload is not a valid compact message
+    """
+    try:
+        payload = msgpack.unpackb(data)
+        opcode = payload[0]
+
+        if opcode == OP_MOVE:
+            cell, value, player_id = payload[1:4]
+            return {
+                'type': 'move',
+                'player_id': _uuid_str(player_id),
+                'row': cell // 9,
+                'column': cell % 9,
+                'value': value
+            }
+        if opcode == OP_CELL_FOCUS:
+            cell, is_focus, player_id = payload[1:4]
+            return {
+                'type': 'cell_focus',
+                'player_id': _uuid_str(player_id),
+                'row': cell // 9,
+                'column': cell % 9,
+                'focus_type': 'focus' if is_focus else 'blur'
+            }
+        if opcode == OP_PONG:
+            return {'type': 'pong', 'timestamp': payload[1] if len(payload) > 1 else None}
+        if opcode == OP_MESSAGE and isinstance(payload[1], dict):
+            return payload[1]
+    except (msgpack.UnpackException, ValueError, TypeError, IndexError) as e:
+        raise ValueError(f"Invalid binary message: {e}")
+
+    raise ValueError("Unknown binary message")
+
+
+class RoomEvent(dict):
+    """Event dict whose 'text' and 'bytes' are encoded on first access"""
+
+    def __init__(self, handler, message):
+        super().__init__(type=handler, message_type=message['type'])
+        self.message = message
+
+    def __missing__(self, key):
+        if key == 'text':
+            value = encode_message(self.message)
+        elif key == 'bytes':
+            value = encode_compact(self.message)
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def encoded(self):
+        """Plain dict with every encoding, for the channel layer"""
+        return {**self, 'text': self['text'], 'bytes': self['bytes']}
+
+
+def room_event(handler, message):
+    """
+    Build a channel layer event for a room broadcast
+
+    Args:
+        handler (str): Name of the consumer handler, e.g. 'broadcast_move'
+        message (dict): The message every client in the room receives
+
+    Returns:
+        RoomEvent: Event whose 'text' and 'bytes' are each encoded once,
+        when a recipient first needs them. Pass event.encoded() to
+        group_send
+    """
+    return RoomEvent(handler, message)
@@ -0,0 +1,49 @@
+import time
+
+"""
+ratelimit.py - Token buckets for inbound WebSocket messages
+
+Each connection gets one bucket per message type. A bucket refills at
+`rate` tokens per second up to `burst` tokens, and every message of that
+type takes one token. Messages arriving at an empty bucket are throttled.
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # True while messages are being rejected, so the client is told once
+        self.throttled = False
+
+    def consume(self):
+        """Take a token if one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.throttled = False
+            return True
+
+        self.throttled = True
+        return False
+
+
+class RateLimiter:
+    """Per message type token buckets for a single connection"""
+
+    def __init__(self, limits, default):
+        self.limits = limits
+        self.default = default
+        self.buckets = {}
+
+    def bucket(self, message_type):
+        bucket = self.buckets.get(message_type)
+        if bucket is None:
+            rate, burst = self.limits.get(message_type, self.default)
+            bucket = self.buckets[message_type] = TokenBucket(rate, burst)
+        return bucket
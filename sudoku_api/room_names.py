@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+"""
+room_names.py - Optional in-process cache for find_by_room_name
+
+Players who join by typing a room name (instead of scanning the QR code)
+look the room up first. With ROOM_NAME_CACHE_SECONDS > 0 the answer is
+kept in memory, keyed by the lower-cased name:
+- Entries expire after ROOM_NAME_CACHE_SECONDS
+- Every change the lobby is told about (see lobby.notify_lobby: joins,
+  leaves, completion, deactivation, deletion) drops the game's entry in
+  this process once it commits
+- Creating a game, or renaming one, drops the entries of its names, as the
+  newest game of a name is the one a lookup finds
+
+Other worker processes only notice a change once their entry expires, so
+keep the lifetime short.
+"""
+
+
+class RoomNameCache:
+    def __init__(self, seconds, size):
+        self.seconds = seconds
+        self.size = size
+        # lower-cased room name -> (expiry time, game id, game info)
+        self.entries = OrderedDict()
+        # game id -> lower-cased room name
+        self.names = {}
+        # REST requests run on several threads
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.seconds > 0
+
+    def get(self, room_name):
+        """Cached game info of a room name, or None"""
+        key = room_name.lower()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self.discard(key)
+                return None
+            return entry[2]
+
+    def put(self, room_name, game_id, data):
+        key = room_name.lower()
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = (time.monotonic() + self.seconds, str(game_id), data)
+            self.names[str(game_id)] = key
+            while len(self.entries) > self.size:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        # callers hold the lock
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.names.pop(entry[1], None)
+
+    def forget_game(self, game_id):
+        with self.lock:
+            key = self.names.get(str(game_id))
+            if key is not None:
+                self.discard(key)
+
+    def forget_name(self, room_name):
+        with self.lock:
+            self.discard(room_name.lower())
+
+
+_cache = None
+
+
+def get_room_name_cache():
+    """Return the room name cache of this process"""
+    global _cache
+    if _cache is None:
+        _cache = RoomNameCache(settings.ROOM_NAME_CACHE_SECONDS, settings.ROOM_NAME_CACHE_SIZE)
+    return _cache
+
+
+def forget_game(game_id):
+    """Drop a game from the room name cache, e.g. after a queryset update"""
+    if _cache is not None:
+        _cache.forget_game(game_id)
+
+
+
+def forget_name(room_name):
+    """Drop a room name from the room name cache, whichever game it points to"""
+    if _cache is not None:
+        _cache.forget_name(room_name)
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict, deque
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+
+from . import metrics
+from .affinity import get_router
+from .protocol import room_event
+from .roster import ROSTER_DELTA_TYPES, get_roster
+from .spectators import get_spectator_hub
+
+"""
+rooms.py - In-process state for game rooms
+
+Every broadcast to a game room goes through broadcast(), which:
+- Assigns the event the next sequence number of its room (and applies
+  player_joined / player_left to the room's roster, see roster.py)
+- Encodes the event once (see protocol.room_event)
+- Records it in a bounded per-room ring buffer
+- Delivers it to the room's consumers, and hands it to the room's
+  spectators (see spectators.py)
+
+With the in-memory channel layer every consumer of a room lives in this
+process, so broadcast() calls their handlers directly through the room
+registry. That skips the per-channel queues and the copy of the event the
+layer makes for every member. Handlers must treat the event as read-only,
+since all members share it. With any other layer, or when a member runs on
+a different event loop, the event goes through group_send as usual.
+
+The ring buffer lets a reconnecting client resume from the last sequence
+number it saw instead of reloading the whole game. Each log has a random
+epoch, so a client that reconnects to a restarted process (or to another
+worker) is detected and sent a full snapshot instead.
+
+Sequence numbers are only meaningful while every member of a room lives in
+this process. With a shared channel layer (Redis, several workers) each
+worker would number the same room independently, so events are sent
+unsequenced and reconnecting clients always get a snapshot, unless room
+affinity (see affinity.py) pins each room to one worker.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(game_id):
+    """Channel layer group name for a game room"""
+    return f'game_{game_id}'
+
+
+class RoomEventLog:
+    """Sequence counter and ring buffer of recent broadcasts for one room"""
+
+    def __init__(self, size):
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.events = deque(maxlen=size)
+
+    def append(self, event):
+        self.events.append((self.seq, event))
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def since(self, epoch, last_seq):
+        """
+        Return the events after last_seq, oldest first.
+
+        Returns None when the events cannot be replayed: the epoch does not
+        match, or some of the missed events were already evicted.
+        """
+        if epoch != self.epoch or last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+
+        oldest = self.events[0][0] if self.events else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+
+        return [event for seq, event in self.events if seq > last_seq]
+
+
+_event_logs = OrderedDict()
+
+
+def get_event_log(game_id):
+    """Return the event log of a room, creating it if needed"""
+    game_id = str(game_id)
+    log = _event_logs.get(game_id)
+    if log is None:
+        log = _event_logs[game_id] = RoomEventLog(settings.ROOM_EVENT_LOG_SIZE)
+        # keep only the most recently used rooms
+        while len(_event_logs) > settings.ROOM_EVENT_LOG_MAX_ROOMS:
+            _event_logs.popitem(last=False)
+    else:
+        _event_logs.move_to_end(game_id)
+    return log
+
+
+class RoomRegistry:
+    """Consumers connected to each room in this process"""
+
+    def __init__(self):
+        # game id -> {consumer: event loop it runs on}
+        self.rooms = {}
+
+    def join(self, game_id, consumer):
+        self.rooms.setdefault(str(game_id), {})[consumer] = asyncio.get_running_loop()
+
+    def leave(self, game_id, consumer):
+        members = self.rooms.get(str(game_id))
+        if members is not None:
+            members.pop(consumer, None)
+            if not members:
+                del self.rooms[str(game_id)]
+
+    def local_members(self, game_id):
+        """
+        Return the consumers of a room that can be called directly.
+
+        Returns None when a member runs on another event loop, in which
+        case the room has to be reached through the channel layer.
+        """
+        members = self.rooms.get(str(game_id))
+        if not members:
+            return []
+
+        loop = asyncio.get_running_loop()
+        if any(member_loop is not loop for member_loop in members.values()):
+            return None
+        return list(members)
+
+
+_registry = RoomRegistry()
+
+
+def join_room(game_id, consumer):
+    """Register a connected consumer for direct delivery of room events"""
+    _registry.join(game_id, consumer)
+
+
+def leave_room(game_id, consumer):
+    """Unregister a consumer, e.g. when its socket closes"""
+    _registry.leave(game_id, consumer)
+
+
+def room_has_sockets(game_id):
+    """True while a socket of the room is connected to this process"""
+    return bool(_registry.rooms.get(str(game_id)))
+
+
+def local_rooms():
+    """(game_id, consumers) of every room with a socket in this process"""
+    return [(game_id, list(members)) for game_id, members in _registry.rooms.items()]
+
+
+async def fan_out(consumers, event):
+    """Call the event's handler on every consumer, like the layer would"""
+    for consumer in consumers:
+        try:
+            await getattr(consumer, event['type'])(event)
+        except Exception as e:
+            logger.error(f"Error delivering {event['type']} to a room member: {e}", exc_info=True)
+
+
+def room_is_local(game_id):
+    """True when every socket of the room lives in this process"""
+    router = get_router()
+    if router.enabled:
+        return router.is_local(game_id)
+    return isinstance(get_channel_layer(), InMemoryChannelLayer)
+
+
+def discard_event_log(game_id):
+    """Forget the event log of a room, e.g. after the game was deleted"""
+    _event_logs.pop(str(game_id), None)
+
+
+async def broadcast(game_id, handler, message):
+    """
+    Sequence, encode, record and send an event to everyone in a room
+
+    Args:
+        game_id: ID of the game room
+        handler (str): Consumer handler name, e.g. 'broadcast_move'
+        message (dict): The message every client in the room receives
+    """
+    router = get_router()
+    if router.enabled and not router.is_local(game_id):
+        # the owning worker sequences and delivers it
+        metrics.incr('room_hops.relayed')
+        await router.relay(game_id, handler, message)
+        return
+
+    if not room_is_local(game_id):
+        metrics.incr('room_hops.group_send')
+        event = room_event(handler, message)
+        await get_channel_layer().group_send(room_group_name(game_id), event.encoded())
+        return
+
+    log = get_event_log(game_id)
+    message['seq'] = log.next_seq()
+    if message['type'] in ROSTER_DELTA_TYPES:
+        message['roster_version'] = get_roster(game_id).apply(message)
+    event = room_event(handler, message)
+    log.append(event)
+    get_spectator_hub().on_broadcast(game_id, message)
+
+    members = _registry.local_members(game_id)
+    if members is None:
+        metrics.incr('room_hops.group_send')
+        await get_channel_layer().group_send(room_group_name(game_id), event.encoded())
+    else:
+        metrics.incr('room_hops.local')
+        await fan_out(members, event)
+
+
+def broadcast_sync(game_id, handler, message):
+    """broadcast() for synchronous callers such as REST views"""
+    async_to_sync(broadcast)(game_id, handler, message)
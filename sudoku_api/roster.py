@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Player
+
+"""
+roster.py - Cached player list of each room
+
+Instead of reading the whole player list from the database and
+broadcasting it on every join and leave, each room keeps its roster in
+memory:
+- The roster is loaded from the database once, on first use
+- Joins and leaves are broadcast as 'player_joined' / 'player_left'
+  deltas. broadcast() applies them to the roster and stamps them with the
+  new roster_version
+- A client whose version does not match the delta asks for the full list
+  again (request_player_list with its roster_version), and only then gets
+  a 'player_list_update'
+- Saving an existing player (e.g. a rename in the admin) is broadcast as
+  a 'player_updated' delta once committed, which replaces the player's
+  entry in the roster and in every client's list
+
+Like the event log, the roster is only cached while all of a room's sockets
+live in this process (see rooms.room_is_local).
+"""
+
+logger = logging.getLogger(__name__)
+
+# messages that change the roster of a room
+ROSTER_DELTA_TYPES = {'player_joined', 'player_left', 'player_updated'}
+
+
+def player_data(player):
+    """Roster entry of a player"""
+    return {
+        'id': str(player.id),
+        'name': player.name,
+        'color': player.color,
+        'is_host': player.is_host
+    }
+
+
+class RoomRoster:
+    def __init__(self):
+        self.version = 0
+        # player id -> roster entry, None until loaded from the database
+        self.players = None
+
+    def load(self, players, version):
+        """Cache a list read from the database, unless it changed meanwhile"""
+        if version == self.version:
+            self.players = {player['id']: player for player in players}
+
+    def as_list(self):
+        return sorted(self.players.values(), key=lambda player: player['id'])
+
+    def apply(self, message):
+        """Apply a roster delta and return the new version"""
+        self.version += 1
+        if self.players is not None:
+            if message['type'] in ('player_joined', 'player_updated'):
+                self.players[message['player']['id']] = message['player']
+            else:
+                self.players.pop(message['player_id'], None)
+        return self.version
+
+    def invalidate(self):
+        self.version += 1
+        self.players = None
+
+
+_rosters = OrderedDict()
+
+
+def get_roster(game_id):
+    """Return the roster of a room, creating an empty one if needed"""
+    game_id = str(game_id)
+    roster = _rosters.get(game_id)
+    if roster is None:
+        roster = _rosters[game_id] = RoomRoster()
+        while len(_rosters) > settings.ROOM_EVENT_LOG_MAX_ROOMS:
+            _rosters.popitem(last=False)
+    else:
+        _rosters.move_to_end(game_id)
+    return roster
+
+
+def discard_roster(game_id):
+    """Forget the roster of a room, e.g. after the game was deleted"""
+    _rosters.pop(str(game_id), None)
+
+
+def announce_player_update(game_id, player):
+    """Broadcast a player_updated delta to the room"""
+    # rooms.py applies roster deltas, and imports this module
+    from .rooms import broadcast, broadcast_sync
+
+    message = {'type': 'player_updated', 'player': player}
+    try:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            broadcast_sync(game_id, 'broadcast_player_updated', message)
+        else:
+            loop.create_task(broadcast(game_id, 'broadcast_player_updated', message))
+    except Exception as e:
+        logger.error(f"Error announcing a player update: {e}", exc_info=True)
+        # at least make the next request read the list again
+        roster = _rosters.get(str(game_id))
+        if roster is not None:
+            roster.invalidate()
+
+
+@receiver(post_save, sender=Player)
+def announce_on_player_update(sender, instance, created, **kwargs):
+    # new players are announced with a player_joined delta
+    if not created:
+        game_id, player = instance.game_id, player_data(instance)
+        transaction.on_commit(lambda: announce_player_update(game_id, player))
@@ -2,4 +2,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    re_path(r'ws/game/(?P<game_id>[\w-]+)/$', consumers.SudokuConsumer.as_asgi()),]
+    re_path(r'ws/game/(?P<game_id>[\w-]+)/$', consumers.SudokuConsumer.as_asgi()),
+    re_path(r'ws/game/(?P<game_id>[\w-]+)/spectate/$', consumers.SpectatorConsumer.as_asgi()),
+    re_path(r'ws/lobby/$', consumers.LobbyConsumer.as_asgi()),]
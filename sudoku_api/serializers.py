@@ -1,7 +1,7 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Game, Player, Move
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .rooms import broadcast_sync
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,84 +26,94 @@ class MoveSerializer(serializers.ModelSerializer):
         game_id = validated_data.pop('game_id')
         player_id = validated_data.pop('player_id')
         
-        # get the game and player objects
-        try:
-            game = Game.objects.get(id=game_id)
-            player = Player.objects.get(id=player_id, game=game)
-        except (Game.DoesNotExist, Player.DoesNotExist):
-            raise serializers.ValidationError({'error': 'Game or player not found'})
+        # lock the game row like the WebSocket path, so concurrent moves on
+        # the board are applied one after the other
+        with transaction.atomic():
+            # get the game and player objects
+            try:
+                game = Game.objects.select_for_update().get(id=game_id)
+                player = Player.objects.get(id=player_id, game=game)
+            except (Game.DoesNotExist, Player.DoesNotExist):
+                raise serializers.ValidationError({'error': 'Game or player not found'})
+                
+            # check if the move is valid (cell should be empty in initial board)
+            row = validated_data.get('row')
+            column = validated_data.get('column')
+            value = validated_data.get('value')
             
-        # check if the move is valid (cell should be empty in initial board)
-        row = validated_data.get('row')
-        column = validated_data.get('column')
-        value = validated_data.get('value')
-        
-        if game.initial_board[row][column] != 0:
-            raise serializers.ValidationError({'error': 'Cannot modify initial cell'})
-        
-        # check if a previous correct move exists at this position
-        existing_correct_move = Move.objects.filter(
-            game=game,
-            row=row,
-            column=column,
-            is_correct=True
-        ).exists()
-        
-        if existing_correct_move:
-            raise serializers.ValidationError({'error': 'Cannot modify a correctly solved cell'})
+            if game.initial_board[row][column] != 0:
+                raise serializers.ValidationError({'error': 'Cannot modify initial cell'})
             
-        # check if the move is correct (matches solution)
-        is_correct = (game.solution[row][column] == value)
-        validated_data['is_correct'] = is_correct
-        
-        # create the move
-        move = Move.objects.create(
-            game=game,
-            player=player,
-            **validated_data
-        )
-        
-        # update the game board
-        current_board = game.current_board
-        current_board[row][column] = value
-        game.current_board = current_board
-        game.save()
-        
-        # check if the game is complete after this move
-        is_game_complete = True
-        for r in range(9):
-            for c in range(9):
-                if game.current_board[r][c] != game.solution[r][c]:
-                    is_game_complete = False
+            # check if a previous correct move exists at this position
+            existing_correct_move = Move.objects.filter(
+                game=game,
+                row=row,
+                column=column,
+                is_correct=True
+            ).exists()
+            
+            if existing_correct_move:
+                raise serializers.ValidationError({'error': 'Cannot modify a correctly solved cell'})
+                
+            # check if the move is correct (matches solution)
+            is_correct = (game.solution[row][column] == value)
+            validated_data['is_correct'] = is_correct
+            
+            # create the move
+            move = Move.objects.create(
+                game=game,
+                player=player,
+                **validated_data
+            )
+            
+            # update the game board
+            current_board = game.current_board
+            current_board[row][column] = value
+            game.current_board = current_board
+            game.save(bump_version=True)
+            
+            # check if the game is complete after this move
+            is_game_complete = True
+            for r in range(9):
+                for c in range(9):
+                    if game.current_board[r][c] != game.solution[r][c]:
+                        is_game_complete = False
+                        break
+                if not is_game_complete:
                     break
-            if not is_game_complete:
-                break
-        
-        # if game is complete, mark it
-        if is_game_complete and not game.is_complete:
-            from django.utils import timezone
-            game.is_complete = True
-            game.completed_at = timezone.now()
-            game.completed_by = player
-            game.save()
             
+            # if game is complete, mark it
+            completed_now = is_game_complete and not game.is_complete
+            if completed_now:
+                from django.utils import timezone
+                game.is_complete = True
+                game.completed_at = timezone.now()
+                game.completed_by = player
+                game.save(bump_version=True)
+
+        if completed_now:
             # notify connected clients via WebSocket
-            channel_layer = get_channel_layer()
-            room_group_name = f'game_{game.id}'
             try:
-                async_to_sync(channel_layer.group_send)(
-                    room_group_name,
-                    {
-                        'type': 'broadcast_game_complete',
-                        'player_id': str(player.id)
-                    }
-                )
+                broadcast_sync(game.id, 'broadcast_game_complete', {
+                    'type': 'game_complete',
+                    'player_id': str(player.id)
+                })
             except Exception as e:
                 logger.error(f"WebSocket notification error: {e}", exc_info=True)
         
         return move
 
-class GameSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Lets the caller pick a subset of fields with a fields=[...] argument"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class GameSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     players = PlayerSerializer(many=True, read_only=True)
     moves = MoveSerializer(many=True, read_only=True)
     completed_by = PlayerSerializer(read_only=True)
@@ -112,18 +122,21 @@ class GameSerializer(serializers.ModelSerializer):
         model = Game
         fields = ['id', 'initial_board', 'current_board', 'difficulty', 'created_at', 'last_activity', 'players', 'moves', 'is_complete', 'completed_at', 'completed_by', 'room_name']
 
+class GameSnapshotSerializer(serializers.ModelSerializer):
+    """Boards, roster and version of a game, without its moves"""
+    players = PlayerSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Game
+        fields = ['id', 'version', 'initial_board', 'current_board', 'difficulty', 'players', 'is_complete', 'completed_at', 'completed_by', 'room_name']
+
 class GameInfoSerializer(serializers.ModelSerializer):
     """Serializer for listing available games with minimal information"""
-    player_count = serializers.SerializerMethodField()
     host_name = serializers.SerializerMethodField()
     
     class Meta:
         model = Game
         fields = ['id', 'difficulty', 'created_at', 'player_count', 'host_name', 'is_complete', 'room_name']
     
-    def get_player_count(self, obj):
-        return obj.players.count()
-    
     def get_host_name(self, obj):
-        host = obj.players.filter(is_host=True).first()
-        return host.name if host else "Unknown"
+        return obj.host_name or "Unknown"
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from . import metrics
+from .models import Game
+from .protocol import room_event
+
+"""
+spectators.py - Shared, throttled board snapshots for read-only viewers
+
+Spectators do not get the room's event stream. Instead every room with at
+least one spectator in this process has a single SpectatorRoom:
+- The board is read from the Game row once, when the first spectator of
+  the room connects. The Player table is never touched
+- broadcast() (see rooms.py) hands every room message to the hub, and
+  moves and completions update the shared board in place
+- One task per process wakes up every SPECTATOR_SNAPSHOT_INTERVAL_MS and,
+  for each room whose board changed, encodes one 'spectator_snapshot' and
+  sends the same encoded event to all of the room's spectators
+
+Focus and chat traffic never reaches spectators, and however many moves
+were made during an interval, each spectator gets at most one frame. The
+cost of a tick is one encode per changed room plus one socket write per
+spectator, so 1000 viewers of a room cost about as much as 10.
+
+Rooms whose players live on other workers (see rooms.room_is_local) do not
+pass through this process' broadcast(). Their board is re-read from the
+database on every tick instead, one query per room regardless of the
+number of spectators.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+async def load_board(game_id):
+    """Board state of a game straight from the Game row, or None"""
+    try:
+        return await Game.objects.filter(id=game_id).values(
+            'initial_board', 'current_board', 'is_complete'
+        ).afirst()
+    except ValidationError:
+        return None
+
+
+class SpectatorRoom:
+    """Shared board and last encoded snapshot of one room"""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.spectators = set()
+        # board state, None until loaded from the database
+        self.state = None
+        # room messages that arrived while the board was loading
+        self.pending = []
+        self.version = 0
+        self.event = None
+        self.dirty = True
+
+    def apply(self, message):
+        """Update the board with a room message; returns True if it changed"""
+        if self.state is None:
+            self.pending.append(message)
+            return False
+
+        if message['type'] == 'move':
+            move = message['move']
+            self.state['current_board'][move['row']][move['column']] = move['value']
+        elif message['type'] in ('game_complete', 'game_completed'):
+            self.state['is_complete'] = True
+        else:
+            return False
+        self.dirty = True
+        return True
+
+    def set_state(self, state):
+        """Install a board read from the database and replay what it missed"""
+        self.state = state
+        pending, self.pending = self.pending, []
+        for message in pending:
+            self.apply(message)
+        self.dirty = True
+
+    def snapshot(self):
+        """Return the encoded snapshot, encoding it again only if needed"""
+        if self.dirty or self.event is None:
+            self.version += 1
+            self.event = room_event('spectator_snapshot', {
+                'type': 'spectator_snapshot',
+                'game_id': self.game_id,
+                'version': self.version,
+                'initial_board': self.state['initial_board'],
+                'board': self.state['current_board'],
+                'is_complete': self.state['is_complete'],
+                # as of the last board change, joins alone do not resend
+                'spectators': len(self.spectators)
+            })
+            self.dirty = False
+            metrics.incr('spectator.snapshots_encoded')
+        return self.event
+
+
+class SpectatorHub:
+    def __init__(self, interval):
+        self.interval = interval
+        # game id -> SpectatorRoom
+        self.rooms = {}
+        self.task = None
+        self.loop = None
+
+    def stats(self):
+        return {
+            'rooms': len(self.rooms),
+            'spectators': sum(len(room.spectators) for room in self.rooms.values())
+        }
+
+    async def join(self, game_id, consumer):
+        """
+        Add a spectator to a room and return the room's current snapshot
+
+        Returns None when the game does not exist. The consumer must
+        provide send_event(event).
+        """
+        game_id = str(game_id)
+        room = self.rooms.get(game_id)
+        if room is None:
+            room = self.rooms[game_id] = SpectatorRoom(game_id)
+
+        room.spectators.add(consumer)
+        if room.state is None:
+            state = await load_board(game_id)
+            if state is None:
+                self.leave(game_id, consumer)
+                return None
+            # another spectator may have loaded it meanwhile
+            if room.state is None:
+                room.set_state(state)
+
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.loop is not loop:
+            self.loop = loop
+            self.task = loop.create_task(self.run())
+        return room.snapshot()
+
+    def leave(self, game_id, consumer):
+        room = self.rooms.get(str(game_id))
+        if room is not None:
+            room.spectators.discard(consumer)
+            if not room.spectators:
+                del self.rooms[str(game_id)]
+
+    def on_broadcast(self, game_id, message):
+        """Feed a room message to the room's spectators, if it has any"""
+        room = self.rooms.get(str(game_id))
+        if room is not None:
+            room.apply(message)
+
+    async def run(self):
+        try:
+            while self.rooms:
+                await asyncio.sleep(self.interval)
+                for room in list(self.rooms.values()):
+                    try:
+                        await self.tick(room)
+                    except Exception as e:
+                        logger.error(f"Error sending spectator snapshot: {e}", exc_info=True)
+        except asyncio.CancelledError:
+            pass
+
+    async def tick(self, room):
+        """Send a room's snapshot to its spectators if the board changed"""
+        from .rooms import room_is_local
+
+        if room.state is not None and not room_is_local(room.game_id):
+            # moves are made on another worker, read the board instead
+            state = await load_board(room.game_id)
+            if state is not None and state != room.state:
+                room.set_state(state)
+
+        if not room.dirty or room.state is None:
+            return
+
+        event = room.snapshot()
+        spectators = list(room.spectators)
+        metrics.incr('spectator.frames', len(spectators))
+        for consumer in spectators:
+            try:
+                await consumer.send_event(event)
+            except Exception as e:
+                logger.error(f"Error sending spectator snapshot: {e}", exc_info=True)
+
+
+_hub = None
+
+
+def get_spectator_hub():
+    """Return the spectator hub shared by all connections in this process"""
+    global _hub
+    if _hub is None:
+        _hub = SpectatorHub(settings.SPECTATOR_SNAPSHOT_INTERVAL_MS / 1000)
+        metrics.register_gauge('spectators', _hub.stats)
+    return _hub
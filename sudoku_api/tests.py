@@ -1,3 +1,603 @@
-from django.test import TestCase
+import asyncio
+import io
+import itertools
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .archive import archive_chunk
+from .consumers import INBOUND_OVERFLOW_CLOSE_CODE, SudokuConsumer
+from .expiry import RoomExpiry, get_room_expiry
+from .heartbeat import HEARTBEAT_TIMEOUT_CLOSE_CODE, HeartbeatWheel
+from .lobby import LOBBY_GROUP, LobbyHub
+from .models import ArchivedGame, Game, Move, Player
+from .roster import RoomRoster, player_data
+from .rooms import RoomEventLog, broadcast
+from .utils import generate_sudoku
+
+
+def create_game(players=1, **fields):
+    """A game of the given number of players, the first one hosting"""
+    puzzle = generate_sudoku('easy')
+    game = Game.objects.create(
+        initial_board=puzzle['puzzle'],
+        current_board=puzzle['puzzle'],
+        solution=puzzle['solution'],
+        **fields
+    )
+    for n in range(players):
+        Player.objects.create(game=game, name=f'p{n}', is_host=n == 0, token=f'token-{n}')
+    return game
+
+
+def game_socket(game, query=''):
+    # imported here, the ASGI application sets up routing and middleware
+    from backend.asgi import application
+    return WebsocketCommunicator(application, f'/ws/game/{game.id}/' + (f'?{query}' if query else ''))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class GameListQueryCountTest(TestCase):
+    """The game list must not issue queries per game on the page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        puzzle = generate_sudoku('easy')
+        for index in range(5):
+            game = Game.objects.create(
+                initial_board=puzzle['puzzle'],
+                current_board=puzzle['puzzle'],
+                solution=puzzle['solution'],
+                room_name=f'room-{index}'
+            )
+            players = [
+                Player.objects.create(game=game, name=f'p{n}', is_host=n == 0)
+                for n in range(3)
+            ]
+            Move.objects.bulk_create([
+                Move(game=game, player=players[n % 3], row=n, column=0, value=1)
+                for n in range(4)
+            ])
+        game.completed_by = players[0]
+        game.save()
+
+    def get_list(self, query=''):
+        response = self.client.get(f'/api/games/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_default_list_has_no_moves(self):
+        # page + players
+        with self.assertNumQueries(2):
+            data = self.get_list()
+        self.assertEqual(len(data['results']), 5)
+        self.assertNotIn('moves', data['results'][0])
+        self.assertEqual(len(data['results'][0]['players']), 3)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with self.assertNumQueries(2):
+            self.get_list('?page_size=2')
+        with self.assertNumQueries(2):
+            self.get_list('?page_size=5')
+
+    def test_moves_are_prefetched_when_requested(self):
+        # page + players + moves with their players
+        with self.assertNumQueries(3):
+            data = self.get_list('?fields=players,moves')
+        self.assertEqual(len(data['results'][0]['moves']), 4)
+        self.assertIn('name', data['results'][0]['moves'][0]['player'])
+
+    def test_sparse_fieldset(self):
+        with self.assertNumQueries(1):
+            data = self.get_list('?fields=room_name,is_complete')
+        self.assertEqual(set(data['results'][0]), {'id', 'room_name', 'is_complete'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/games/?fields=solution')
+        self.assertEqual(response.status_code, 400)
+
+
+class JoinableGamesTestCase(TestCase):
+    """Three joinable games of three players each, the last one as cls.game"""
+
+    @classmethod
+    def setUpTestData(cls):
+        puzzle = generate_sudoku('easy')
+        for index in range(3):
+            game = Game.objects.create(
+                initial_board=puzzle['puzzle'],
+                current_board=puzzle['puzzle'],
+                solution=puzzle['solution'],
+                room_name=f'Room-{index}'
+            )
+            for n in range(3):
+                Player.objects.create(game=game, name=f'p{n}', is_host=n == 0, token=f'token-{index}-{n}')
+        cls.game = game
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class SnapshotTest(JoinableGamesTestCase):
+    """The snapshot costs two queries, and one when the client's copy is current"""
+
+    def test_snapshot_and_not_modified(self):
+        # game + players
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/games/{self.game.id}/snapshot/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['players']), 3)
+
+        # the game's version only
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f'/api/games/{self.game.id}/snapshot/',
+                HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_bump(self):
+        stale = Game.objects.get(id=self.game.id)
+        game = Game.objects.get(id=self.game.id)
+
+        game.save()
+        self.assertEqual(Game.objects.get(id=self.game.id).version, stale.version)
+
+        # a board change is a new version, read back without a later query
+        game.current_board = game.solution
+        game.save(bump_version=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(game.version, stale.version + 1)
+
+        # an old copy of the game never writes its counter back
+        stale.save(bump_version=True)
+        self.assertEqual(stale.version, game.version + 1)
+        self.assertEqual(Game.objects.get(id=self.game.id).current_board, stale.current_board)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class AvailableGamesTest(JoinableGamesTestCase):
+    """The lobby list is read from the lobby columns on Game"""
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/games/available/')
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(response.json()[0]['host_name'], 'p0')
+        self.assertEqual(response.json()[0]['player_count'], 3)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class FindPlayerTest(JoinableGamesTestCase):
+    """find_player answers from one query, with or without a token"""
+
+    def test_games_of_a_name(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/games/find_player/', {'username': 'p1'})
+        self.assertEqual(len(response.json()['games']), 3)
+
+    def test_token(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/games/find_player/', {'username': 'p1', 'token': 'token-2-1'})
+        self.assertEqual(response.json()['id'], str(self.game.id))
+        self.assertEqual(response.json()['token'], 'token-2-1')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class FindByRoomNameTest(JoinableGamesTestCase):
+    """Room names are looked up case-insensitively through the Lower index"""
+
+    def test_lower_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/games/find_by_room_name/', {'room_name': 'room-2'})
+        self.assertEqual(response.json()['id'], str(self.game.id))
+        self.assertEqual(len(queries), 1)
+        # matches the expression of game_room_name_lower_idx
+        self.assertIn('LOWER("sudoku_api_game"."room_name")', queries[0]['sql'])
+
+
+class LobbySocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+
+class LobbyHubTest(TestCase):
+    """A tick turns the changed games into one frame of lobby events"""
+
+    def setUp(self):
+        self.first = create_game(players=1, room_name='first')
+        self.second = create_game(players=1, room_name='second')
+
+    async def join(self):
+        """Join a new hub, whose ticks the test then runs by hand"""
+        self.hub = LobbyHub(3600)
+        self.socket = LobbySocket()
+        self.snapshot = json.loads(await self.hub.join(self.socket))
+        for task in self.hub.tasks:
+            task.cancel()
+
+    async def test_subscribed_before_the_snapshot(self):
+        await self.join()
+        channel = await self.hub.subscribed
+        self.assertIn(channel, get_channel_layer().groups[LOBBY_GROUP])
+        self.assertEqual(self.snapshot['type'], 'lobby_snapshot')
+        self.assertEqual({room['room_name'] for room in self.snapshot['rooms']}, {'first', 'second'})
+
+    async def test_batch_of_changes(self):
+        await self.join()
+        third = await sync_to_async(create_game)(players=1, room_name='third')
+        await Game.objects.filter(id=self.first.id).aupdate(difficulty='hard')
+        await Game.objects.filter(id=self.second.id).aupdate(is_complete=True)
+        self.hub.changed = {str(self.first.id), str(self.second.id), str(third.id)}
+        await self.hub.tick()
+
+        [frame] = self.socket.frames
+        self.assertEqual(frame['type'], 'batch')
+        events = {event['type']: event for event in frame['events']}
+        self.assertEqual(events['room_added']['room']['id'], str(third.id))
+        self.assertEqual(events['room_updated']['room']['difficulty'], 'hard')
+        self.assertEqual(events['room_removed']['id'], str(self.second.id))
+        self.assertEqual(set(self.hub.entries), {str(self.first.id), str(third.id)})
+
+    async def test_single_change_and_no_change(self):
+        await self.join()
+        await Game.objects.filter(id=self.first.id).aupdate(room_name='renamed')
+        self.hub.changed = {str(self.first.id), str(self.second.id)}
+        await self.hub.tick()
+        self.assertEqual(self.socket.frames, [{
+            'type': 'room_updated',
+            'room': self.hub.entries[str(self.first.id)]
+        }])
+
+        # a game that changed nothing the lobby shows sends nothing
+        self.hub.changed = {str(self.second.id)}
+        await self.hub.tick()
+        self.assertEqual(len(self.socket.frames), 1)
+
+
+class CleanupInactiveGamesTest(TestCase):
+    """Idle games are deleted in chunks, with their players and moves"""
+
+    def setUp(self):
+        self.idle = []
+        for _ in range(5):
+            game = create_game(players=2)
+            players = list(game.players.all())
+            Move.objects.bulk_create([
+                Move(game=game, player=players[n % 2], row=n, column=0, value=1)
+                for n in range(3)
+            ])
+            self.idle.append(game)
+        # a finished-by player must not keep its game's row alive
+        Game.objects.filter(id=self.idle[0].id).update(completed_by=self.idle[0].players.first())
+        self.recent = create_game(players=2)
+        self.not_idle_long_enough = create_game(players=1)
+        self.complete = create_game(players=1, is_complete=True)
+
+        now = timezone.now()
+        Game.objects.filter(id__in=[game.id for game in self.idle] + [self.complete.id]).update(
+            last_activity=now - timedelta(hours=1, minutes=40)
+        )
+        Game.objects.filter(id=self.not_idle_long_enough.id).update(
+            last_activity=now - timedelta(hours=1, minutes=20)
+        )
+
+    def cleanup(self, *args):
+        out = io.StringIO()
+        call_command('cleanup_inactive_games', '--hours=1', '--minutes=30', *args, stdout=out)
+        return out.getvalue()
+
+    def test_deletes_idle_games_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.cleanup('--chunk-size=2')
+
+        self.assertIn('deleted 5 inactive games (10 players, 15 moves) in 3 chunks', output)
+        remaining = set(Game.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {self.recent.id, self.not_idle_long_enough.id, self.complete.id})
+        self.assertEqual(Player.objects.count(), 4)
+        self.assertFalse(Move.objects.exists())
+        # the players are deleted without loading them, completed_by is
+        # cleared first so no game points at a deleted player
+        self.assertTrue(any(
+            'UPDATE "sudoku_api_game" SET "completed_by_id" = NULL' in query['sql']
+            for query in queries
+        ))
+
+    def test_time_budget(self):
+        # every clock reading is a second later, the budget allows one chunk
+        with mock.patch(
+            'sudoku_api.management.commands.cleanup_inactive_games.time.monotonic',
+            side_effect=itertools.count()
+        ):
+            output = self.cleanup('--chunk-size=2', '--time-budget=1.5')
+
+        self.assertIn('deleted 2 inactive games', output)
+        self.assertIn('Time budget of 1.5s used up', output)
+        self.assertEqual(Game.objects.count(), 6)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ArchiveTest(TestCase):
+    """Archived games leave the hot tables but read the same through the API"""
+
+    def setUp(self):
+        puzzle = generate_sudoku('easy')
+        self.game = Game.objects.create(
+            initial_board=puzzle['puzzle'],
+            current_board=puzzle['solution'],
+            solution=puzzle['solution'],
+            room_name='done',
+            is_complete=True,
+            completed_at=timezone.now()
+        )
+        players = [
+            Player.objects.create(game=self.game, name=f'p{n}', is_host=n == 0)
+            for n in range(2)
+        ]
+        for n in range(3):
+            Move.objects.create(game=self.game, player=players[n % 2], row=n, column=1, value=n + 1)
+        self.game.completed_by = players[1]
+        self.game.save()
+
+    def test_archived_game_reads_the_same(self):
+        before = self.client.get(f'/api/games/{self.game.id}/').json()
+        snapshot = self.client.get(f'/api/games/{self.game.id}/snapshot/')
+
+        # not old enough yet
+        self.assertEqual(archive_chunk(timezone.now() - timedelta(days=1), 10), {})
+        archived = archive_chunk(timezone.now() + timedelta(seconds=1), 10)
+        self.assertEqual(archived, {'games': 1, 'players': 2, 'moves': 3})
+        self.assertFalse(Game.objects.exists())
+        self.assertFalse(Move.objects.exists())
+        self.assertEqual(ArchivedGame.objects.get().move_count, 3)
+
+        with self.assertNumQueries(2):
+            after = self.client.get(f'/api/games/{self.game.id}/').json()
+        self.assertTrue(after.pop('archived'))
+        after.pop('archived_at')
+        after.pop('version')
+        before['players'].sort(key=lambda player: player['id'])
+        self.assertEqual(after, before)
+
+        response = self.client.get(f'/api/games/{self.game.id}/snapshot/', HTTP_IF_NONE_MATCH=snapshot['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+
+class SocketTestCase(TransactionTestCase):
+    """Tests that connect to game rooms; the sockets' threads read committed rows"""
+
+    def tearDown(self):
+        # rooms left by the test would expire on a loop that is gone
+        expiry = get_room_expiry()
+        for timer in expiry.timers.values():
+            timer.cancel()
+        expiry.timers.clear()
+
+    async def receive_all(self, socket):
+        """Every message received until the socket goes quiet"""
+        messages = []
+        while not await socket.receive_nothing(0.2):
+            messages.append(json.loads(await socket.receive_from()))
+        return messages
+
+    async def receive_until(self, socket, message_type):
+        """Messages received up to and including the first of a type"""
+        messages = []
+        while not messages or messages[-1]['type'] != message_type:
+            messages.append(json.loads(await socket.receive_from()))
+        return messages
+
+
+class RoomExpiryTest(SocketTestCase):
+    """Abandoned rooms expire on a timer armed by the last socket leaving"""
+
+    async def test_timer_follows_the_last_socket(self):
+        game = await sync_to_async(create_game)()
+        timers = get_room_expiry().timers
+        first, second = game_socket(game), game_socket(game)
+        self.assertTrue((await first.connect())[0])
+        self.assertTrue((await second.connect())[0])
+
+        await first.disconnect()
+        self.assertNotIn(str(game.id), timers)
+
+        await second.disconnect()
+        self.assertIn(str(game.id), timers)
+
+        # coming back cancels it
+        third = game_socket(game)
+        await third.connect()
+        self.assertNotIn(str(game.id), timers)
+        await third.disconnect()
+
+    async def test_expire_only_deletes_idle_games(self):
+        idle, busy, complete = [await sync_to_async(create_game)(players=2) for _ in range(3)]
+        await Game.objects.filter(id=complete.id).aupdate(is_complete=True)
+        await Game.objects.filter(id__in=[idle.id, complete.id]).aupdate(
+            last_activity=timezone.now() - timedelta(hours=2)
+        )
+
+        expiry = RoomExpiry(3600)
+        for game in (idle, busy, complete):
+            await expiry.expire(str(game.id))
+
+        self.assertEqual(expiry.expired, 1)
+        remaining = {game.id async for game in Game.objects.all()}
+        self.assertEqual(remaining, {busy.id, complete.id})
+        self.assertEqual(await Player.objects.filter(game_id=idle.id).acount(), 0)
+
+
+class ResumeTest(SocketTestCase):
+    """A reconnecting client gets the events it missed, or a snapshot"""
+
+    def test_event_log(self):
+        log = RoomEventLog(3)
+        for _ in range(5):
+            log.append(f'event {log.next_seq()}')
+
+        self.assertEqual(log.since(log.epoch, 3), ['event 4', 'event 5'])
+        self.assertEqual(log.since(log.epoch, 5), [])
+        # evicted, from another epoch, or from the future
+        self.assertIsNone(log.since(log.epoch, 1))
+        self.assertIsNone(log.since('other', 3))
+        self.assertIsNone(log.since(log.epoch, 6))
+
+    async def test_resume(self):
+        game = await sync_to_async(create_game)()
+        first = game_socket(game)
+        await first.connect()
+        sync = (await self.receive_until(first, 'sync'))[-1]
+
+        for message in ('one', 'two'):
+            await broadcast(game.id, 'broadcast_quick_chat', {'type': 'quick_chat', 'message': message})
+
+        # missed events are replayed in order, then the new position
+        second = game_socket(game, f"epoch={sync['epoch']}&last_seq={sync['seq']}")
+        await second.connect()
+        messages = await self.receive_until(second, 'sync')
+        self.assertEqual([message.get('message') for message in messages[:-1]], ['one', 'two'])
+        self.assertEqual(messages[-1]['seq'], sync['seq'] + 2)
+
+        # a log from another epoch cannot be replayed
+        third = game_socket(game, f"epoch=stale&last_seq={sync['seq']}")
+        await third.connect()
+        messages = await self.receive_until(third, 'sync')
+        self.assertEqual([message['type'] for message in messages], ['snapshot', 'sync'])
+        self.assertEqual(messages[0]['game']['id'], str(game.id))
+
+        for socket in (first, second, third):
+            await socket.disconnect()
+
+
+class HeartbeatConnection:
+    def __init__(self, last_seen):
+        self.last_seen = last_seen
+        self.events = []
+        self.close_code = None
+
+    async def send_event(self, event):
+        self.events.append(json.loads(event['text']))
+
+    async def close(self, code):
+        self.close_code = code
+
+
+class HeartbeatWheelTest(SimpleTestCase):
+    """Silent connections are closed, the others pinged once per interval"""
+
+    async def test_timeout_closes_with_4001(self):
+        wheel = HeartbeatWheel(0.1, 2, 1)
+        now = asyncio.get_running_loop().time()
+        silent, alive = HeartbeatConnection(now - 2), HeartbeatConnection(now)
+        wheel.register(silent)
+        wheel.register(alive)
+
+        await asyncio.sleep(0.25)
+        self.assertEqual(silent.close_code, HEARTBEAT_TIMEOUT_CLOSE_CODE)
+        self.assertEqual(silent.events, [])
+        self.assertIsNone(alive.close_code)
+        self.assertEqual(alive.events[0]['type'], 'heartbeat')
+        self.assertEqual(len(wheel), 1)
+
+        wheel.unregister(alive)
+        await wheel.task
+        self.assertTrue(wheel.task.done())
+
+
+class InboundLimitTest(SocketTestCase):
+    """Clients that send too much are throttled, and cut off when they flood"""
+
+    async def send_chats(self, socket, player_id, count):
+        for n in range(count):
+            await socket.send_json_to({'type': 'quick_chat', 'player_id': player_id, 'message': f'chat {n}'})
+
+    @override_settings(WS_RATE_LIMITS={'quick_chat': (1, 2)})
+    async def test_token_bucket(self):
+        game = await sync_to_async(create_game)()
+        player = await Player.objects.aget(game=game)
+        socket = game_socket(game)
+        await socket.connect()
+        await self.receive_until(socket, 'sync')
+
+        await self.send_chats(socket, str(player.id), 5)
+        messages = await self.receive_all(socket)
+        self.assertEqual([message['message'] for message in messages if message['type'] == 'quick_chat'],
+                         ['chat 0', 'chat 1'])
+        # told once, not once per dropped message
+        self.assertEqual([message['message'] for message in messages if message['type'] == 'error'],
+                         ['Too many quick_chat messages, slow down'])
+        await socket.disconnect()
+
+    @override_settings(WS_INBOUND_QUEUE_SIZE=1)
+    async def test_queue_overflow_closes_with_4029(self):
+        game = await sync_to_async(create_game)()
+        socket = game_socket(game)
+        await socket.connect()
+        await self.receive_until(socket, 'sync')
+
+        async def slow_chat(consumer, data):
+            await asyncio.sleep(1)
+
+        with mock.patch.object(SudokuConsumer, 'handle_quick_chat', slow_chat):
+            await self.send_chats(socket, 'player', 3)
+            output = await socket.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': INBOUND_OVERFLOW_CLOSE_CODE})
+        await socket.disconnect()
+
+
+class RosterTest(SocketTestCase):
+    """Roster deltas are numbered, and clients behind the number get the full list"""
+
+    def test_list_read_before_a_delta_is_not_cached(self):
+        roster = RoomRoster()
+        version = roster.version
+        roster.apply({'type': 'player_left', 'player_id': 'gone'})
+        roster.load([{'id': 'gone'}], version)
+        self.assertIsNone(roster.players)
+
+        roster.load([{'id': 'a'}], roster.version)
+        roster.apply({'type': 'player_joined', 'player': {'id': 'b'}})
+        self.assertEqual(roster.as_list(), [{'id': 'a'}, {'id': 'b'}])
+        self.assertEqual(roster.version, 2)
+
+    async def test_deltas_follow_the_roster_version(self):
+        game = await sync_to_async(create_game)()
+        socket = game_socket(game)
+        await socket.connect()
+        [roster, _] = await self.receive_until(socket, 'sync')
+        version = roster['roster_version']
+
+        player = await Player.objects.acreate(game=game, name='late')
+        await broadcast(game.id, 'broadcast_player_joined', {
+            'type': 'player_joined',
+            'player': player_data(player)
+        })
+        joined = json.loads(await socket.receive_from())
+        self.assertEqual((joined['type'], joined['roster_version']), ('player_joined', version + 1))
+
+        # a rename is the next delta, once committed
+        player.name = 'renamed'
+        await player.asave()
+        updated = json.loads(await socket.receive_from())
+        self.assertEqual((updated['type'], updated['roster_version']), ('player_updated', version + 2))
+        self.assertEqual(updated['player']['name'], 'renamed')
+
+        # up to date clients get nothing, the others the full list
+        await socket.send_json_to({'type': 'request_player_list', 'roster_version': version + 2})
+        self.assertTrue(await socket.receive_nothing(0.2))
+        await socket.send_json_to({'type': 'request_player_list', 'roster_version': version + 1})
+        full = json.loads(await socket.receive_from())
+        self.assertEqual(full['roster_version'], version + 2)
+        self.assertEqual(sorted(player['name'] for player in full['players']), ['p0', 'renamed'])
+        await socket.disconnect()
@@ -9,4 +9,5 @@ router.register(r'moves', views.MoveViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('games/available/', views.AvailableGamesView.as_view(), name='available-games'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,17 +1,28 @@
 from django.shortcuts import get_object_or_404
-from django.db.models import Count
-from rest_framework import viewsets, status, generics
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.db.models.functions import Lower
+from rest_framework import viewsets, status, generics, serializers
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.conf import settings
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.utils.http import parse_etags, quote_etag
 import json
+import logging
 import secrets  
 
-from .models import Game, Player, Move
-from .serializers import GameSerializer, PlayerSerializer, MoveSerializer, GameInfoSerializer
+from . import metrics
+from .archive import unpack_game
+from .models import ArchivedGame, Game, Player, Move
+from .pagination import GameCursorPagination, MoveCursorPagination
+from .room_names import get_room_name_cache
+from .rooms import broadcast_sync
+from .roster import player_data
+from .serializers import (
+    GameSerializer, PlayerSerializer, MoveSerializer, GameInfoSerializer, GameSnapshotSerializer
+)
 from .utils import generate_sudoku, generate_qr_code
 
 """
@@ -19,8 +30,16 @@ views.py - REST API endpoints for multiplayer Sudoku game
 
 This file contains ViewSets that handle HTTP requests for game management.
 Key features:
-- GameViewSet: Handles game creation, joining, QR code generation for sharing
-- MoveViewSet: Manages move validation and persistence
+- GameViewSet: Handles game creation, joining, QR code generation for sharing.
+  The game list is cursor-paginated and takes a ?fields= sparse fieldset;
+  nested moves are only listed when asked for
+- snapshot(): Boards and roster without the move history, with an ETag so
+  clients re-polling an unchanged game get an empty 304
+- Games moved to the archive (see archive.py) are still served by
+  retrieve() and snapshot(), read-only and marked 'archived'
+- MoveViewSet: Manages move validation and persistence, and lists the move
+  history with cursor pagination, filtered by ?game= and ?player=. ?since=
+  takes a move id and returns only the moves made after it
 - WebSocket notifications are sent when players join via REST API
 
 The available() endpoint lets users discover joinable games, while the
@@ -32,6 +51,62 @@ QR code generation enables easy game sharing across devices.
 class GameViewSet(viewsets.ModelViewSet):
     queryset = Game.objects.all()
     serializer_class = GameSerializer
+    pagination_class = GameCursorPagination
+
+    # fields of the game list when ?fields= is not given
+    LIST_FIELDS = [name for name in GameSerializer.Meta.fields if name != 'moves']
+
+    def get_list_fields(self):
+        """Fields requested with ?fields=a,b,c, or the default list fields"""
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return self.LIST_FIELDS
+
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = set(fields) - set(GameSerializer.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({'error': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        # the cursor needs created_at, the id is always included
+        return list(dict.fromkeys(['id', *fields]))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        # one query per requested relation, however many games are on the page
+        fields = self.get_list_fields()
+        columns = [
+            name for name in fields
+            if name not in ('players', 'moves')
+        ]
+        queryset = queryset.only('created_at', *columns)
+        if 'completed_by' in fields:
+            queryset = queryset.select_related('completed_by')
+        if 'players' in fields:
+            queryset = queryset.prefetch_related(Prefetch('players', queryset=Player.objects.order_by('id')))
+        if 'moves' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'moves',
+                queryset=Move.objects.select_related('player').order_by('timestamp', 'id')
+            ))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            kwargs['fields'] = self.get_list_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def get_archived(self, pk):
+        """Unpacked archived game, or 404"""
+        return unpack_game(generics.get_object_or_404(ArchivedGame, pk=pk))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # completed games end up in the archive
+            return Response(self.get_archived(kwargs['pk']))
     
     def create(self, request):
         # get difficulty from request data or default to medium
@@ -41,15 +116,6 @@ class GameViewSet(viewsets.ModelViewSet):
         # generate new Sudoku puzzle
         sudoku_data = generate_sudoku(difficulty)
         
-        # create a new game
-        game = Game.objects.create(
-            initial_board=sudoku_data['puzzle'],
-            current_board=sudoku_data['puzzle'],
-            solution=sudoku_data['solution'],
-            difficulty=difficulty,
-            room_name=room_name
-        )
-        
         # create the host player
         player_name = request.data.get('player_name', 'Host')
         player_color = request.data.get('player_color', '#3498db')
@@ -57,13 +123,24 @@ class GameViewSet(viewsets.ModelViewSet):
         # Generate token for authentication
         token = secrets.token_hex(32)
         
-        player = Player.objects.create(
-            game=game,
-            name=player_name,
-            color=player_color,
-            is_host=True,
-            token=token
-        )
+        # the game only shows up in the lobby together with its host
+        with transaction.atomic():
+            # create a new game
+            game = Game.objects.create(
+                initial_board=sudoku_data['puzzle'],
+                current_board=sudoku_data['puzzle'],
+                solution=sudoku_data['solution'],
+                difficulty=difficulty,
+                room_name=room_name
+            )
+
+            player = Player.objects.create(
+                game=game,
+                name=player_name,
+                color=player_color,
+                is_host=True,
+                token=token
+            )
         
         # return game data with player info
         serializer = self.get_serializer(game)
@@ -109,25 +186,61 @@ class GameViewSet(viewsets.ModelViewSet):
         # Generate token untuk pemain baru
         token = secrets.token_hex(32)
         
-        # Buat pemain baru
-        player = Player.objects.create(
-            game=game,
-            name=player_name,
-            color=player_color,
-            is_host=False,
-            token=token
-        )
+        # Buat pemain baru, player_count game ikut diperbarui dalam transaksi yang sama
+        with transaction.atomic():
+            player = Player.objects.create(
+                game=game,
+                name=player_name,
+                color=player_color,
+                is_host=False,
+                token=token
+            )
         
         serializer = GameSerializer(game)
         response_data = serializer.data
         response_data['player_id'] = str(player.id)
         response_data['token'] = token  # Sertakan token dalam response
 
-        # send the complete player list
-        self.notify_player_list_update(game.id)
+        # tell the room about the new player
+        self.notify_player_joined(player)
         
         return Response(response_data)
     
+    @action(detail=True, methods=['get'])
+    def snapshot(self, request, pk=None):
+        """
+        Current boards, roster and version of a game, without its moves
+
+        The ETag is the game's version. A request whose If-None-Match
+        matches it gets a 304 after a single query on the game row.
+        """
+        fields = [name for name in GameSnapshotSerializer.Meta.fields if name != 'players']
+        archived = None
+        try:
+            game = generics.get_object_or_404(Game.objects.only(*fields), pk=pk)
+            etag = quote_etag(str(game.version))
+        except Http404:
+            # an archived game never changes, its last version stays the ETag
+            archived = self.get_archived(pk)
+            etag = quote_etag(str(archived['version']))
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif archived is not None:
+            data = {name: archived[name] for name in GameSnapshotSerializer.Meta.fields}
+            data['completed_by'] = archived['completed_by']['id'] if archived['completed_by'] else None
+            data['archived'] = True
+            response = Response(data)
+        else:
+            prefetch_related_objects([game], 'players')
+            response = Response(GameSnapshotSerializer(game).data)
+
+        response['ETag'] = etag
+        # always revalidate, the game may change at any moment
+        response['Cache-Control'] = 'no-cache'
+        return response
+
     @action(detail=True, methods=['get'])
     def qr_code(self, request, pk=None):
         game = self.get_object()
@@ -148,22 +261,19 @@ class GameViewSet(viewsets.ModelViewSet):
         """
         Returns a list of available games that can be joined
         """
-        #  gunakan filter is_complete=False untuk memastikan hanya menampilkan game aktif
-        available_games = Game.objects.annotate(
-            player_count=Count('players')
-        ).filter(player_count__lte=10, is_active=True, is_complete=False)
+        # one query on the lobby index, the roster columns live on the game
+        available_games = Game.objects.joinable().only(
+            'id', 'host_name', 'difficulty', 'player_count', 'created_at', 'is_complete', 'room_name'
+        )
         
         # format the response
         games_data = []
         for game in available_games:
-            host = game.players.filter(is_host=True).first()
-            host_name = host.name if host else "Unknown"
-            
             games_data.append({
                 'id': game.id,
-                'host_name': host_name,
+                'host_name': game.host_name or "Unknown",
                 'difficulty': game.difficulty,
-                'player_count': game.players.count(),
+                'player_count': game.player_count,
                 'created_at': game.created_at,
                 'is_complete': game.is_complete,
                 'room_name': game.room_name  # tambahkan room_name ke response
@@ -171,32 +281,14 @@ class GameViewSet(viewsets.ModelViewSet):
             
         return Response(games_data)
 
-    def notify_player_list_update(self, game_id):
-        """Send WebSocket notification with complete player list"""
+    def notify_player_joined(self, player):
+        """Send WebSocket notification that a player joined the game"""
         try:
-            channel_layer = get_channel_layer()
-            room_group_name = f'game_{game_id}'
-            
-            # get all players for this game
-            all_players = Player.objects.filter(game_id=game_id)
-            players_data = [
-                {
-                    'id': str(p.id),
-                    'name': p.name,
-                    'color': p.color,
-                    'is_host': p.is_host
-                }
-                for p in all_players
-            ]
-            
-            # send only one message with the complete player list
-            async_to_sync(channel_layer.group_send)(
-                room_group_name,
-                {
-                    'type': 'broadcast_player_list',
-                    'players': players_data
-                }
-            )
+            # only the new player is sent, clients add it to their roster
+            broadcast_sync(player.game_id, 'broadcast_player_joined', {
+                'type': 'player_joined',
+                'player': player_data(player)
+            })
             
         except Exception as e:
             # more detailed error logging
@@ -221,67 +313,69 @@ class GameViewSet(viewsets.ModelViewSet):
         try:
             # validate player exists
             player = get_object_or_404(Player, id=player_id, game=game)
-            
-            # check if cell is already filled correctly
-            if game.current_board[row][column] == game.solution[row][column]:
-                return Response({
-                    'error': 'Cell already has correct value'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # check if cell is part of initial board
-            if game.initial_board[row][column] != 0:
-                return Response({
-                    'error': 'Cannot get hint for initial cell'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # get correct value from solution
-            correct_value = game.solution[row][column]
-            
-            # create move record with this hint (marked as correct)
-            move = Move.objects.create(
-                game=game,
-                player=player,
-                row=row,
-                column=column,
-                value=correct_value,
-                is_correct=True
-            )
-            
-            # update current board
-            current_board = game.current_board
-            current_board[row][column] = correct_value
-            game.current_board = current_board
-            game.save()
-            
-            # check if the game is complete after this move
-            is_game_complete = True
-            for r in range(9):
-                for c in range(9):
-                    if game.current_board[r][c] != game.solution[r][c]:
-                        is_game_complete = False
+
+            # lock the game row like the WebSocket path, so concurrent moves
+            # on the board are applied one after the other
+            with transaction.atomic():
+                game = Game.objects.select_for_update().get(pk=game.pk)
+
+                # check if cell is already filled correctly
+                if game.current_board[row][column] == game.solution[row][column]:
+                    return Response({
+                        'error': 'Cell already has correct value'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                # check if cell is part of initial board
+                if game.initial_board[row][column] != 0:
+                    return Response({
+                        'error': 'Cannot get hint for initial cell'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                # get correct value from solution
+                correct_value = game.solution[row][column]
+                
+                # create move record with this hint (marked as correct)
+                move = Move.objects.create(
+                    game=game,
+                    player=player,
+                    row=row,
+                    column=column,
+                    value=correct_value,
+                    is_correct=True
+                )
+                
+                # update current board
+                current_board = game.current_board
+                current_board[row][column] = correct_value
+                game.current_board = current_board
+                game.save(bump_version=True)
+                
+                # check if the game is complete after this move
+                is_game_complete = True
+                for r in range(9):
+                    for c in range(9):
+                        if game.current_board[r][c] != game.solution[r][c]:
+                            is_game_complete = False
+                            break
+                    if not is_game_complete:
                         break
-                if not is_game_complete:
-                    break
-            
-            # if game is complete, mark it
-            if is_game_complete and not game.is_complete:
-                from django.utils import timezone
-                game.is_complete = True
-                game.completed_at = timezone.now()
-                game.completed_by = player
-                game.save()
                 
+                # if game is complete, mark it
+                completed_now = is_game_complete and not game.is_complete
+                if completed_now:
+                    from django.utils import timezone
+                    game.is_complete = True
+                    game.completed_at = timezone.now()
+                    game.completed_by = player
+                    game.save(bump_version=True)
+
+            if completed_now:
                 # notify connected clients via WebSocket
-                channel_layer = get_channel_layer()
-                room_group_name = f'game_{game.id}'
                 try:
-                    async_to_sync(channel_layer.group_send)(
-                        room_group_name,
-                        {
-                            'type': 'broadcast_game_complete',
-                            'player_id': str(player.id)
-                        }
-                    )
+                    broadcast_sync(game.id, 'broadcast_game_complete', {
+                        'type': 'game_complete',
+                        'player_id': str(player.id)
+                    })
                 except Exception as e:
                     logger = logging.getLogger(__name__)
                     logger.error(f"WebSocket notification error: {e}", exc_info=True)
@@ -304,15 +398,10 @@ class GameViewSet(viewsets.ModelViewSet):
             }
             
             # notify all players of the move
-            channel_layer = get_channel_layer()
-            room_group_name = f'game_{game.id}'
-            async_to_sync(channel_layer.group_send)(
-                room_group_name,
-                {
-                    'type': 'broadcast_move',
-                    'move': move_data
-                }
-            )
+            broadcast_sync(game.id, 'broadcast_move', {
+                'type': 'move',
+                'move': move_data
+            })
             
             return Response({
                 'value': correct_value,
@@ -344,22 +433,31 @@ class GameViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        # cari game dengan room name yang sesuai dan masih aktif 
-        games = Game.objects.filter(
-            room_name__iexact=room_name,  # case insensitive search 
+        cache = get_room_name_cache()
+        if cache.enabled:
+            cached = cache.get(room_name)
+            if cached is not None:
+                return Response(cached)
+
+        # cari game dengan room name yang sesuai dan masih aktif, lewat index
+        # Lower(room_name); gunakan game terbaru jika ada beberapa dengan nama yang sama
+        game = Game.objects.annotate(
+            room_name_lower=Lower('room_name')
+        ).filter(
+            room_name_lower=room_name.lower(),  # case insensitive search
             is_active=True,
             is_complete=False
-        ).order_by('-created_at')
+        ).only(*GameInfoSerializer.Meta.fields).order_by('-created_at').first()
         
-        if not games.exists():
+        if game is None:
             return Response(
                 {'error': f'No active games found with room name "{room_name}"'},
                 status=status.HTTP_404_NOT_FOUND
             )
             
-        # gunakan game terbaru jika ada beberapa dengan nama yang sama
-        game = games.first()
         serializer = GameInfoSerializer(game)
+        if cache.enabled:
+            cache.put(room_name, game.id, serializer.data)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -376,20 +474,18 @@ class GameViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        # cari player dengan username ini (bisa ada beberapa di game berbeda)
+        # cari player dengan username ini (bisa ada beberapa di game berbeda).
+        # host_name dan player_count disimpan di game, jadi cukup satu query
         players = Player.objects.filter(
             name=username,
             game__is_active=True,
             game__is_complete=False
-        ).select_related('game').order_by('-game__created_at')
-        
-        if not players.exists():
-            return Response(
-                {'error': f'No active games found with username "{username}"'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        ).select_related('game').only(
+            'id', 'name', 'token', 'game__id', 'game__difficulty', 'game__created_at',
+            'game__player_count', 'game__host_name', 'game__is_complete', 'game__room_name'
+        ).order_by('-game__created_at')
             
-        # jika token disediakan, coba verifikasi terlebih dahulu
+        # jika token disediakan, coba verifikasi terlebih dahulu (lookup lewat index token)
         if token:
             matching_player = players.filter(token=token).first()
             if matching_player:
@@ -407,19 +503,50 @@ class GameViewSet(viewsets.ModelViewSet):
         for player in players:
             games_data.append({
                 'id': player.game.id,
-                'host_name': player.game.players.filter(is_host=True).first().name if player.game.players.filter(is_host=True).exists() else "Unknown",
+                'host_name': player.game.host_name or "Unknown",
                 'difficulty': player.game.difficulty,
-                'player_count': player.game.players.count(),
+                'player_count': player.game.player_count,
                 'created_at': player.game.created_at,
                 'player_name': player.name
             })
+
+        if not games_data:
+            return Response(
+                {'error': f'No active games found with username "{username}"'},
+                status=status.HTTP_404_NOT_FOUND
+            )
             
         return Response({'games': games_data})
 
 
 class MoveViewSet(viewsets.ModelViewSet):
-    queryset = Move.objects.all()
+    queryset = Move.objects.select_related('player')
     serializer_class = MoveSerializer
+    pagination_class = MoveCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        try:
+            if params.get('game'):
+                queryset = queryset.filter(game_id=params['game'])
+            if params.get('player'):
+                queryset = queryset.filter(player_id=params['player'])
+            if params.get('since'):
+                last = Move.objects.filter(id=params['since']).values('timestamp', 'id').first()
+                if last is None:
+                    raise serializers.ValidationError({'error': f"Move {params['since']} not found"})
+                # moves after the given one, in (timestamp, id) order
+                queryset = queryset.filter(
+                    Q(timestamp__gt=last['timestamp']) |
+                    Q(timestamp=last['timestamp'], id__gt=last['id'])
+                )
+        except (ValueError, ValidationError):
+            raise serializers.ValidationError({'error': 'Invalid game, player or since parameter'})
+        return queryset
     
     # using serializer level validation and creation method
     def create(self, request):
@@ -430,10 +557,23 @@ class MoveViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+@api_view(['GET'])
+def metrics_view(request):
+    """
+    Runtime metrics of this worker process (executor queues, counters)
+    """
+    if not (settings.DEBUG or request.user.is_staff):
+        return Response(
+            {'error': 'Metrics are only available to staff users'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return Response(metrics.collect())
+
+
 class AvailableGamesView(generics.ListAPIView):
     """List all available games that players can join"""
     serializer_class = GameInfoSerializer
     
     def get_queryset(self):
-        # filter games that are still active and not completed
-        return Game.objects.filter(is_active=True, is_complete=False)
+        # games that are still active, not completed and not full
+        return Game.objects.joinable()